@@ -0,0 +1,203 @@
+"""Accepts pending entries without interaction when the choice is clear.
+
+The pending entries are visited in order, and the first candidate for an entry
+is accepted if either:
+
+- it is the unique match of the pending transaction with other journal or
+  pending transactions, and contains no unknown accounts; or
+
+- each of its unknown accounts was replaced by the account predicted by the
+  classifier with an estimated probability of at least the specified
+  confidence, and the pending transaction matched at most one other
+  transaction.
+
+In either case, a match is only accepted if it is exact, as determined by
+`is_exact_match`, unless fuzzy matches are explicitly allowed: matches within
+`fuzzy_match_days` and `fuzzy_match_amount` are left for review.
+
+All other entries are left for interactive review.  The journal files are
+written once, after all candidates have been accepted.
+
+This mode is enabled by the `--auto_reconcile` option of `webserver.main`, or
+by calling `main` in place of `webserver.main`.
+"""
+
+from typing import List, NamedTuple, Optional
+
+from beancount.core.data import Transaction
+
+from . import phase_timing
+from . import reconcile
+from .matching import PostingDatabase, are_accounts_mergeable, is_unknown_account
+from .posting_date import get_posting_date
+
+AutoReconcileResult = NamedTuple('AutoReconcileResult', [
+    ('num_accepted', int),
+    ('num_remaining', int),
+    ('modified_filenames', List[str]),
+])
+
+
+def is_exact_match(posting_db: PostingDatabase, transaction: Transaction,
+                   matched_transactions: List[Transaction]) -> bool:
+    """Returns `True` if `transaction` matches each of `matched_transactions`
+    exactly.
+
+    The pairs of matchable postings of `transaction` and of a matched
+    transaction that may have been matched by fuzzy matching are those with
+    mergeable accounts, dates within `fuzzy_match_days` and weights, or negated
+    weights, within `fuzzy_match_amount`.  Each such pair must have equal dates
+    and equal or negated weights, and each matched transaction must have at
+    least one such pair.  Since the matched postings are not known, a match may
+    be rejected due to an unrelated pair of postings with similar weights, but
+    a fuzzy match is never accepted.
+    """
+    fuzzy_match_days = posting_db.fuzzy_match_days
+    fuzzy_match_amount = posting_db.fuzzy_match_amount
+    postings = [(get_posting_date(transaction, mp.posting), mp)
+                for mp in posting_db.get_matchable_postings(transaction)]
+    for matched_transaction in matched_transactions:
+        has_exact_pair = False
+        for mp in posting_db.get_matchable_postings(matched_transaction):
+            date = get_posting_date(matched_transaction, mp.posting)
+            weight = mp.weight
+            for other_date, other_mp in postings:
+                other_weight = other_mp.weight
+                if (other_weight.currency != weight.currency or
+                        not are_accounts_mergeable(mp.posting.account,
+                                                   other_mp.posting.account)):
+                    continue
+                if abs((other_date - date).days) > fuzzy_match_days:
+                    continue
+                if (abs(other_weight.number - weight.number) >
+                        fuzzy_match_amount and
+                        abs(other_weight.number + weight.number) >
+                        fuzzy_match_amount):
+                    continue
+                if other_date != date or abs(other_weight.number) != abs(
+                        weight.number):
+                    return False
+                has_exact_pair = True
+        if not has_exact_pair:
+            return False
+    return True
+
+
+def get_confident_candidate(loaded_reconciler: reconcile.LoadedReconciler,
+                            candidates: reconcile.Candidates,
+                            min_confidence: Optional[float],
+                            allow_fuzzy_matches: bool = False
+                            ) -> Optional[reconcile.Candidate]:
+    """Returns the candidate to accept automatically, or `None` if the pending
+    entry is left for review.
+
+    :param min_confidence: The minimum probability of each predicted account.
+        If `None`, candidates with unknown accounts are never accepted.
+    :param allow_fuzzy_matches: If `True`, matches that are not exact are also
+        accepted.
+    """
+    candidate = candidates.candidates[0]
+    transaction = candidate.unsubstituted_transaction
+    if transaction is None:
+        # Not a single pending transaction.
+        return None
+    # The last candidate is always the unmatched pending transaction.
+    num_matches = len(candidates.candidates) - 1
+    if num_matches > 1:
+        return None
+    # The pending transaction is the first of the used transactions.
+    pending_transaction = candidate.used_transactions[0]
+    matched_transactions = candidate.used_transactions[1:]
+    if (matched_transactions and not allow_fuzzy_matches and
+            not is_exact_match(loaded_reconciler.posting_db,
+                               pending_transaction, matched_transactions)):
+        return None
+    substituted_accounts = candidate.substituted_accounts or []
+    if not substituted_accounts:
+        return candidate if num_matches == 1 else None
+    if min_confidence is None:
+        return None
+    predictions = loaded_reconciler.get_unknown_account_prediction_confidences(
+        transaction)
+    for substitution, (predicted_account, confidence) in zip(
+            substituted_accounts, predictions):
+        if (is_unknown_account(predicted_account) or
+                substitution.account_name != predicted_account or
+                confidence < min_confidence):
+            return None
+    return candidate
+
+
+def auto_reconcile(loaded_reconciler: reconcile.LoadedReconciler,
+                   min_confidence: Optional[float] = None,
+                   allow_fuzzy_matches: bool = False
+                   ) -> AutoReconcileResult:
+    """Accepts the candidates chosen by `get_confident_candidate` for all
+    pending entries."""
+    loaded_reconciler.publish_prepared_sources(wait=True)
+    loaded_reconciler.set_filter('')
+    editor = loaded_reconciler.editor
+    editor.defer_writes()
+    num_accepted = 0
+    index = 0
+    try:
+        while index < len(loaded_reconciler.pending_data):
+            candidates = loaded_reconciler.get_candidates(index)
+            candidate = get_confident_candidate(
+                loaded_reconciler,
+                candidates,
+                min_confidence,
+                allow_fuzzy_matches=allow_fuzzy_matches)
+            if candidate is None:
+                index += 1
+                continue
+            # Accepting the candidate may also consume pending entries that
+            # were previously left for review.
+            pending_data = loaded_reconciler.pending_data
+            for import_result in candidate.used_import_results:
+                position = pending_data.index_of(
+                    reconcile.get_pending_entry_id(import_result))
+                if position is not None and position < index:
+                    index -= 1
+            loaded_reconciler.accept_candidate(candidate)
+            num_accepted += 1
+    finally:
+        modified_filenames = editor.stop_deferring_writes()
+    return AutoReconcileResult(
+        num_accepted=num_accepted,
+        num_remaining=len(loaded_reconciler.pending_data),
+        modified_filenames=sorted(modified_filenames),
+    )
+
+
+def run(args) -> AutoReconcileResult:
+    """Loads the journal and sources specified by the parsed `args` of
+    `webserver.parse_arguments`, and calls `auto_reconcile`."""
+    reconciler = reconcile.Reconciler(
+        journal_path=args.journal_input,
+        ignore_path=args.ignored_journal,
+        log_status=print,
+        options=vars(args))
+    loaded_reconciler = reconciler.loaded_future.result()
+    try:
+        result = auto_reconcile(
+            loaded_reconciler,
+            min_confidence=args.auto_reconcile_min_confidence,
+            allow_fuzzy_matches=args.auto_reconcile_fuzzy_matches)
+    finally:
+        loaded_reconciler.close()
+    print('Accepted %d pending entries; %d remaining for review' %
+          (result.num_accepted, result.num_remaining))
+    for filename in result.modified_filenames:
+        print('Wrote %s' % filename)
+    if args.phase_timing_report is not None:
+        phase_timing.write_report(loaded_reconciler.phase_timer,
+                                  args.phase_timing_report)
+    return result
+
+
+def main(argv, **kwargs):
+    """Equivalent to `webserver.main`, but runs `auto_reconcile` rather than
+    the web server."""
+    from . import webserver
+    webserver.main(argv, **dict(kwargs, auto_reconcile=True))
@@ -0,0 +1,117 @@
+import os
+import shutil
+
+import py
+from beancount.core.number import Decimal
+
+from . import auto_reconcile
+from . import reconcile
+from . import test_util
+
+testdata_root = os.path.realpath(
+    os.path.join(os.path.dirname(__file__), '..', 'testdata'))
+
+
+def _load_reconciler(tmpdir: py.path.local,
+                     mint_filename: str = os.path.join(
+                         testdata_root, 'source', 'mint', 'mint.csv'),
+                     fuzzy_match_amount: str = '0'
+                     ) -> reconcile.LoadedReconciler:
+    initial = os.path.join(testdata_root, 'reconcile', 'test_basic', '0')
+    for name in ['journal.beancount', 'ignore.beancount']:
+        shutil.copyfile(
+            os.path.join(initial, name), os.path.join(str(tmpdir), name))
+    reconciler = test_util.make_reconciler(
+        str(tmpdir),
+        data_sources=[
+            {
+                'module': 'beancount_import.source.mint',
+                'filename': mint_filename,
+            },
+        ],
+        fuzzy_match_amount=Decimal(fuzzy_match_amount))
+    return reconciler.loaded_future.result()
+
+
+def test_auto_reconcile_fuzzy_match(tmpdir: py.path.local):
+    loaded_reconciler = _load_reconciler(tmpdir)
+    journal_path = os.path.join(str(tmpdir), 'journal.beancount')
+    # The credit card payment uniquely matches the checking account transfer
+    # dated 5 days later, while the coffee purchase has an unknown account.
+    assert len(loaded_reconciler.pending_data) == 3
+
+    # The match is not exact.
+    result = auto_reconcile.auto_reconcile(loaded_reconciler)
+    assert result == auto_reconcile.AutoReconcileResult(
+        num_accepted=0, num_remaining=3, modified_filenames=[])
+
+    result = auto_reconcile.auto_reconcile(
+        loaded_reconciler, allow_fuzzy_matches=True)
+    assert result == auto_reconcile.AutoReconcileResult(
+        num_accepted=1,
+        num_remaining=1,
+        modified_filenames=[os.path.realpath(journal_path)])
+    assert [
+        pending.entries[0].narration
+        for pending in loaded_reconciler.pending_data
+    ] == ['STARBUCKS STORE 12345']
+    with open(journal_path, 'r') as f:
+        contents = f.read()
+    assert 'CR CARD PAYMENT ALEXANDRIA VA' in contents
+    assert 'STARBUCKS' not in contents
+    assert not loaded_reconciler.editor.check_any_journal_modification()
+
+    # Nothing further is accepted.
+    result = auto_reconcile.auto_reconcile(
+        loaded_reconciler, allow_fuzzy_matches=True)
+    assert result == auto_reconcile.AutoReconcileResult(
+        num_accepted=0, num_remaining=1, modified_filenames=[])
+
+
+def test_auto_reconcile_exact_match(tmpdir: py.path.local):
+    mint_filename = os.path.join(str(tmpdir), 'mint.csv')
+    with open(mint_filename, 'w') as f:
+        f.write(
+            '"Date","Description","Original Description","Amount",'
+            '"Transaction Type","Category","Account Name","Labels","Notes"\n'
+            # Exact match.
+            '"11/27/2013","Payment","EXACT PAYMENT","66.88","credit",'
+            '"Credit Card Payment","My Credit Card","",""\n'
+            '"11/27/2013","Transfer","EXACT TRANSFER","66.88","debit",'
+            '"Transfer","My Checking","",""\n'
+            # Dates differ.
+            '"12/10/2013","Payment","LATE PAYMENT","20.00","credit",'
+            '"Credit Card Payment","My Credit Card","",""\n'
+            '"12/12/2013","Transfer","LATE TRANSFER","20.00","debit",'
+            '"Transfer","My Checking","",""\n'
+            # Amounts differ.
+            '"01/15/2014","Payment","ROUNDED PAYMENT","30.00","credit",'
+            '"Credit Card Payment","My Credit Card","",""\n'
+            '"01/15/2014","Transfer","ROUNDED TRANSFER","30.02","debit",'
+            '"Transfer","My Checking","",""\n')
+    loaded_reconciler = _load_reconciler(
+        tmpdir, mint_filename=mint_filename, fuzzy_match_amount='0.05')
+    journal_path = os.path.join(str(tmpdir), 'journal.beancount')
+    assert len(loaded_reconciler.pending_data) == 6
+    result = auto_reconcile.auto_reconcile(loaded_reconciler)
+    assert result == auto_reconcile.AutoReconcileResult(
+        num_accepted=1,
+        num_remaining=4,
+        modified_filenames=[os.path.realpath(journal_path)])
+    assert sorted(
+        pending.entries[0].narration
+        for pending in loaded_reconciler.pending_data) == [
+            'LATE PAYMENT', 'LATE TRANSFER', 'ROUNDED PAYMENT',
+            'ROUNDED TRANSFER'
+        ]
+    with open(journal_path, 'r') as f:
+        contents = f.read()
+    assert 'EXACT PAYMENT' in contents
+    assert 'LATE' not in contents
+    assert 'ROUNDED' not in contents
+
+    # The fuzzy matches are accepted only if allowed.
+    result = auto_reconcile.auto_reconcile(
+        loaded_reconciler, allow_fuzzy_matches=True)
+    assert result.num_accepted == 2
+    assert result.num_remaining == 0
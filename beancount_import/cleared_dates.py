@@ -0,0 +1,102 @@
+"""Index of the cleared date ranges of accounts.
+
+The `cleared_before` and `cleared_after` metadata of the `open` directive of an
+account specify that postings to the account, or to any of its subaccounts,
+dated before or after the specified dates are considered cleared.  The range
+of dates in which postings to an account may be uncleared is therefore the
+intersection of the ranges specified for the account and each of its opened
+ancestors.
+
+The ranges are computed by a single traversal of a trie of the account name
+components, rather than by looking up every ancestor of each account.
+"""
+
+import datetime
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from beancount.core.data import Open
+
+ClearedDateRange = Tuple[datetime.date, datetime.date]
+
+DEFAULT_CLEARED_DATE_RANGE = (datetime.date.min, datetime.date.max
+                              )  # type: ClearedDateRange
+
+
+class _Node(object):
+    __slots__ = ('children', 'cleared_date_range')
+
+    def __init__(self) -> None:
+        self.children = {}  # type: Dict[str, _Node]
+        # The range specified by the `open` directive of the account, or
+        # `None` if the account is not opened.
+        self.cleared_date_range = None  # type: Optional[ClearedDateRange]
+
+
+class ClearedDateIndex(object):
+    """Cleared date ranges of the opened accounts.
+
+    Errors in the `cleared_before` and `cleared_after` metadata are recorded in
+    `errors`, in the format of `LoadedReconciler.errors`.
+    """
+
+    def __init__(self, accounts: Mapping[str, Open]) -> None:
+        self.errors = []  # type: List[Tuple[str, str, Any]]
+        root = _Node()
+        for account_name in sorted(accounts):
+            meta = accounts[account_name].meta
+            if meta is None: continue
+            node = root
+            for part in account_name.split(':'):
+                child = node.children.get(part)
+                if child is None:
+                    child = node.children[part] = _Node()
+                node = child
+            node.cleared_date_range = self._get_specified_range(
+                account_name, meta)
+        # Maps each account with a range other than the default to its range.
+        self.cleared_date_ranges = {}  # type: Dict[str, ClearedDateRange]
+        stack = [(name, child, DEFAULT_CLEARED_DATE_RANGE)
+                 for name, child in root.children.items()]
+        while stack:
+            account_name, node, (cleared_before, cleared_after) = stack.pop()
+            specified = node.cleared_date_range
+            if specified is not None:
+                cleared_before = max(cleared_before, specified[0])
+                cleared_after = min(cleared_after, specified[1])
+                if (cleared_before != datetime.date.min or
+                        cleared_after != datetime.date.max):
+                    self.cleared_date_ranges[account_name] = (cleared_before,
+                                                              cleared_after)
+            for part, child in node.children.items():
+                stack.append((account_name + ':' + part, child,
+                              (cleared_before, cleared_after)))
+
+    def _get_specified_range(self, account_name: str,
+                             meta: Dict[str, Any]) -> ClearedDateRange:
+        cleared_before = meta.get('cleared_before', datetime.date.min)
+        if not isinstance(cleared_before, datetime.date):
+            self.errors.append(
+                ('error', '%s: Expected cleared_before value to be a date' %
+                 (account_name, ), meta))
+            cleared_before = datetime.date.min
+        cleared_after = meta.get('cleared_after', datetime.date.max)
+        if not isinstance(cleared_after, datetime.date):
+            self.errors.append(
+                ('error', '%s: Expected cleared_after value to be a date' %
+                 (account_name, ), meta))
+            cleared_after = datetime.date.max
+        return cleared_before, cleared_after
+
+    def get(self, account: str) -> ClearedDateRange:
+        """Returns the range of dates in which postings to `account` may be
+        uncleared."""
+        return self.cleared_date_ranges.get(account,
+                                            DEFAULT_CLEARED_DATE_RANGE)
+
+    def get_changed_accounts(self, other: 'ClearedDateIndex') -> Set[str]:
+        """Returns the accounts whose range differs in `other`."""
+        ranges = self.cleared_date_ranges
+        other_ranges = other.cleared_date_ranges
+        return set(
+            account for account in set(ranges).union(other_ranges)
+            if ranges.get(account) != other_ranges.get(account))
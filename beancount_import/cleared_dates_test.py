@@ -0,0 +1,68 @@
+import datetime
+
+from beancount.core.data import Open
+
+from .cleared_dates import ClearedDateIndex, DEFAULT_CLEARED_DATE_RANGE
+
+
+def _make_accounts(**metas):
+    return {
+        name.replace('_', ':'): Open(
+            meta=dict(meta, filename='journal.beancount', lineno=1),
+            date=datetime.date(1900, 1, 1),
+            account=name.replace('_', ':'),
+            currencies=None,
+            booking=None)
+        for name, meta in metas.items()
+    }
+
+
+def test_inherited_ranges():
+    index = ClearedDateIndex(
+        _make_accounts(
+            Assets={'cleared_before': datetime.date(2018, 1, 1)},
+            Assets_Bank_Checking={'cleared_after': datetime.date(2019, 1, 1)},
+            Assets_Bank_Savings={'cleared_before': datetime.date(2017, 1, 1)},
+            Liabilities_Card={},
+        ))
+    assert index.errors == []
+    assert index.get('Assets') == (datetime.date(2018, 1, 1),
+                                   datetime.date.max)
+    assert index.get('Assets:Bank:Checking') == (datetime.date(2018, 1, 1),
+                                                 datetime.date(2019, 1, 1))
+    assert index.get('Assets:Bank:Savings') == (datetime.date(2018, 1, 1),
+                                                datetime.date.max)
+    # Accounts that are not opened use the default range, even if an ancestor
+    # specifies a range.
+    assert index.get('Assets:Bank') == DEFAULT_CLEARED_DATE_RANGE
+    assert index.get('Assets:Other') == DEFAULT_CLEARED_DATE_RANGE
+    assert index.get('Liabilities:Card') == DEFAULT_CLEARED_DATE_RANGE
+
+
+def test_invalid_dates():
+    accounts = _make_accounts(Assets={'cleared_before': 'x'})
+    index = ClearedDateIndex(accounts)
+    assert index.get('Assets') == DEFAULT_CLEARED_DATE_RANGE
+    assert index.errors == [('error',
+                             'Assets: Expected cleared_before value to be a date',
+                             accounts['Assets'].meta)]
+
+
+def test_get_changed_accounts():
+    old_index = ClearedDateIndex(
+        _make_accounts(
+            Assets={'cleared_before': datetime.date(2018, 1, 1)},
+            Assets_Checking={},
+            Liabilities={},
+        ))
+    new_index = ClearedDateIndex(
+        _make_accounts(
+            Assets={'cleared_before': datetime.date(2017, 1, 1)},
+            Assets_Checking={},
+            Liabilities={},
+            Liabilities_Card={'cleared_after': datetime.date(2019, 1, 1)},
+        ))
+    assert new_index.get_changed_accounts(old_index) == {
+        'Assets', 'Assets:Checking', 'Liabilities:Card'
+    }
+    assert new_index.get_changed_accounts(new_index) == set()
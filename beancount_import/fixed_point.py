@@ -0,0 +1,64 @@
+"""Exact conversion of decimal numbers to scaled integers.
+
+A number `x` is represented at a given `scale` by the integer
+`x * 10**scale`.  Integer arithmetic on such representations is much cheaper
+than `Decimal` arithmetic, and is exact as long as the scale is at least the
+number of fractional digits of every number involved.
+"""
+
+from typing import Iterable, List, NamedTuple
+
+from beancount.core.number import Decimal
+
+ScaledNumber = NamedTuple('ScaledNumber', [('value', int), ('scale', int)])
+
+
+def get_scale(number: Decimal) -> int:
+    """Returns the number of fractional digits of `number`."""
+    exponent = number.as_tuple().exponent
+    if not isinstance(exponent, int):
+        raise ValueError('Cannot scale non-finite number: %r' % (number, ))
+    return max(0, -exponent)
+
+
+def get_common_scale(numbers: Iterable[Decimal]) -> int:
+    """Returns the smallest scale at which all of `numbers` are integers."""
+    return max((get_scale(number) for number in numbers), default=0)
+
+
+def to_scaled_int(number: Decimal, scale: int) -> int:
+    """Returns `number * 10**scale`, which must be an integer."""
+    sign, digits, exponent = number.as_tuple()
+    if not isinstance(exponent, int):
+        raise ValueError('Cannot scale non-finite number: %r' % (number, ))
+    value = 0
+    for digit in digits:
+        value = value * 10 + digit
+    shift = exponent + scale
+    if shift < 0:
+        raise ValueError('Scale %d is too small for %r' % (scale, number))
+    value *= 10**shift
+    return -value if sign else value
+
+
+def to_scaled_ints(numbers: Iterable[Decimal]) -> List[int]:
+    """Converts `numbers` to integers at their common scale."""
+    numbers = list(numbers)
+    scale = get_common_scale(numbers)
+    return [to_scaled_int(number, scale) for number in numbers]
+
+
+def to_scaled_number(number: Decimal) -> ScaledNumber:
+    """Returns the exact representation of `number` at its own scale."""
+    scale = get_scale(number)
+    return ScaledNumber(to_scaled_int(number, scale), scale)
+
+
+def rescale(number: ScaledNumber, scale: int) -> int:
+    """Returns the value of `number` at `scale`, which must be at least
+    `number.scale`."""
+    if number.scale == scale:
+        return number.value
+    if number.scale > scale:
+        raise ValueError('Scale %d is too small for %r' % (scale, number))
+    return number.value * 10**(scale - number.scale)
@@ -0,0 +1,22 @@
+import pytest
+
+from beancount.core.number import D
+
+from . import fixed_point
+
+
+def test_to_scaled_ints():
+    assert fixed_point.to_scaled_ints([D('1.5'), D('-0.25'), D('3'),
+                                       D('1E+2')]) == [150, -25, 300, 10000]
+    assert fixed_point.to_scaled_ints([]) == []
+
+
+def test_scaled_number():
+    number = fixed_point.to_scaled_number(D('-12.340'))
+    assert number == fixed_point.ScaledNumber(-12340, 3)
+    assert fixed_point.rescale(number, 3) == -12340
+    assert fixed_point.rescale(number, 5) == -1234000
+    with pytest.raises(ValueError):
+        fixed_point.rescale(number, 2)
+    with pytest.raises(ValueError):
+        fixed_point.to_scaled_int(D('0.125'), 2)
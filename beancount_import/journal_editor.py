@@ -19,11 +19,14 @@ journal, and modifies only the lines occupied by the directives explicitly
 included in the change set.
 """
 
-from typing import Union, Dict, Tuple, List, Optional, Set, NamedTuple, Sequence, FrozenSet, Iterable
+from typing import Union, Dict, Tuple, List, Optional, Set, NamedTuple, Sequence, FrozenSet, Iterable, Any
 import datetime
 import collections
 import contextlib
+import copy
+import hashlib
 import io
+import json
 import os
 import re
 import threading
@@ -35,8 +38,12 @@ import beancount.core.data
 import beancount.loader
 import beancount.parser.printer
 import beancount.parser.booking
+import beancount.parser.parser
+import beancount.ops.validation
 from beancount.core.number import MISSING
 
+from .phase_timing import PhaseTimer
+
 # Inclusive starting original line, exclusive ending original line.
 LineRange = Tuple[int, int]
 
@@ -77,6 +84,20 @@ ApplyStagedChangesResult = NamedTuple('ApplyStagedChangesResult', [
     ('new_ignored_entries', Entries),
 ])
 
+JournalReloadResult = NamedTuple('JournalReloadResult', [
+    ('old_entries', Entries),
+    ('new_entries', Entries),
+    ('old_ignored_entries', Entries),
+    ('new_ignored_entries', Entries),
+])
+
+# Result of `beancount.parser.parser.parse_file` for a single file.
+ParsedFile = NamedTuple('ParsedFile', [
+    ('entries', Entries),
+    ('errors', List[Any]),
+    ('options_map', Dict[str, Any]),
+])
+
 
 def get_accounts_and_commodities(
         entries: Entries) -> Tuple[Dict[str, Open], Dict[str, Commodity]]:
@@ -105,7 +126,9 @@ _intercept_parse_file_lock = threading.Lock()
 
 
 @contextlib.contextmanager
-def _intercepted_parse_file(file_modification_times: Dict[str, float]):
+def _intercepted_parse_file(
+        file_modification_times: Dict[str, float],
+        parsed_files: Optional[Dict[str, ParsedFile]] = None):
     with _intercept_parse_file_lock:
         orig_parse_file = beancount.parser.parser.parse_file
 
@@ -116,7 +139,14 @@ def _intercepted_parse_file(file_modification_times: Dict[str, float]):
                     filename).st_mtime
             except OSError:
                 pass
-            return orig_parse_file(filename, **kw)
+            result = orig_parse_file(filename, **kw)
+            if parsed_files is not None:
+                # The options map of the top-level file is subsequently
+                # modified by `beancount.loader._parse_recursive`.
+                entries, errors, options_map = result
+                parsed_files[real_filename] = ParsedFile(
+                    entries, errors, copy.deepcopy(options_map))
+            return result
         beancount.parser.parser.parse_file = intercept_parse_file
         try:
             yield
@@ -126,7 +156,11 @@ def _intercepted_parse_file(file_modification_times: Dict[str, float]):
 _load_file_lock = threading.Lock()
 
 
-def load_file(filename: str, encoding: Optional[str] = None):
+def load_file(filename: str,
+              encoding: Optional[str] = None,
+              parsed_files: Optional[Dict[str, ParsedFile]] = None,
+              load_errors: Optional[List[Any]] = None,
+              phase_timer: Optional[PhaseTimer] = None):
     """Loads the specified journal.
 
     Returns a tuple containing:
@@ -136,27 +170,51 @@ def load_file(filename: str, encoding: Optional[str] = None):
       pre_booking_entries
       post_booking_entries
       file_modification_times
+
+    If `parsed_files` is specified, the result of parsing each file is stored in
+    it, keyed by real path, in the order in which the files were parsed.  If
+    `load_errors` is specified, it is extended with the parse errors not
+    attributable to a single file, such as missing included files.
+
+    If `phase_timer` is specified, the parsing and booking of the entries are
+    recorded as the `journal_parse` and `journal_booking` phases.
     """
 
+    if phase_timer is None:
+        phase_timer = PhaseTimer()
     # Since we are monkey patching beancount functions, ensure this function
     # isn't called from multiple threads concurrently.
     file_modification_times = dict()  # type: Dict[str, float]
-    with _load_file_lock, _intercepted_parse_file(file_modification_times):
+    if parsed_files is None:
+        parsed_files = dict()
+    with _load_file_lock, _intercepted_parse_file(file_modification_times,
+                                                  parsed_files):
         filename = os.path.realpath(filename)
 
         orig_book_func = beancount.parser.booking.book
+        orig_parse_recursive_func = beancount.loader._parse_recursive
         pre_booking_entries = None
         post_booking_entries = None
 
+        def intercept_parse_recursive(*args, **kwargs):
+            with phase_timer.phase('journal_parse'):
+                result = orig_parse_recursive_func(*args, **kwargs)
+            if load_errors is not None:
+                load_errors.extend(
+                    _get_load_errors(result[1], parsed_files.values()))
+            return result
+
         def intercept_book(entries, options_map):
             nonlocal pre_booking_entries
             nonlocal post_booking_entries
             pre_booking_entries = entries
-            entries, balance_errors = orig_book_func(entries, options_map)
+            with phase_timer.phase('journal_booking'):
+                entries, balance_errors = orig_book_func(entries, options_map)
             post_booking_entries = entries
             return entries, balance_errors
 
         beancount.parser.booking.book = intercept_book
+        beancount.loader._parse_recursive = intercept_parse_recursive
         try:
             entries, errors, options_map = beancount.loader._load(
                 [(filename, True)],
@@ -165,12 +223,62 @@ def load_file(filename: str, encoding: Optional[str] = None):
                 encoding=encoding)
         finally:
             beancount.parser.booking.book = orig_book_func
+            beancount.loader._parse_recursive = orig_parse_recursive_func
         assert pre_booking_entries is not None
         assert post_booking_entries is not None
         return (entries, errors, options_map, pre_booking_entries,
                 post_booking_entries, file_modification_times)
 
 
+def _get_load_errors(parse_errors: List[Any],
+                     parsed_files: Iterable[ParsedFile]) -> List[Any]:
+    """Returns the errors in `parse_errors` not produced by parsing one of
+    `parsed_files`."""
+    file_error_ids = set(
+        id(error) for parsed_file in parsed_files
+        for error in parsed_file.errors)
+    return [error for error in parse_errors if id(error) not in file_error_ids]
+
+
+def _get_parsed_entries_and_errors(parsed_files: Iterable[ParsedFile],
+                                   load_errors: List[Any]
+                                   ) -> Tuple[Entries, List[Any]]:
+    """Combines the results of parsing individual files, as done by
+    `beancount.loader._parse_recursive`."""
+    entries = []  # type: Entries
+    errors = []  # type: List[Any]
+    for parsed_file in parsed_files:
+        entries.extend(parsed_file.entries)
+        errors.extend(parsed_file.errors)
+    errors.extend(load_errors)
+    entries.sort(key=beancount.core.data.entry_sortkey)
+    return entries, errors
+
+
+def _book_and_validate(pre_booking_entries: Entries, parse_errors: List[Any],
+                       options_map: Dict[str, Any]
+                       ) -> Tuple[Entries, List[Any]]:
+    """Books, transforms and validates parsed entries, as done by
+    `beancount.loader._load`.
+
+    Returns a tuple containing:
+      post_booking_entries
+      errors
+    """
+    post_booking_entries, balance_errors = beancount.parser.booking.book(
+        pre_booking_entries, options_map)
+    entries, errors = beancount.loader.run_transformations(
+        post_booking_entries, list(parse_errors) + balance_errors,
+        options_map, None)
+    errors.extend(beancount.ops.validation.validate(entries, options_map))
+    return post_booking_entries, errors
+
+
+def _get_options_for_comparison(options_map: Dict[str, Any]) -> Dict[str, Any]:
+    # The display context is not comparable, and only affects formatting.
+    return {k: v for k, v in options_map.items() if k != 'dcontext'}
+
+
 def _partially_book_entry(orig_entry: Directive,
                           booked_entry: Directive) -> Directive:
     """Computes a partially-booked entry.
@@ -232,6 +340,67 @@ def get_partially_booked_entries(pre_booking_entries: Entries,
     return partially_booked_entries
 
 
+def get_file_change_sets_result(
+        old_lines: List[str],
+        change_sets: Sequence[LineChangeSet]) -> ApplyFileChangesResult:
+    """Returns the new lines after applying `change_sets` to `old_lines`."""
+    new_lines = []  # type: List[str]
+    next_old_lineno = 0
+    next_new_lineno = 0
+    lineno_map = dict()  # type: Dict[int, Optional[int]]
+
+    def fill_unchanged_lines(end_old_lineno):
+        nonlocal next_new_lineno, next_old_lineno
+        assert end_old_lineno <= len(
+            old_lines) and end_old_lineno >= next_old_lineno
+        new_lines.extend(old_lines[next_old_lineno:end_old_lineno])
+        for i in range(next_old_lineno, end_old_lineno):
+            # +1 because beancount parser uses 1-based line numbers
+            lineno_map[i + 1] = next_new_lineno + 1
+            next_new_lineno += 1
+        next_old_lineno = end_old_lineno
+
+    append_only = True
+
+    for line_range, line_changes in change_sets:
+        fill_unchanged_lines(line_range[0])
+
+        if append_only:
+            if line_range[0] < len(old_lines):
+                if line_range[0] != len(old_lines) - 1 or old_lines[
+                        -1].strip():
+                    # If changes start either before the last line or on the non-empty last
+                    # line, then they are not append-only.
+                    append_only = False
+
+        for change_type, line in line_changes:
+            if change_type >= 0:
+                new_lines.append(line)
+            if change_type < 0:
+                lineno_map[next_old_lineno + 1] = None
+            if change_type == 0:
+                lineno_map[next_old_lineno + 1] = next_new_lineno + 1
+            if change_type <= 0:
+                next_old_lineno += 1
+            if change_type >= 0:
+                next_new_lineno += 1
+        assert next_old_lineno == line_range[1]
+
+    fill_unchanged_lines(len(old_lines))
+    new_data = '\n'.join(new_lines)
+    return ApplyFileChangesResult(
+        new_contents=new_data,
+        new_lines=new_lines,
+        lineno_map=lineno_map,
+        append_only=append_only,
+    )
+
+
+class JournalModifiedError(RuntimeError):
+    """Indicates that a journal file to be written was modified since it was
+    loaded."""
+
+
 class _AtomicWriter(atomicwrites.AtomicWriter):
     """Wrapper that calls `os.stat` after close but before the rename."""
 
@@ -250,35 +419,211 @@ def _get_journal_contents(filename: str):
         return f.read()
 
 
+# Suffix of the path, relative to the root journal file, of the log of changes
+# whose writes were deferred by `JournalEditor.defer_writes`.
+WRITE_BEHIND_LOG_SUFFIX = '.write-behind-log'
+
+
+def _get_contents_hash(contents: str) -> str:
+    return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+
+# Suffix, relative to the write-behind log, of the path to which logged changes
+# that could not be written because the file was modified are moved.
+WRITE_BEHIND_CONFLICTS_SUFFIX = '.conflicts'
+
+WriteBehindLogReplayResult = NamedTuple('WriteBehindLogReplayResult', [
+    ('written_filenames', List[str]),
+    ('conflicting_filenames', List[str]),
+])
+
+# Error, in the format of beancount errors, reporting logged changes that were
+# not written because of a conflict.
+WriteBehindLogError = NamedTuple('WriteBehindLogError', [
+    ('source', Meta),
+    ('message', str),
+    ('entry', Optional[Directive]),
+])
+
+
+def _read_write_behind_log(log_path: str) -> List[Dict[str, Any]]:
+    records = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # The final record may be incomplete.
+                break
+    return records
+
+
+def _write_write_behind_log(log_path: str,
+                            records: List[Dict[str, Any]]) -> None:
+    writer = _AtomicWriter(
+        log_path, mode='w+', encoding='utf-8', newline='\n', overwrite=True)
+    with writer.open() as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in records))
+
+
+def replay_write_behind_log(log_path: str) -> WriteBehindLogReplayResult:
+    """Writes the changes recorded in a write-behind log that were not written
+    before the `JournalEditor` exited, and removes the log.
+
+    The log consists of one JSON record per line for each applied file change
+    set, which specifies the hash of the contents of the file after the change.
+    The first record for each file also specifies the hash of the contents of
+    the file to which the changes apply.  A file whose contents match the result
+    of one of its records, because the editor exited after writing it but before
+    updating the log, only has the changes of the subsequent records written.
+    If the file has neither, because it was modified since, its changes are not
+    written, but are instead appended to the log at `log_path +
+    WRITE_BEHIND_CONFLICTS_SUFFIX` so that they are not lost.
+    """
+    file_records = collections.OrderedDict(
+    )  # type: Dict[str, List[Dict[str, Any]]]
+    for record in _read_write_behind_log(log_path):
+        file_records.setdefault(record['filename'], []).append(record)
+    written_filenames = []
+    conflicting_filenames = []
+    conflicting_records = []  # type: List[Dict[str, Any]]
+    for filename, records in file_records.items():
+        contents = _get_journal_contents(filename)
+        contents_hash = _get_contents_hash(contents)
+        if contents_hash != records[0]['base_sha256']:
+            written_records = [
+                i for i, record in enumerate(records)
+                if record.get('result_sha256') == contents_hash
+            ]
+            if not written_records:
+                conflicting_filenames.append(filename)
+                conflicting_records.extend(records)
+                continue
+            records = records[written_records[-1] + 1:]
+        if not records:
+            written_filenames.append(filename)
+            continue
+        lines = contents.split('\n')
+        for record in records:
+            change_sets = [
+                LineChangeSet(
+                    line_range=(line_range[0], line_range[1]),
+                    changes=[(change_type, line)
+                             for change_type, line in changes])
+                for line_range, changes in record['change_sets']
+            ]
+            lines = get_file_change_sets_result(lines, change_sets).new_lines
+        writer = _AtomicWriter(
+            filename, mode='w+', encoding='utf-8', newline='\n', overwrite=True)
+        with writer.open() as f:
+            f.write('\n'.join(lines))
+        written_filenames.append(filename)
+    if conflicting_records:
+        conflicts_path = log_path + WRITE_BEHIND_CONFLICTS_SUFFIX
+        if os.path.exists(conflicts_path):
+            conflicting_records = (_read_write_behind_log(conflicts_path) +
+                                   conflicting_records)
+        _write_write_behind_log(conflicts_path, conflicting_records)
+    os.remove(log_path)
+    return WriteBehindLogReplayResult(
+        written_filenames=written_filenames,
+        conflicting_filenames=conflicting_filenames)
+
+
 class JournalEditor(object):
     def __init__(self, journal_path: str,
-                 ignored_path: Optional[str] = None) -> None:
+                 ignored_path: Optional[str] = None,
+                 phase_timer: Optional[PhaseTimer] = None) -> None:
+        if phase_timer is None:
+            phase_timer = PhaseTimer()
 
         self.default_journal_load_time = time.time()
         journal_path = os.path.realpath(journal_path)
         self.journal_path = journal_path
 
-        (final_entries, self.errors, self.options_map, pre_booking_entries,
-         post_booking_entries,
-         self.journal_load_time) = load_file(journal_path)
+        self.write_behind_log_path = journal_path + WRITE_BEHIND_LOG_SUFFIX
+        if os.path.exists(self.write_behind_log_path):
+            replay_result = replay_write_behind_log(self.write_behind_log_path)
+            for filename in replay_result.written_filenames:
+                print('Wrote logged changes to %r' % (filename, ))
+            for filename in replay_result.conflicting_filenames:
+                print('Not replaying logged changes to %r, since it was '
+                      'modified' % (filename, ))
+        # Reports logged changes that were not written because of a conflict,
+        # until the conflicts log is removed.
+        self._write_behind_log_errors = []  # type: List[Any]
+        conflicts_path = (
+            self.write_behind_log_path + WRITE_BEHIND_CONFLICTS_SUFFIX)
+        if os.path.exists(conflicts_path):
+            conflicting_filenames = sorted(
+                set(record['filename']
+                    for record in _read_write_behind_log(conflicts_path)))
+            self._write_behind_log_errors.append(
+                WriteBehindLogError(
+                    source=beancount.core.data.new_metadata(conflicts_path, 1),
+                    message=(
+                        'Logged changes to %s were not written, since the '
+                        'files were modified; the changes are saved in %r' %
+                        (', '.join(map(repr, conflicting_filenames)),
+                         conflicts_path)),
+                    entry=None))
+
+        # Results of parsing each file, used by `reload_modified_files`.
+        self._parsed_files = collections.OrderedDict(
+        )  # type: Dict[str, ParsedFile]
+        self._load_errors = []  # type: List[Any]
+        (final_entries, self._journal_errors, self.options_map,
+         pre_booking_entries, post_booking_entries,
+         self.journal_load_time) = load_file(
+             journal_path,
+             parsed_files=self._parsed_files,
+             load_errors=self._load_errors,
+             phase_timer=phase_timer)
         del final_entries
-        self.entries = get_partially_booked_entries(pre_booking_entries,
-                                                    post_booking_entries)
+        with phase_timer.phase('journal_partial_booking'):
+            self.entries = get_partially_booked_entries(pre_booking_entries,
+                                                        post_booking_entries)
+        # Maps the id of each pre-booking entry to the corresponding entry in
+        # `self.entries`.  The pre-booking entries are kept alive by
+        # `self._parsed_files`.
+        self._partially_booked_entries = dict(
+            zip(map(id, pre_booking_entries),
+                self.entries))  # type: Dict[int, Directive]
+        # Files changed by `apply_file_changes_result`, for which the results in
+        # `self._parsed_files` are out of date.
+        self._stale_filenames = set()  # type: Set[str]
+        # If not `None`, maps each file changed by `apply_file_changes_result`
+        # to its new contents, which have not yet been written.
+        self._deferred_contents = None  # type: Optional[Dict[str, str]]
+        # Indicates whether deferred change sets are recorded in the log at
+        # `write_behind_log_path`.
+        self._use_write_behind_log = False
+        # Files for which the log contains change sets.
+        self._logged_filenames = set()  # type: Set[str]
         self.cached_lines = {}  # type: Dict[str, List[str]]
         self.accounts, self.commodities = get_accounts_and_commodities(
             self.entries)
         journal_paths = [journal_path] + self.options_map['include']
         ignored_journal_paths = []  # type: List[str]
+        self._ignored_parsed_files = collections.OrderedDict(
+        )  # type: Dict[str, ParsedFile]
+        self._ignored_load_errors = []  # type: List[Any]
+        self._ignored_errors = []  # type: List[Any]
         if ignored_path is not None:
             ignored_path = os.path.realpath(ignored_path)
             self.ignored_path = ignored_path  # type: Optional[str]
-            with _intercepted_parse_file(self.journal_load_time):
+            with phase_timer.phase('ignored_journal_parse'), \
+                 _intercepted_parse_file(self.journal_load_time,
+                                         self._ignored_parsed_files):
                 (pre_booking_ignored_entries, ignored_errors,
                  self.ignored_options_map) = beancount.loader._parse_recursive(
                      [(ignored_path, True)], log_timings=False)
-            self.ignored_entries, ignored_balance_errors = beancount.parser.booking.book(
-                pre_booking_ignored_entries, self.ignored_options_map)
-            self.errors.extend(ignored_errors)
+            self._ignored_load_errors = _get_load_errors(
+                ignored_errors, self._ignored_parsed_files.values())
+            with phase_timer.phase('ignored_journal_booking'):
+                self.ignored_entries, ignored_balance_errors = beancount.parser.booking.book(
+                    pre_booking_ignored_entries, self.ignored_options_map)
+            self._ignored_errors = ignored_errors
             ignored_journal_paths = [ignored_path]
             ignored_journal_paths.extend(self.ignored_options_map['include'])
             journal_paths.extend(ignored_journal_paths)
@@ -286,11 +631,35 @@ class JournalEditor(object):
             self.ignored_entries = []
             self.ignored_path = None
             self.ignored_options_map = {}
+        self.errors = (self._journal_errors + self._ignored_errors +
+                       self._write_behind_log_errors)
         self.journal_filenames = set(os.path.realpath(x) for x in journal_paths)
         self.ignored_journal_filenames = set(
             os.path.realpath(x) for x in ignored_journal_paths)
         self._all_entries = None  # type: Optional[Entries]
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Object ids are not preserved by pickling, so the partially-booked
+        # entries are saved as pairs with the pre-booking entries.
+        pre_booking_entries = {
+            id(e): e
+            for parsed_file in self._parsed_files.values()
+            for e in parsed_file.entries
+        }
+        state = self.__dict__.copy()
+        state['_partially_booked_entries'] = [
+            (pre_booking_entries[entry_id], entry)
+            for entry_id, entry in self._partially_booked_entries.items()
+        ]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._partially_booked_entries = {
+            id(pre_booking_entry): entry
+            for pre_booking_entry, entry in state['_partially_booked_entries']
+        }
+
     @property
     def all_entries(self) -> Entries:
         if self._all_entries is None:
@@ -342,6 +711,118 @@ class JournalEditor(object):
                 modified_filenames.add(f)
         return modified_filenames
 
+    def reload_modified_files(self, modified_filenames: Iterable[str]
+                              ) -> Optional[JournalReloadResult]:
+        """Updates the editor after the specified journal files were modified.
+
+        Only the modified files, and the files previously written by
+        `apply_file_changes_result`, are parsed again; any deferred writes are
+        flushed first.  The entries of the other files are booked and validated
+        along with the new entries, but retain their identity if they are
+        unchanged.
+
+        :returns: The entries removed and added, or `None` if the modifications
+            cannot be applied incrementally, because the options or the set of
+            included files changed, or because deferred writes conflict with
+            the modifications.  In that case the editor is left unmodified,
+            and the journal must be loaded again from scratch.
+        """
+        self.flush_deferred_writes()
+        if self._deferred_contents:
+            return None
+        reparse_filenames = set(
+            os.path.realpath(x) for x in modified_filenames)
+        reparse_filenames.update(self._stale_filenames)
+        parsed_files = collections.OrderedDict(self._parsed_files)
+        ignored_parsed_files = collections.OrderedDict(
+            self._ignored_parsed_files)
+        journal_load_time = dict(self.journal_load_time)
+        # Hold the same locks as `load_file`, to ensure that the unmodified
+        # beancount functions are called.
+        with _load_file_lock, _intercept_parse_file_lock:
+            for filename in sorted(reparse_filenames):
+                if filename in parsed_files:
+                    file_results = parsed_files
+                elif filename in ignored_parsed_files:
+                    file_results = ignored_parsed_files
+                else:
+                    return None
+                try:
+                    mtime = os.stat(filename).st_mtime
+                except OSError:
+                    return None
+                parsed_file = ParsedFile(
+                    *beancount.parser.parser.parse_file(filename))
+                if (_get_options_for_comparison(parsed_file.options_map) !=
+                        _get_options_for_comparison(
+                            file_results[filename].options_map)):
+                    return None
+                file_results[filename] = parsed_file
+                journal_load_time[filename] = mtime
+
+            journal_changed = not reparse_filenames.isdisjoint(
+                self._parsed_files)
+            if journal_changed:
+                pre_booking_entries, parse_errors = _get_parsed_entries_and_errors(
+                    parsed_files.values(), self._load_errors)
+                post_booking_entries, journal_errors = _book_and_validate(
+                    pre_booking_entries, parse_errors, self.options_map)
+            ignored_changed = not reparse_filenames.isdisjoint(
+                self._ignored_parsed_files)
+            if ignored_changed:
+                pre_booking_ignored_entries, ignored_errors = _get_parsed_entries_and_errors(
+                    ignored_parsed_files.values(), self._ignored_load_errors)
+                ignored_entries, ignored_balance_errors = beancount.parser.booking.book(
+                    pre_booking_ignored_entries, self.ignored_options_map)
+
+        old_entries = []  # type: Entries
+        new_entries = []  # type: Entries
+        if journal_changed:
+            entries = []  # type: Entries
+            partially_booked_entries = {}  # type: Dict[int, Directive]
+            for pre_booking_entry, entry in zip(
+                    pre_booking_entries,
+                    get_partially_booked_entries(pre_booking_entries,
+                                                 post_booking_entries)):
+                old_entry = self._partially_booked_entries.get(
+                    id(pre_booking_entry))
+                if old_entry is not None and old_entry == entry:
+                    entry = old_entry
+                entries.append(entry)
+                partially_booked_entries[id(pre_booking_entry)] = entry
+            old_entry_ids = set(map(id, self.entries))
+            new_entry_ids = set(map(id, entries))
+            old_entries = [e for e in self.entries if id(e) not in new_entry_ids]
+            new_entries = [e for e in entries if id(e) not in old_entry_ids]
+            self.entries = entries
+            self._partially_booked_entries = partially_booked_entries
+            self._parsed_files = parsed_files
+            self._journal_errors = journal_errors
+            self.accounts, self.commodities = get_accounts_and_commodities(
+                self.entries)
+
+        old_ignored_entries = []  # type: Entries
+        new_ignored_entries = []  # type: Entries
+        if ignored_changed:
+            old_ignored_entries = self.ignored_entries
+            new_ignored_entries = ignored_entries
+            self.ignored_entries = ignored_entries
+            self._ignored_parsed_files = ignored_parsed_files
+            self._ignored_errors = ignored_errors
+
+        self.errors = (self._journal_errors + self._ignored_errors +
+                       self._write_behind_log_errors)
+        self.journal_load_time = journal_load_time
+        for filename in reparse_filenames:
+            self.cached_lines.pop(filename, None)
+        self._stale_filenames.clear()
+        self._all_entries = None
+        return JournalReloadResult(
+            old_entries=old_entries,
+            new_entries=new_entries,
+            old_ignored_entries=old_ignored_entries,
+            new_ignored_entries=new_ignored_entries)
+
     def _get_file_change_sets_result(
             self, filename: str,
             change_sets: Sequence[LineChangeSet]) -> ApplyFileChangesResult:
@@ -350,56 +831,7 @@ class JournalEditor(object):
         This does not actually modify the specified file.
         """
         _, old_lines = self.get_journal_lines(filename)
-        new_lines = []  # type: List[str]
-        next_old_lineno = 0
-        next_new_lineno = 0
-        lineno_map = dict()  # type: Dict[int, Optional[int]]
-
-        def fill_unchanged_lines(end_old_lineno):
-            nonlocal next_new_lineno, next_old_lineno
-            assert end_old_lineno <= len(
-                old_lines) and end_old_lineno >= next_old_lineno
-            new_lines.extend(old_lines[next_old_lineno:end_old_lineno])
-            for i in range(next_old_lineno, end_old_lineno):
-                # +1 because beancount parser uses 1-based line numbers
-                lineno_map[i + 1] = next_new_lineno + 1
-                next_new_lineno += 1
-            next_old_lineno = end_old_lineno
-
-        append_only = True
-
-        for line_range, line_changes in change_sets:
-            fill_unchanged_lines(line_range[0])
-
-            if append_only:
-                if line_range[0] < len(old_lines):
-                    if line_range[0] != len(old_lines) - 1 or old_lines[
-                            -1].strip():
-                        # If changes start either before the last line or on the non-empty last
-                        # line, then they are not append-only.
-                        append_only = False
-
-            for change_type, line in line_changes:
-                if change_type >= 0:
-                    new_lines.append(line)
-                if change_type < 0:
-                    lineno_map[next_old_lineno + 1] = None
-                if change_type == 0:
-                    lineno_map[next_old_lineno + 1] = next_new_lineno + 1
-                if change_type <= 0:
-                    next_old_lineno += 1
-                if change_type >= 0:
-                    next_new_lineno += 1
-            assert next_old_lineno == line_range[1]
-
-        fill_unchanged_lines(len(old_lines))
-        new_data = '\n'.join(new_lines)
-        return ApplyFileChangesResult(
-            new_contents=new_data,
-            new_lines=new_lines,
-            lineno_map=lineno_map,
-            append_only=append_only,
-        )
+        return get_file_change_sets_result(old_lines, change_sets)
 
     def apply_file_changes_result(self, filename: str,
                                   result: ApplyFileChangesResult):
@@ -407,31 +839,12 @@ class JournalEditor(object):
         new_data = result.new_contents
         lineno_map = result.lineno_map
         filename = os.path.realpath(filename)
-        if self.check_journal_modification(filename):
-            raise RuntimeError(
-                'Journal file modified concurrently: %r' % filename)
-
-        writer = _AtomicWriter(
-            filename, mode='w+', encoding='utf-8', newline='\n', overwrite=True)
-        try:
-            with writer.open() as f:
-                f.write(new_data)
-        except PermissionError as permError:
-            # this fails frequenty on windows so catch and log instead.
-            print("Failure to write", permError)
-
-        # On MS Windows, closing a file that has just been written causes the
-        # modification time to change.  Therefore, we must close the file before
-        # checking the modification time in order to get a modification time
-        # that we can later use for comparisons to see if the file has been
-        # modified since the last time we wrote to it.  However, we must check
-        # the modification time before performing the rename, as otherwise we
-        # may obtain a modification time that reflects additional modifications.
-        # The _AtomicWriter wrapper takes care of checking the modification time
-        # after closing the file but before renaming it.
-        mtime = writer.stat_result_after_close.st_mtime
-        self.journal_load_time[filename] = mtime
+        if self._deferred_contents is not None:
+            self._deferred_contents[filename] = new_data
+        else:
+            self._write_journal_file(filename, new_data)
         self.cached_lines[filename] = new_lines
+        self._stale_filenames.add(filename)
 
         realpaths = dict()  # type: Dict[str, str]
 
@@ -464,6 +877,140 @@ class JournalEditor(object):
                     for posting in entry.postings:
                         fix_meta(posting.meta)
 
+    def _write_journal_file(self, filename: str, contents: str) -> None:
+        if self.check_journal_modification(filename):
+            raise JournalModifiedError(
+                'Journal file modified concurrently: %r' % filename)
+
+        writer = _AtomicWriter(
+            filename, mode='w+', encoding='utf-8', newline='\n', overwrite=True)
+        try:
+            with writer.open() as f:
+                f.write(contents)
+        except PermissionError as permError:
+            # this fails frequenty on windows so catch and log instead.
+            print("Failure to write", permError)
+
+        # On MS Windows, closing a file that has just been written causes the
+        # modification time to change.  Therefore, we must close the file before
+        # checking the modification time in order to get a modification time
+        # that we can later use for comparisons to see if the file has been
+        # modified since the last time we wrote to it.  However, we must check
+        # the modification time before performing the rename, as otherwise we
+        # may obtain a modification time that reflects additional modifications.
+        # The _AtomicWriter wrapper takes care of checking the modification time
+        # after closing the file but before renaming it.
+        mtime = writer.stat_result_after_close.st_mtime
+        self.journal_load_time[filename] = mtime
+
+    def defer_writes(self, write_behind_log: bool = False) -> None:
+        """Defers writing the files changed by subsequently applied changes
+        until `flush_deferred_writes` is called.
+
+        The in-memory state of the editor is updated immediately, such that
+        further changes may be staged and applied.
+
+        :param write_behind_log: If `True`, the applied change sets are also
+            appended to the log at `write_behind_log_path` before being applied,
+            and are written to the journal from the log when the editor is next
+            created if they were not flushed.
+        """
+        if self._deferred_contents is None:
+            self._deferred_contents = collections.OrderedDict()
+        self._use_write_behind_log = (self._use_write_behind_log or
+                                      write_behind_log)
+
+    @property
+    def has_deferred_writes(self) -> bool:
+        return bool(self._deferred_contents)
+
+    def flush_deferred_writes(self) -> List[str]:
+        """Writes the files changed since the last flush, once each.
+
+        Subsequent writes remain deferred.  A file that was modified since it
+        was loaded is not written; its changes remain deferred, and in the
+        write-behind log if used, and it is included in `write_conflicts`.
+
+        :returns: The names of the files written.
+        """
+        deferred_contents = self._deferred_contents
+        if not deferred_contents:
+            return []
+        written_filenames = []
+        for filename, contents in list(deferred_contents.items()):
+            try:
+                self._write_journal_file(filename, contents)
+            except JournalModifiedError:
+                continue
+            del deferred_contents[filename]
+            written_filenames.append(filename)
+        logged_filenames = self._logged_filenames
+        if logged_filenames.isdisjoint(written_filenames):
+            return written_filenames
+        logged_filenames.difference_update(written_filenames)
+        if logged_filenames:
+            # Keep the logged changes that were not written.
+            _write_write_behind_log(self.write_behind_log_path, [
+                record
+                for record in _read_write_behind_log(self.write_behind_log_path)
+                if record['filename'] in logged_filenames
+            ])
+        else:
+            os.remove(self.write_behind_log_path)
+        return written_filenames
+
+    @property
+    def write_conflicts(self) -> List[str]:
+        """The names of the files whose deferred writes were not flushed
+        because they were modified concurrently."""
+        if not self._deferred_contents:
+            return []
+        return [
+            filename for filename in self._deferred_contents
+            if self.check_journal_modification(filename)
+        ]
+
+    def stop_deferring_writes(self) -> List[str]:
+        """Flushes the deferred writes, and writes subsequent changes
+        immediately.
+
+        :raises JournalModifiedError: If some of the deferred writes could not be
+            flushed because of a conflict, in which case they remain deferred.
+        :returns: The names of the files written.
+        """
+        written_filenames = self.flush_deferred_writes()
+        if self._deferred_contents:
+            raise JournalModifiedError(
+                'Journal files modified concurrently: %s' %
+                ', '.join(map(repr, self._deferred_contents)))
+        self._deferred_contents = None
+        self._use_write_behind_log = False
+        return written_filenames
+
+    def _append_to_write_behind_log(
+            self, change_sets: List[FileChangeSet],
+            results: Dict[str, ApplyFileChangesResult]) -> None:
+        records = []
+        for original_filename, file_change_sets in change_sets:
+            filename, lines = self.get_journal_lines(original_filename)
+            record = {
+                'filename': filename,
+                'change_sets': [[list(line_range), changes]
+                                for line_range, changes in file_change_sets],
+                'result_sha256': _get_contents_hash(
+                    results[original_filename].new_contents),
+            }  # type: Dict[str, Any]
+            if filename not in self._logged_filenames:
+                record['base_sha256'] = _get_contents_hash('\n'.join(lines))
+                self._logged_filenames.add(filename)
+            records.append(json.dumps(record) + '\n')
+        with open(
+                self.write_behind_log_path, 'a', encoding='utf-8',
+                newline='\n') as f:
+            f.write(''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+
     def get_file_change_results(self, change_sets: List[FileChangeSet]
                                 ) -> Dict[str, ApplyFileChangesResult]:
         return {
@@ -479,6 +1026,8 @@ class JournalEditor(object):
 
     def apply_change_sets(self, change_sets: List[FileChangeSet]):
         results = self.get_file_change_results(change_sets)
+        if self._deferred_contents is not None and self._use_write_behind_log:
+            self._append_to_write_behind_log(change_sets, results)
         self.apply_file_change_results(results)
 
     def apply_staged_changes(
@@ -1,4 +1,6 @@
 import datetime
+import json
+import os
 
 import beancount.parser.printer
 from beancount.core.data import Transaction, Posting, EMPTY_SET
@@ -494,3 +496,232 @@ def test_remove_ignored(tmpdir):
   Assets:Account-B
 """)
     check_journal_entries(editor)
+
+
+def _add_test_transactions(editor, journal_path, narrations):
+    for i, narration in enumerate(narrations):
+        stage = editor.stage_changes()
+        stage.add_entry(
+            Transaction(
+                meta=None,
+                date=datetime.date(2015, 4, 1 + i),
+                flag='*',
+                payee=None,
+                narration=narration,
+                tags=EMPTY_SET,
+                links=EMPTY_SET,
+                postings=[
+                    Posting(
+                        account='Assets:Account-A',
+                        units=Amount(Decimal(3), 'USD'),
+                        cost=None,
+                        price=None,
+                        flag=None,
+                        meta=None),
+                    Posting(
+                        account='Assets:Account-B',
+                        units=MISSING,
+                        cost=None,
+                        price=None,
+                        flag=None,
+                        meta=None),
+                ],
+            ), journal_path)
+        stage.apply()
+
+
+deferred_writes_initial_contents = """
+2015-01-01 * "Test transaction 1"
+  Assets:Account-A  100 USD
+  Assets:Account-B
+"""
+
+deferred_writes_final_contents = """
+2015-01-01 * "Test transaction 1"
+  Assets:Account-A  100 USD
+  Assets:Account-B
+
+2015-04-01 * "New transaction"
+  Assets:Account-A  3 USD
+  Assets:Account-B
+
+2015-04-02 * "Another transaction"
+  Assets:Account-A  3 USD
+  Assets:Account-B
+"""
+
+
+def test_deferred_writes(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    editor.defer_writes()
+    _add_test_transactions(editor, journal_path,
+                           ['New transaction', 'Another transaction'])
+    check_file_contents(journal_path, deferred_writes_initial_contents)
+    assert editor.stop_deferring_writes() == [journal_path]
+    assert editor.flush_deferred_writes() == []
+    check_file_contents(journal_path, deferred_writes_final_contents)
+    check_journal_entries(editor)
+    assert not editor.check_any_journal_modification()
+    assert not os.path.exists(editor.write_behind_log_path)
+
+
+def test_write_behind_log(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    editor.defer_writes(write_behind_log=True)
+    _add_test_transactions(editor, journal_path, ['New transaction'])
+    assert editor.has_deferred_writes
+    assert editor.flush_deferred_writes() == [journal_path]
+    assert not os.path.exists(editor.write_behind_log_path)
+    # Writes remain deferred after a flush.
+    _add_test_transactions(editor, journal_path, ['Another transaction'])
+    check_file_contents(
+        journal_path, """
+2015-01-01 * "Test transaction 1"
+  Assets:Account-A  100 USD
+  Assets:Account-B
+
+2015-04-01 * "New transaction"
+  Assets:Account-A  3 USD
+  Assets:Account-B
+""")
+    assert os.path.exists(editor.write_behind_log_path)
+
+
+def test_write_behind_log_replay(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    editor.defer_writes(write_behind_log=True)
+    _add_test_transactions(editor, journal_path,
+                           ['New transaction', 'Another transaction'])
+    check_file_contents(journal_path, deferred_writes_initial_contents)
+    # Simulate a crash that truncated the final record.
+    with open(editor.write_behind_log_path, 'a') as f:
+        f.write('{"filename": ')
+    editor = journal_editor.JournalEditor(journal_path)
+    check_file_contents(journal_path, deferred_writes_final_contents)
+    check_journal_entries(editor)
+    assert not os.path.exists(editor.write_behind_log_path)
+
+
+def test_write_behind_log_replay_written(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    editor.defer_writes(write_behind_log=True)
+    _add_test_transactions(editor, journal_path,
+                           ['New transaction', 'Another transaction'])
+    with open(editor.write_behind_log_path, 'r') as f:
+        log_contents = f.read()
+    assert editor.flush_deferred_writes() == [journal_path]
+    # Simulate a crash after the file was written, but before the log was
+    # removed.
+    with open(editor.write_behind_log_path, 'w') as f:
+        f.write(log_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    check_file_contents(journal_path, deferred_writes_final_contents)
+    check_journal_entries(editor)
+    assert not os.path.exists(editor.write_behind_log_path)
+    assert not os.path.exists(editor.write_behind_log_path +
+                              journal_editor.WRITE_BEHIND_CONFLICTS_SUFFIX)
+    assert _get_write_behind_log_errors(editor) == []
+
+
+def _modify_file(path, contents):
+    """Writes `path` with a modification time later than its load time."""
+    mtime = os.stat(path).st_mtime
+    with open(path, 'w') as f:
+        f.write(contents)
+    os.utime(path, (mtime + 10, mtime + 10))
+
+
+def _get_logged_filenames(log_path):
+    with open(log_path, 'r') as f:
+        return [json.loads(line)['filename'] for line in f]
+
+
+def _get_write_behind_log_errors(editor):
+    return [
+        e for e in editor.errors
+        if isinstance(e, journal_editor.WriteBehindLogError)
+    ]
+
+
+def test_write_behind_log_replay_modified(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    editor.defer_writes(write_behind_log=True)
+    _add_test_transactions(editor, journal_path, ['New transaction'])
+    modified_contents = deferred_writes_initial_contents + '\n; comment\n'
+    with open(journal_path, 'w') as f:
+        f.write(modified_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    check_file_contents(journal_path, modified_contents)
+    assert not os.path.exists(editor.write_behind_log_path)
+    # The changes that were not replayed are kept, and reported as an error.
+    conflicts_path = (editor.write_behind_log_path +
+                      journal_editor.WRITE_BEHIND_CONFLICTS_SUFFIX)
+    assert _get_logged_filenames(conflicts_path) == [journal_path]
+    errors = _get_write_behind_log_errors(editor)
+    assert len(errors) == 1
+    assert errors[0].source['filename'] == conflicts_path
+    assert journal_path in errors[0].message
+    # The error is reported until the conflicts log is removed.
+    editor = journal_editor.JournalEditor(journal_path)
+    assert len(_get_write_behind_log_errors(editor)) == 1
+    os.remove(conflicts_path)
+    editor = journal_editor.JournalEditor(journal_path)
+    assert _get_write_behind_log_errors(editor) == []
+
+
+def test_write_behind_log_flush_modified(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    editor = journal_editor.JournalEditor(journal_path)
+    editor.defer_writes(write_behind_log=True)
+    _add_test_transactions(editor, journal_path, ['New transaction'])
+    modified_contents = deferred_writes_initial_contents + '\n; comment\n'
+    _modify_file(journal_path, modified_contents)
+    assert editor.flush_deferred_writes() == []
+    check_file_contents(journal_path, modified_contents)
+    assert editor.write_conflicts == [journal_path]
+    assert editor.has_deferred_writes
+    assert _get_logged_filenames(
+        editor.write_behind_log_path) == [journal_path]
+    # The deferred changes cannot be applied to the reloaded file.
+    assert editor.reload_modified_files([journal_path]) is None
+    with pytest.raises(journal_editor.JournalModifiedError):
+        editor.stop_deferring_writes()
+    assert editor.has_deferred_writes
+    check_file_contents(journal_path, modified_contents)
+
+    editor = journal_editor.JournalEditor(journal_path)
+    check_file_contents(journal_path, modified_contents)
+    assert len(_get_write_behind_log_errors(editor)) == 1
+
+
+def test_write_behind_log_partial_flush(tmpdir):
+    journal_path = create_journal(tmpdir, deferred_writes_initial_contents)
+    ignored_path = create_journal(
+        tmpdir, deferred_writes_initial_contents, name='ignored.beancount')
+    editor = journal_editor.JournalEditor(journal_path, ignored_path)
+    editor.defer_writes(write_behind_log=True)
+    _add_test_transactions(editor, journal_path, ['New transaction'])
+    _add_test_transactions(editor, ignored_path, ['Another transaction'])
+    modified_contents = deferred_writes_initial_contents + '\n; comment\n'
+    _modify_file(ignored_path, modified_contents)
+    assert editor.flush_deferred_writes() == [journal_path]
+    check_file_contents(
+        journal_path, """
+2015-01-01 * "Test transaction 1"
+  Assets:Account-A  100 USD
+  Assets:Account-B
+
+2015-04-01 * "New transaction"
+  Assets:Account-A  3 USD
+  Assets:Account-B
+""")
+    check_file_contents(ignored_path, modified_contents)
+    assert editor.write_conflicts == [ignored_path]
+    # Only the changes that were not written remain in the log.
+    assert _get_logged_filenames(
+        editor.write_behind_log_path) == [ignored_path]
@@ -120,9 +120,18 @@ set.  The resulting sum must equal 0 within a small tolerance.
 
 """
 
+import bisect
 import datetime
 import collections
+import concurrent.futures
+import contextlib
+import decimal
+import heapq
 import itertools
+import logging
+import multiprocessing
+import operator
+import time
 from typing import Sequence, Tuple, List, NamedTuple, Dict, Callable, Optional, Iterable, Set, cast, FrozenSet, Union, Any
 
 from beancount.core.number import MISSING, ZERO, Decimal
@@ -133,6 +142,8 @@ from beancount.parser import booking_full
 import beancount.parser.printer
 
 from .journal_editor import META_IGNORE
+from . import fixed_point
+from . import subset_sum
 from .sorted_list import SortedList
 from .posting_date import get_posting_date, POSTING_DATE_KEY, POSTING_TRANSACTION_DATE_KEY
 
@@ -154,7 +165,8 @@ WeightedPosting = NamedTuple('WeightedPosting', [('posting', Posting),
 MatchablePosting = NamedTuple('MatchablePosting',
                               [('posting', Posting),
                                ('weight', Amount),
-                               ('source_postings', Sequence[Posting])])
+                               ('source_postings', Sequence[Posting]),
+                               ('scaled_weight', fixed_point.ScaledNumber)])
 MatchablePostings = Sequence[MatchablePosting]
 PostingMatch = Tuple[MatchablePosting, MatchablePosting]
 PostingMatches = List[PostingMatch]
@@ -167,7 +179,9 @@ PostingMatchSet = NamedTuple('PostingMatchSet',
                              [('matches', PostingMatches),
                               ('removals', MatchablePostings)])
 
-SingleSignMatchGroup = List[Tuple[Decimal, PostingMatchSet]]
+# Each match set is paired with its total weight, as an integer at the scale
+# used by `compute_balanced_match_group`.
+SingleSignMatchGroup = List[Tuple[int, PostingMatchSet]]
 BothSignMatchGroup = Tuple[SingleSignMatchGroup, SingleSignMatchGroup]
 
 SingleSignMatchGroups = NamedTuple(
@@ -202,10 +216,6 @@ def _date_key(entry: Transaction, mp: MatchablePosting):
     return get_posting_date(entry, mp.posting)
 
 
-def _entry_and_posting_ids_key(entry: Transaction, mp: MatchablePosting):
-    return (id(entry), ) + tuple(id(p) for p in mp.source_postings)
-
-
 # Key used for querying postings by date.
 DatabaseDateKey = datetime.date
 
@@ -213,25 +223,483 @@ DatabaseDateKey = datetime.date
 # account, key, value
 DatabaseMetadataKey = Tuple[str, str, Any]
 
+# The number assigned to the transaction by `PostingDatabase`, followed by the
+# positions of the source postings within the transaction.
 SourcePostingIds = Tuple[int, ...]
 
-# Keyed by the sequence of source_posting ids.
+# Keyed by the source posting ids.
 DatabaseValues = Dict[SourcePostingIds, Tuple[Transaction, MatchablePosting]]
 
 CHECK_KEY = 'check'
 
+
+def _get_account_index_key(account: str) -> Optional[str]:
+    """Returns the account bucket used by `PostingDatabase`.
+
+    All unknown accounts share a single bucket, represented by `None`, since
+    they are mergeable with any account.
+    """
+    if is_unknown_account(account):
+        return None
+    return account
+
+
+# Key of a bucket of the `PostingDatabase` index: either an `(account,
+# currency)` key, as returned by `_get_account_index_key`, or a currency.
+DatabaseIndexKey = Union[Tuple[Optional[str], str], str]
+
+# Entry in the `PostingDatabase` index: (date, sequence_number,
+# source_posting_ids, transaction, matchable_posting).  The sequence number
+# records the order in which postings were added.
+DatabaseRecord = Tuple[datetime.date, int, SourcePostingIds, Transaction,
+                       MatchablePosting]
+
+
+class _DateIndex(object):
+    """Collection of postings within a single index bucket.
+
+    The postings are ordered by date, and the postings for each date are ordered
+    by weight, so that a lookup is a range query over both.
+    """
+
+    def __init__(self) -> None:
+        # Sorted list of the dates for which `days` is non-empty.
+        self.dates = []  # type: List[datetime.date]
+        self.days = {}  # type: Dict[datetime.date, SortedList[Decimal, DatabaseRecord]]
+        # Incremented whenever a posting is added or removed.
+        self.version = 0
+        # Value of `version` after the most recent change to each date.
+        self.date_versions = {}  # type: Dict[datetime.date, int]
+
+    def _touch(self, date: datetime.date) -> None:
+        self.version += 1
+        self.date_versions[date] = self.version
+
+    def add(self, record: DatabaseRecord) -> None:
+        date = record[0]
+        day = self.days.get(date)
+        if day is None:
+            day = self.days[date] = SortedList(())
+            bisect.insort(self.dates, date)
+        day.add(record[4].weight.number, record)
+        self._touch(date)
+
+    def remove(self, record: DatabaseRecord) -> None:
+        date = record[0]
+        day = self.days.get(date)
+        if day is None:
+            return
+        if day.remove(record[4].weight.number, record):
+            self._touch(date)
+        if not day:
+            del self.days[date]
+            del self.dates[bisect.bisect_left(self.dates, date)]
+
+    def find(self, min_date: datetime.date, max_date: datetime.date,
+             lower_bound: Decimal,
+             upper_bound: Decimal) -> Iterable[DatabaseRecord]:
+        """Yields the postings with a date in `[min_date, max_date]` and a weight
+        in `[lower_bound, upper_bound]`."""
+        dates = self.dates
+        begin = bisect.bisect_left(dates, min_date)
+        end = bisect.bisect_right(dates, max_date)
+        days = self.days
+        for i in range(begin, end):
+            yield from days[dates[i]].find(lower_bound, upper_bound)
+
+    def is_unchanged_since(self, version: int, min_date: datetime.date,
+                           max_date: datetime.date) -> bool:
+        """Returns `True` if no posting with a date in `[min_date, max_date]` has
+        been added or removed since `self.version` was equal to `version`."""
+        if self.version == version:
+            return True
+        date_versions = self.date_versions
+        date = min_date
+        one_day = datetime.timedelta(days=1)
+        while date <= max_date:
+            if date_versions.get(date, 0) > version:
+                return False
+            date += one_day
+        return True
+
+
+class LookupDependencies(object):
+    """Records the parts of a `PostingDatabase` consulted by lookups.
+
+    Used by `MatchResultCache` to determine whether a cached result may have
+    been affected by subsequent changes to the database.
+
+    Index buckets are recorded by key, along with their version, which is 0 if
+    the bucket did not exist.  Since buckets are never removed, a bucket
+    created after the lookup is compared against version 0.
+    """
+
+    def __init__(self) -> None:
+        self.indices = {
+        }  # type: Dict[Tuple[DatabaseIndexKey, datetime.date, datetime.date], int]
+        self.metadata = {}  # type: Dict[DatabaseMetadataKey, int]
+
+    def add_index(self, key: DatabaseIndexKey, index: Optional[_DateIndex],
+                  min_date: datetime.date, max_date: datetime.date) -> None:
+        self.indices.setdefault((key, min_date, max_date),
+                                0 if index is None else index.version)
+
+    def add_metadata(self, key: DatabaseMetadataKey, version: int) -> None:
+        self.metadata.setdefault(key, version)
+
+    def update(self, other: 'LookupDependencies') -> None:
+        for key, value in other.indices.items():
+            self.indices.setdefault(key, value)
+        for metadata_key, version in other.metadata.items():
+            self.metadata.setdefault(metadata_key, version)
+
+    def is_valid(self, posting_db: 'PostingDatabase') -> bool:
+        """Returns `True` if the recorded lookups would still give the same
+        results."""
+        for (index_key, min_date,
+             max_date), version in self.indices.items():
+            index = posting_db.get_index(index_key)
+            if index is None:
+                continue
+            if not index.is_unchanged_since(version, min_date, max_date):
+                return False
+        for key, version in self.metadata.items():
+            if posting_db.get_metadata_version(key) != version:
+                return False
+        return True
+
+
+class MatchingMetrics(object):
+    """Counters describing the work done by `get_extended_transactions`.
+
+    An instance may be passed to `get_extended_transactions` to accumulate
+    counts over one or more calls.
+
+    :ivar states_visited: Number of distinct merged transaction states visited
+        by the depth-first search.
+    :ivar cached_results: Number of calls answered by the `MatchResultCache`.
+    :ivar lookups: Number of `PostingDatabase.get_posting_matches` calls.
+    :ivar lookup_candidates: Number of postings within the fuzzy date and
+        amount ranges of a lookup, before the exact checks.
+    :ivar lookup_matches: Number of postings returned by the index lookups.
+    :ivar aggregate_subsets: Number of aggregate posting candidates generated.
+    :ivar match_sets: Number of balanced match sets produced.
+    :ivar dominated_match_sets: Number of balanced match sets removed by
+        `filter_dominated_match_sets`.
+    :ivar phase_seconds: Maps each phase (`lookup`, `combine`, and `total`) to
+        the time spent in it.
+    """
+
+    def __init__(self) -> None:
+        self.states_visited = 0
+        self.cached_results = 0
+        self.lookups = 0
+        self.lookup_candidates = 0
+        self.lookup_matches = 0
+        self.aggregate_subsets = 0
+        self.match_sets = 0
+        self.dominated_match_sets = 0
+        self.phase_seconds = collections.OrderedDict(
+            (phase, 0.0)
+            for phase in ('lookup', 'combine', 'total'))  # type: Dict[str, float]
+
+    @contextlib.contextmanager
+    def time_phase(self, phase: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[phase] += time.perf_counter() - start_time
+
+    def update(self, other: 'MatchingMetrics') -> None:
+        """Adds the counts of `other` to this object."""
+        for key, value in vars(other).items():
+            if key != 'phase_seconds':
+                setattr(self, key, getattr(self, key) + value)
+        for phase, seconds in other.phase_seconds.items():
+            self.phase_seconds[phase] += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = collections.OrderedDict(
+            (key, value) for key, value in vars(self).items()
+            if key != 'phase_seconds')  # type: Dict[str, Any]
+        result['phase_seconds'] = dict(self.phase_seconds)
+        return result
+
+    def __str__(self) -> str:
+        return ', '.join(
+            ['%s=%d' % (key, value) for key, value in vars(self).items()
+             if key != 'phase_seconds'] +
+            ['%s=%.4fs' % (phase, seconds)
+             for phase, seconds in self.phase_seconds.items()])
+
+
+@contextlib.contextmanager
+def _time_phase(metrics: Optional[MatchingMetrics], phase: str):
+    """Records the time spent in `phase` if `metrics` is not `None`."""
+    if metrics is None:
+        yield
+        return
+    with metrics.time_phase(phase):
+        yield
+
+
+class MatchablePostingsCache(object):
+    """Caches the matchable postings of transactions in a `PostingDatabase`.
+
+    Computing the matchable postings of a transaction requires enumerating the
+    aggregate posting candidates, which is expensive for transactions with many
+    unknown postings.  Results are keyed by transaction identity and by
+    `cleared_version`, which must be incremented (by calling `invalidate`)
+    whenever the `is_cleared` function may return different results.
+
+    The `hits` and `misses` counters record the effectiveness of the cache.
+    """
+
+    def __init__(self,
+                 is_cleared: IsClearedFunction,
+                 max_aggregate_candidates: Optional[int] = None) -> None:
+        self.is_cleared = is_cleared
+        self.max_aggregate_candidates = max_aggregate_candidates
+        self.cleared_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = {
+        }  # type: Dict[int, Tuple[Transaction, int, List[MatchablePosting]]]
+
+    def _lookup(self, transaction: Transaction
+                ) -> Optional[Tuple[Transaction, int, List[MatchablePosting]]]:
+        cached = self._cache.get(id(transaction))
+        if cached is None or cached[0] is not transaction:
+            return None
+        return cached
+
+    def get(self,
+            transaction: Transaction,
+            metrics: Optional[MatchingMetrics] = None
+    ) -> List[MatchablePosting]:
+        """Returns the matchable postings of `transaction`.
+
+        The result is computed if `transaction` is not in the cache, but is only
+        stored by `add`.
+        """
+        cached = self._lookup(transaction)
+        if cached is not None and cached[1] == self.cleared_version:
+            self.hits += 1
+            return cached[2]
+        self.misses += 1
+        matchable_postings = list(
+            get_matchable_postings_from_transaction(
+                transaction,
+                self.is_cleared,
+                max_aggregate_candidates=self.max_aggregate_candidates))
+        if metrics is not None:
+            metrics.aggregate_subsets += sum(
+                1 for mp in matchable_postings if len(mp.source_postings) > 1)
+        return matchable_postings
+
+    def add(self, transaction: Transaction) -> List[MatchablePosting]:
+        """Returns the matchable postings of `transaction` and stores them."""
+        matchable_postings = self.get(transaction)
+        self._cache[id(transaction)] = (transaction, self.cleared_version,
+                                        matchable_postings)
+        return matchable_postings
+
+    def pop(self, transaction: Transaction) -> List[MatchablePosting]:
+        """Removes `transaction` from the cache.
+
+        :returns: The matchable postings stored by `add`, even if they have
+            since been invalidated, so that the caller can remove exactly the
+            postings that it previously added.
+        """
+        cached = self._lookup(transaction)
+        if cached is None:
+            return self.get(transaction)
+        del self._cache[id(transaction)]
+        self.hits += 1
+        return cached[2]
+
+    def invalidate(self, transaction: Optional[Transaction] = None) -> None:
+        """Invalidates the cached result for `transaction`, or all cached
+        results if `transaction` is `None`."""
+        if transaction is None:
+            self.cleared_version += 1
+            return
+        cached = self._lookup(transaction)
+        if cached is not None:
+            self._cache[id(transaction)] = (transaction, -1, cached[2])
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Object ids are not preserved by pickling.
+        self._cache = {id(cached[0]): cached for cached in self._cache.values()}
+
+
+class MatchResultCache(object):
+    """Caches the results of `get_extended_transactions`.
+
+    Results are keyed by transaction identity and by the `cleared_version` of
+    the `MatchablePostingsCache`.  Each result is stored with the
+    `LookupDependencies` of the search that produced it, and is discarded once
+    a posting is added to or removed from one of the consulted date ranges of
+    the database.
+
+    The `hits` and `misses` counters record the effectiveness of the cache.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict(
+        )  # type: Dict[int, Tuple[Transaction, int, LookupDependencies, List[MergedTransaction]]]
+
+    def get(self, transaction: Transaction,
+            posting_db: 'PostingDatabase'
+            ) -> Optional[List['MergedTransaction']]:
+        """Returns the cached results for `transaction`, or `None`."""
+        cached = self._cache.get(id(transaction))
+        if (cached is None or cached[0] is not transaction or
+                cached[1] != posting_db.matchable_postings_cache.cleared_version
+                or not cached[2].is_valid(posting_db)):
+            self.misses += 1
+            return None
+        self._cache.move_to_end(id(transaction))  # type: ignore
+        self.hits += 1
+        return cached[3]
+
+    def put(self, transaction: Transaction, posting_db: 'PostingDatabase',
+            dependencies: LookupDependencies,
+            results: List['MergedTransaction']) -> None:
+        self._cache[id(transaction)] = (
+            transaction, posting_db.matchable_postings_cache.cleared_version,
+            dependencies, results)
+        self._cache.move_to_end(id(transaction))  # type: ignore
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)  # type: ignore
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The results are not saved, since they are keyed by object id.
+        state = self.__dict__.copy()
+        state['_cache'] = collections.OrderedDict()
+        return state
+
+
+def _get_posting_positions(transaction: Transaction) -> Dict[int, int]:
+    return {id(p): i for i, p in enumerate(transaction.postings)}
+
+
 class PostingDatabase(object):
+    """Database of matchable postings, indexed for `get_posting_matches`.
+
+    Postings are indexed by `(account, currency)`, where all unknown accounts
+    share a single bucket, as well as by currency alone.  Each bucket is ordered
+    by date and then by weight, so that a lookup only visits postings with a
+    compatible account and currency within the fuzzy date and amount ranges.
+    """
+
     def __init__(self, fuzzy_match_days: int,
                  fuzzy_match_amount: Decimal,
                  is_cleared: IsClearedFunction,
-                 metadata_keys=frozenset()) -> None:
+                 metadata_keys=frozenset(),
+                 max_aggregate_posting_candidates: Optional[int] = None) -> None:
         self.fuzzy_match_days = fuzzy_match_days
         self.fuzzy_match_amount = fuzzy_match_amount
+        # `fuzzy_match_amount` may also be specified as an `int` or `float`.
+        self._fuzzy_match_amount_decimal = Decimal(fuzzy_match_amount)
         self.is_cleared = is_cleared
-        self._postings = {}  # type: Dict[DatabaseDateKey, DatabaseValues]
+        self._account_index = {
+        }  # type: Dict[Tuple[Optional[str], str], _DateIndex]
+        self._currency_index = {}  # type: Dict[str, _DateIndex]
+        # Insertion order of each posting, used to order lookup results
+        # deterministically when they are gathered from multiple buckets.
+        self._sequence_numbers = {}  # type: Dict[SourcePostingIds, int]
+        self._next_sequence_number = 0
         self._keyed_postings = {
         }  # type: Dict[DatabaseMetadataKey, DatabaseValues]
         self.metadata_keys = metadata_keys
+        self.matchable_postings_cache = MatchablePostingsCache(
+            is_cleared,
+            max_aggregate_candidates=max_aggregate_posting_candidates)
+        self.match_result_cache = MatchResultCache()
+        self._metadata_versions = {}  # type: Dict[DatabaseMetadataKey, int]
+        self._lookup_dependencies = None  # type: Optional[LookupDependencies]
+        self._merge_fingerprints = {
+        }  # type: Dict[int, Tuple[Transaction, TransactionMergeFingerprint]]
+        # Dense number assigned to each transaction when it is added, and the
+        # positions of its postings, keyed by `id(transaction)`.  Postings are
+        # keyed, and transactions excluded from matches, by these numbers and
+        # positions rather than by object ids.
+        self._transaction_numbers = {
+        }  # type: Dict[int, Tuple[Transaction, int, Dict[int, int]]]
+        self._next_transaction_number = 0
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restores the pickled state, recomputing the keys derived from
+        object ids, which are not preserved by pickling."""
+        self.__dict__.update(state)
+        self._merge_fingerprints = {
+            id(cached[0]): cached
+            for cached in self._merge_fingerprints.values()
+        }
+        self._transaction_numbers = {
+            id(transaction): (transaction, transaction_number,
+                              _get_posting_positions(transaction))
+            for transaction, transaction_number, _ in
+            self._transaction_numbers.values()
+        }
+
+    def get_transaction_number(self,
+                               transaction: Transaction) -> Optional[int]:
+        """Returns the number assigned to `transaction` when it was added, or
+        `None` if it is not in the database."""
+        numbered = self._transaction_numbers.get(id(transaction))
+        if numbered is None or numbered[0] is not transaction:
+            return None
+        return numbered[1]
+
+    def _get_source_posting_ids(self, entry: Transaction, mp: MatchablePosting,
+                                add: bool) -> Optional[SourcePostingIds]:
+        """Returns the key of `mp` in the database, or `None` if `entry` was not
+        added to it.
+
+        :param add: If `True`, `entry` is assigned a number if it does not have
+            one yet.
+        """
+        numbered = self._transaction_numbers.get(id(entry))
+        if numbered is None or numbered[0] is not entry:
+            if not add:
+                return None
+            numbered = (entry, self._next_transaction_number,
+                        _get_posting_positions(entry))
+            self._next_transaction_number += 1
+            self._transaction_numbers[id(entry)] = numbered
+        positions = numbered[2]
+        return (numbered[1], ) + tuple(
+            positions[id(p)] for p in mp.source_postings)
+
+    def get_metadata_version(self, key: DatabaseMetadataKey) -> int:
+        return self._metadata_versions.get(key, 0)
+
+    def _touch_metadata(self, key: DatabaseMetadataKey) -> None:
+        self._metadata_versions[key] = self.get_metadata_version(key) + 1
+
+    @contextlib.contextmanager
+    def record_lookups(self):
+        """Context manager that yields a `LookupDependencies` object recording
+        the parts of the database consulted by `get_posting_matches`."""
+        outer_dependencies = self._lookup_dependencies
+        dependencies = LookupDependencies()
+        self._lookup_dependencies = dependencies
+        try:
+            yield dependencies
+        finally:
+            self._lookup_dependencies = outer_dependencies
+            if outer_dependencies is not None:
+                outer_dependencies.update(dependencies)
 
     def get_fuzzy_date_range(self, orig_date: datetime.date):
         for day_offset in range(-self.fuzzy_match_days,
@@ -239,7 +707,8 @@ class PostingDatabase(object):
             yield orig_date + datetime.timedelta(days=day_offset)
 
     def add_posting(self, entry: Transaction, mp: MatchablePosting):
-        source_posting_ids = _entry_and_posting_ids_key(entry, mp)
+        source_posting_ids = self._get_source_posting_ids(entry, mp, add=True)
+        assert source_posting_ids is not None
 
         meta = mp.posting.meta
         account = mp.posting.account
@@ -249,17 +718,51 @@ class PostingDatabase(object):
                 if value is None: continue
                 group = self._keyed_postings.setdefault((account, key, value), {})
                 group[source_posting_ids] = (entry, mp)
+                self._touch_metadata((account, key, value))
 
-        group = self._postings.setdefault(_date_key(entry, mp), {})
-        group[source_posting_ids] = (entry, mp)
+        sequence_number = self._sequence_numbers.get(source_posting_ids)
+        if sequence_number is None:
+            sequence_number = self._next_sequence_number
+            self._next_sequence_number += 1
+        else:
+            # Replace the existing posting, retaining its position.
+            self._remove_from_indices(entry, mp, source_posting_ids)
+        self._sequence_numbers[source_posting_ids] = sequence_number
+        record = (_date_key(entry, mp), sequence_number, source_posting_ids,
+                  entry, mp)  # type: DatabaseRecord
+        currency = mp.weight.currency
+        self._get_account_index((_get_account_index_key(account),
+                                 currency)).add(record)
+        self._get_currency_index(currency).add(record)
+
+    def get_matchable_postings(
+            self,
+            transaction: Transaction,
+            metrics: Optional[MatchingMetrics] = None
+    ) -> List[MatchablePosting]:
+        """Returns the matchable postings of `transaction`, using the cached
+        result if `transaction` was added to the database."""
+        return self.matchable_postings_cache.get(transaction, metrics=metrics)
+
+    def get_merge_fingerprint(
+            self, transaction: Transaction) -> 'TransactionMergeFingerprint':
+        """Returns the merge fingerprint of `transaction`, using the precomputed
+        result if `transaction` was added to the database."""
+        cached = self._merge_fingerprints.get(id(transaction))
+        if cached is not None and cached[0] is transaction:
+            return cached[1]
+        return get_transaction_merge_fingerprint(transaction)
 
     def add_transaction(self, transaction: Transaction):
-        for mp in get_matchable_postings_from_transaction(
-                transaction, self.is_cleared):
+        self._merge_fingerprints[id(transaction)] = (
+            transaction, get_transaction_merge_fingerprint(transaction))
+        for mp in self.matchable_postings_cache.add(transaction):
             self.add_posting(transaction, mp)
 
     def remove_posting(self, entry: Transaction, mp: MatchablePosting):
-        source_posting_ids = _entry_and_posting_ids_key(entry, mp)
+        source_posting_ids = self._get_source_posting_ids(entry, mp, add=False)
+        if source_posting_ids is None:
+            return
 
         meta = mp.posting.meta
         account = mp.posting.account
@@ -268,22 +771,60 @@ class PostingDatabase(object):
                 value = meta.get(key)
                 if value is None: continue
                 group = self._keyed_postings.get((account, key, value))
-                if group is not None:
-                    group.pop(source_posting_ids, None)
+                if (group is not None and
+                        group.pop(source_posting_ids, None) is not None):
+                    self._touch_metadata((account, key, value))
 
-        group = self._postings.get(_date_key(entry, mp))
-        if group is not None:
-            group.pop(source_posting_ids, None)
+        self._remove_from_indices(entry, mp, source_posting_ids)
+        self._sequence_numbers.pop(source_posting_ids, None)
+
+    def _remove_from_indices(self, entry: Transaction, mp: MatchablePosting,
+                             source_posting_ids: SourcePostingIds) -> None:
+        sequence_number = self._sequence_numbers.get(source_posting_ids)
+        if sequence_number is None:
+            return
+        record = (_date_key(entry, mp), sequence_number, source_posting_ids,
+                  entry, mp)  # type: DatabaseRecord
+        currency = mp.weight.currency
+        account_index = self._account_index.get(
+            (_get_account_index_key(mp.posting.account), currency))
+        if account_index is not None:
+            account_index.remove(record)
+        currency_index = self._currency_index.get(currency)
+        if currency_index is not None:
+            currency_index.remove(record)
 
     def remove_transaction(self, transaction: Transaction):
-        for mp in get_matchable_postings_from_transaction(
-                transaction, self.is_cleared):
+        cached = self._merge_fingerprints.get(id(transaction))
+        if cached is not None and cached[0] is transaction:
+            del self._merge_fingerprints[id(transaction)]
+        for mp in self.matchable_postings_cache.pop(transaction):
             self.remove_posting(transaction, mp)
+        if self.get_transaction_number(transaction) is not None:
+            del self._transaction_numbers[id(transaction)]
 
-    def get_posting_matches(self,
-                            entry: Transaction,
-                            posting: Posting,
-                            negate=False) -> List[Tuple[Transaction, MatchablePosting]]:
+    def get_posting_matches(
+            self,
+            entry: Transaction,
+            posting: Posting,
+            negate=False,
+            metrics: Optional[MatchingMetrics] = None
+    ) -> List[Tuple[Transaction, MatchablePosting]]:
+        return [(matching_transaction, mp)
+                for _, matching_transaction, mp in
+                self.get_numbered_posting_matches(
+                    entry, posting, negate=negate, metrics=metrics)]
+
+    def get_numbered_posting_matches(
+            self,
+            entry: Transaction,
+            posting: Posting,
+            negate=False,
+            metrics: Optional[MatchingMetrics] = None
+    ) -> List[Tuple[int, Transaction, MatchablePosting]]:
+        """Returns the results of `get_posting_matches`, each preceded by the
+        number of the matching transaction, as returned by
+        `get_transaction_number`."""
         posting_date = posting.meta and posting.meta.get(POSTING_DATE_KEY)
         is_date_exact = posting_date is not None
         date = (posting_date or
@@ -294,11 +835,14 @@ class PostingDatabase(object):
             return []
         if negate:
             weight = -weight
+        if metrics is not None:
+            metrics.lookups += 1
         matches_dict = self._get_matches(
             account=posting.account,
             date=date,
             amount=weight,
-            is_date_exact=is_date_exact)
+            is_date_exact=is_date_exact,
+            metrics=metrics)
         if not negate and not is_unknown_account(posting.account):
             meta = posting.meta
             if meta:
@@ -306,34 +850,106 @@ class PostingDatabase(object):
                 for key in self.metadata_keys:
                     value = meta.get(key)
                     if value is None: continue
+                    metadata_key = (posting.account, key, value)
+                    if self._lookup_dependencies is not None:
+                        self._lookup_dependencies.add_metadata(
+                            metadata_key,
+                            self.get_metadata_version(metadata_key))
                     cur_matches = self._get_weight_matches(
-                        weight, self._keyed_postings.get((posting.account, key, value)))
+                        weight, self._keyed_postings.get(metadata_key))
                     if cur_matches is not None:
                         matches_dict.update(cur_matches)
-        return sorted(matches_dict.values(), key=lambda x: get_posting_date(x[0], x[1].posting))
-
-    def _get_matches(
-            self, account: str, date: datetime.date, amount: Amount,
-            is_date_exact: bool) -> DatabaseValues:
-        matches = dict() # type: DatabaseValues
-        for adjusted_date in self.get_fuzzy_date_range(date):
-            cur_matches = self._postings.get(adjusted_date)
-            if cur_matches is not None:
-                for key, (entry, mp) in cur_matches.items():
+        return sorted(
+            ((source_posting_ids[0], matching_transaction, mp)
+             for source_posting_ids, (matching_transaction, mp)
+             in matches_dict.items()),
+            key=lambda x: get_posting_date(x[1], x[2].posting))
+
+    def _get_candidate_index_keys(self, account: str,
+                                  currency: str) -> List[DatabaseIndexKey]:
+        """Returns the keys of the index buckets containing postings that may be
+        merged with a posting in `account` with a weight in `currency`."""
+        if is_unknown_account(account):
+            return [currency]
+        return [(account, currency), (None, currency)]
+
+    def get_index(self, key: DatabaseIndexKey) -> Optional[_DateIndex]:
+        """Returns the index bucket with the specified key, or `None` if no
+        posting was ever added to it."""
+        if isinstance(key, str):
+            return self._currency_index.get(key)
+        return self._account_index.get(key)
+
+    def _get_account_index(self, key: Tuple[Optional[str], str]) -> _DateIndex:
+        index = self._account_index.get(key)
+        if index is None:
+            index = self._account_index[key] = _DateIndex()
+        return index
+
+    def _get_currency_index(self, currency: str) -> _DateIndex:
+        index = self._currency_index.get(currency)
+        if index is None:
+            index = self._currency_index[currency] = _DateIndex()
+        return index
+
+    def _get_amount_bounds(self, number: Decimal) -> Tuple[Decimal, Decimal]:
+        """Returns bounds on the weights within `fuzzy_match_amount` of
+        `number`.
+
+        The bounds are rounded outwards, so that they never exclude a match.
+        """
+        with decimal.localcontext() as ctx:
+            ctx.rounding = decimal.ROUND_FLOOR
+            lower_bound = number - self._fuzzy_match_amount_decimal
+            ctx.rounding = decimal.ROUND_CEILING
+            upper_bound = number + self._fuzzy_match_amount_decimal
+        return lower_bound, upper_bound
+
+    def _get_matches(self,
+                     account: str,
+                     date: datetime.date,
+                     amount: Amount,
+                     is_date_exact: bool,
+                     metrics: Optional[MatchingMetrics] = None
+                     ) -> DatabaseValues:
+        delta = datetime.timedelta(days=self.fuzzy_match_days)
+        number = amount.number
+        fuzzy_match_amount = self.fuzzy_match_amount
+        lower_bound, upper_bound = self._get_amount_bounds(number)
+        records = []  # type: List[DatabaseRecord]
+        min_date = date - delta
+        max_date = date + delta
+        lookup_dependencies = self._lookup_dependencies
+        num_candidates = 0
+        for key in self._get_candidate_index_keys(account, amount.currency):
+            index = self.get_index(key)
+            if lookup_dependencies is not None:
+                lookup_dependencies.add_index(key, index, min_date, max_date)
+            if index is None:
+                continue
+            for record in index.find(min_date, max_date, lower_bound,
+                                     upper_bound):
+                num_candidates += 1
+                mp = record[4]
+                # Verify that the weight is compatible.
+                if abs(mp.weight.number - number) > fuzzy_match_amount:
+                    continue
+
+                # Verify that the date is compatible.
+                if is_date_exact:
                     posting = mp.posting
-                    # Verify that the account is compatible.
-                    if not are_accounts_mergeable(account, posting.account):
+                    posting_date = posting.meta and posting.meta.get(
+                        POSTING_DATE_KEY)
+                    if posting_date and posting_date != date:
                         continue
 
-                    # Verify that the date is compatible.
-                    if is_date_exact:
-                        posting_date = posting.meta and posting.meta.get(
-                            POSTING_DATE_KEY)
-                        if posting_date and posting_date != date:
-                            continue
-
-                    matches[key] = (entry, mp)
-        return self._get_weight_matches(amount, matches)
+                records.append(record)
+        if metrics is not None:
+            metrics.lookup_candidates += num_candidates
+            metrics.lookup_matches += len(records)
+        # Order by date and then by insertion order.
+        records.sort(key=operator.itemgetter(0, 1))
+        return {key: (entry, mp) for _, _, key, entry, mp in records}
 
     def _get_weight_matches(
             self,
@@ -685,7 +1301,9 @@ def is_mergeable_unknown_account(account: str):
 
 
 def get_aggregate_posting_candidates(
-        postings: Iterable[Posting], is_cleared: IsClearedFunction
+        postings: Iterable[Posting],
+        is_cleared: IsClearedFunction,
+        max_candidates: Optional[int] = None,
 ) -> List[Tuple[Posting, Tuple[Posting, ...]]]:
     """Computes valid subsets of `postings` that may be used for matching.
 
@@ -706,7 +1324,11 @@ def get_aggregate_posting_candidates(
     6. To limit the computational cost, subsets are limited to at most 4
        elements, except that all same-sign maximal subsets are also returned.
 
-    The returned subsets are not, in general, disjoint.
+    7. If `max_candidates` is not `None`, at most `max_candidates` subsets are
+       returned, and a warning is logged if any subsets are omitted.
+
+    The returned subsets are not, in general, disjoint.  The subsets satisfying
+    constraint 5 are computed by `subset_sum.get_nonzero_subsets`.
 
     :returns: The list of pairs of `(effective_posting, source_postings)`, where
         `source_postings` is the list of postings in the subset and
@@ -715,7 +1337,9 @@ def get_aggregate_posting_candidates(
     """
     possible_sets = collections.OrderedDict(
     )  # type: Dict[Tuple[str, str], List[Posting]]
+    num_postings = 0
     for posting in postings:
+        num_postings += 1
         if (posting.price is not None or posting.cost is not None or
                 posting.units is None or posting.units is MISSING):
             continue
@@ -723,12 +1347,9 @@ def get_aggregate_posting_candidates(
             continue
         possible_sets.setdefault((posting.account, posting.units.currency),
                                  []).append(posting)
-    results = []
+    results = []  # type: List[Tuple[Posting, Tuple[Posting, ...]]]
     max_subset_size = 4
-    sum_to_zero = set()  # type: Set[Tuple[int, ...]]
-
-    def posting_set_id(postings):
-        return tuple(id(x) for x in postings)
+    truncated = False
 
     def partition(predicate, postings):
         t = []
@@ -740,16 +1361,8 @@ def get_aggregate_posting_candidates(
                 f.append(p)
         return t, f
 
-    def add_subset(account, currency, subset, check_zero=True):
+    def add_subset(account, currency, subset):
         total = sum(x.units.number for x in subset)
-        if check_zero:
-            if total == ZERO:
-                sum_to_zero.add(posting_set_id(subset))
-                return
-            for subsubset_size in range(2, len(subset)):
-                for subsubset in itertools.combinations(subset, subsubset_size):
-                    if posting_set_id(subsubset) in sum_to_zero:
-                        return
         aggregate_posting = Posting(
             account=account,
             units=Amount(currency=currency, number=total),
@@ -765,11 +1378,25 @@ def get_aggregate_posting_candidates(
         if len(posting_list) > max_subset_size:
             for samesign_list in partition(lambda p: p.units.number > ZERO, posting_list):
                 if len(samesign_list) > max_subset_size:
-                    add_subset(account, currency, samesign_list, check_zero=False)
-        for subset_size in range(
-                2, min(len(posting_list) + 1, max_subset_size + 1)):
-            for subset in itertools.combinations(posting_list, subset_size):
-                add_subset(account, currency, subset)
+                    if max_candidates is not None and len(
+                            results) >= max_candidates:
+                        truncated = True
+                        continue
+                    add_subset(account, currency, samesign_list)
+        limit = None  # type: Optional[int]
+        if max_candidates is not None:
+            limit = max(0, max_candidates - len(results))
+        subsets, group_truncated = subset_sum.get_nonzero_subsets(
+            fixed_point.to_scaled_ints(p.units.number for p in posting_list),
+            max_subset_size=max_subset_size,
+            limit=limit)
+        truncated = truncated or group_truncated
+        for subset in subsets:
+            add_subset(account, currency, [posting_list[i] for i in subset])
+    if truncated:
+        logging.warning(
+            'Limited aggregate posting candidates to %d for transaction with '
+            '%d postings', max_candidates, num_postings)
     return results
 
 
@@ -777,13 +1404,23 @@ def get_match_group_key(weight: Amount) -> MatchGroupKey:
     return MatchGroupKey(weight.currency, weight.number > ZERO)
 
 
+def make_matchable_posting(posting: Posting, weight: Amount,
+                           source_postings: Sequence[Posting]
+                           ) -> MatchablePosting:
+    """Returns a MatchablePosting with `scaled_weight` computed from `weight`."""
+    return MatchablePosting(posting, weight, source_postings,
+                            fixed_point.to_scaled_number(weight.number))
+
+
 def get_weighted_postings(postings: Sequence[Posting]) -> List[WeightedPosting]:
     return [WeightedPosting(p, get_posting_weight(p)) for p in postings]
 
 
 def get_matchable_postings(
         weighted_postings: Sequence[WeightedPosting],
-        is_cleared: IsClearedFunction) -> Iterable[MatchablePosting]:
+        is_cleared: IsClearedFunction,
+        max_aggregate_candidates: Optional[int] = None
+) -> Iterable[MatchablePosting]:
     """Returns the list of all valid MatchablePosting objects.
 
     A MatchablePosting corresponds to a subset of one or more underlying Posting
@@ -798,29 +1435,39 @@ def get_matchable_postings(
     for p, weight in weighted_postings:
         if weight is None:
             continue
-        yield MatchablePosting(p, weight, (p, ))
+        yield make_matchable_posting(p, weight, (p, ))
     for p, all_ps in get_aggregate_posting_candidates(
-        (p for p, _ in weighted_postings), is_cleared):
-        yield MatchablePosting(p, p.units, all_ps)
+        (p for p, _ in weighted_postings), is_cleared,
+            max_candidates=max_aggregate_candidates):
+        yield make_matchable_posting(p, p.units, all_ps)
 
 
-def get_matchable_posting_groups(
-        weighted_postings: Sequence[WeightedPosting],
-        is_cleared: IsClearedFunction
-) -> Dict[MatchGroupKey, List[MatchablePosting]]:
+def group_matchable_postings(matchable_postings: Iterable[MatchablePosting]
+                             ) -> Dict[MatchGroupKey, List[MatchablePosting]]:
     results = collections.OrderedDict(
     )  # type: Dict[MatchGroupKey, List[MatchablePosting]]
-    for mp in get_matchable_postings(weighted_postings, is_cleared):
+    for mp in matchable_postings:
         key = get_match_group_key(mp.weight)
         results.setdefault(key, []).append(mp)
     return results
 
 
+def get_matchable_posting_groups(
+        weighted_postings: Sequence[WeightedPosting],
+        is_cleared: IsClearedFunction
+) -> Dict[MatchGroupKey, List[MatchablePosting]]:
+    return group_matchable_postings(
+        get_matchable_postings(weighted_postings, is_cleared))
+
+
 def get_matchable_postings_from_transaction(
         transaction: Transaction,
-        is_cleared: IsClearedFunction) -> Iterable[MatchablePosting]:
+        is_cleared: IsClearedFunction,
+        max_aggregate_candidates: Optional[int] = None
+) -> Iterable[MatchablePosting]:
     return get_matchable_postings(
-        get_weighted_postings(transaction.postings), is_cleared)
+        get_weighted_postings(transaction.postings), is_cleared,
+        max_aggregate_candidates=max_aggregate_candidates)
 
 
 PostingSpecs = Set[Tuple[str, Amount, Optional[Union[Cost, CostSpec]], Optional[
@@ -869,6 +1516,54 @@ def is_metadata_mergeable(*metas: Optional[Meta]) -> bool:
     return True
 
 
+TransactionMergeFingerprint = NamedTuple(
+    'TransactionMergeFingerprint',
+    [('meta', Dict[str, Any]),
+     ('meta_keys', FrozenSet[str]),
+     ('posting_specs', FrozenSet[Any]),
+     ('opposite_posting_specs', FrozenSet[Any])])
+
+
+def get_transaction_merge_fingerprint(
+        transaction: Transaction) -> TransactionMergeFingerprint:
+    """Returns the parts of `transaction` checked by
+    `IsTransactionMergeablePredicate`.
+
+    `posting_specs` is as returned by `get_transaction_posting_specs`, and
+    `opposite_posting_specs` contains the negated specs of the postings with
+    known accounts, such that two transactions contain opposite postings if, and
+    only if, the `posting_specs` of one intersects the `opposite_posting_specs`
+    of the other.
+    """
+    meta = {
+        k: v
+        for k, v in (transaction.meta or {}).items()
+        if k not in IGNORED_META_KEYS_FOR_MATCHING
+    }
+    return TransactionMergeFingerprint(
+        meta=meta,
+        meta_keys=frozenset(meta),
+        posting_specs=frozenset(get_transaction_posting_specs(transaction)),
+        opposite_posting_specs=frozenset(
+            (posting.account, -posting.units, posting.cost, posting.price)
+            for posting in transaction.postings
+            if (not is_unknown_account(posting.account) and
+                posting.units is not MISSING and
+                posting.units.number is not None)))
+
+
+def are_merge_fingerprints_compatible(
+        a: TransactionMergeFingerprint, b: TransactionMergeFingerprint) -> bool:
+    """Returns `True` if the transactions with fingerprints `a` and `b` have
+    mergeable metadata and no opposite postings."""
+    if not a.posting_specs.isdisjoint(b.opposite_posting_specs):
+        return False
+    for k in a.meta_keys & b.meta_keys:
+        if a.meta[k] != b.meta[k]:
+            return False
+    return True
+
+
 def are_accounts_mergeable(account_a: str, account_b: str) -> bool:
     """Returns `True` if the two accounts may be equivalent."""
     return account_a == account_b or is_unknown_account(
@@ -949,10 +1644,46 @@ def is_removal_candidate(mp: MatchablePosting) -> bool:
     return True
 
 
+class MatchSearchBudget(object):
+    """Bounds the search for merged transactions.
+
+    :ivar max_nodes: Maximum number of match sets explored by each call to
+        `compute_single_sign_match_groups`, or `None` for no limit.
+    :ivar deadline: `time.monotonic()` value after which the search stops, or
+        `None` for no limit.
+    :ivar truncated: Set to `True` if the search was stopped early because of
+        either limit.
+    """
+
+    def __init__(self,
+                 max_nodes: Optional[int] = None,
+                 timeout: Optional[float] = None) -> None:
+        self.max_nodes = max_nodes
+        self.deadline = None  # type: Optional[float]
+        if timeout is not None:
+            self.deadline = time.monotonic() + timeout
+        self.truncated = False
+
+    def is_expired(self) -> bool:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.truncated = True
+            return True
+        return False
+
+    def is_exhausted(self, num_nodes: int) -> bool:
+        if self.max_nodes is not None and num_nodes >= self.max_nodes:
+            self.truncated = True
+            return True
+        return self.is_expired()
+
+
 def compute_single_sign_match_groups(
         matchable_postings: SingleSignMatchablePostings,
         is_cleared: IsClearedFunction,
-        max_residual: Decimal) -> SingleSignMatchGroups:
+        max_residual: int,
+        scale: int,
+        search_budget: Optional[MatchSearchBudget] = None
+) -> SingleSignMatchGroups:
     """Given a list of single-sign matchable postings for each of two transactions,
     computes the list of valid PostingMatchSet objects.  A PostingMatchSet is a
     set of non-conflicting valid matches between matchable postings in the first
@@ -964,7 +1695,9 @@ def compute_single_sign_match_groups(
 
     A match between two MatchablePosting objects is valid if, and only if, their
     weights differ by at most `max_residual` and they satisfy the
-    `are_postings_mergeable` predicate.
+    `are_postings_mergeable` predicate.  All weights, including `max_residual`
+    and the totals of the returned match sets, are integers at `scale`, which
+    must be at least the scale of every `scaled_weight`.
 
     Each MatchablePosting may correspond either to a single underlying Posting
     or a subset of underlying Posting objects of one of the two transactions.  A
@@ -975,15 +1708,26 @@ def compute_single_sign_match_groups(
     constraints: the MatchablePosting must satisfy `is_removal_candidate`, and
     it must not be possible to replace the removal with a regualr match that
     does not conflict with any existing matches in the PostingMatchSet.
+
+    If `search_budget` is `None`, all PostingMatchSet objects are computed by an
+    exhaustive depth-first search.  Otherwise, match sets are explored in
+    best-first order, preferring match sets with more matches and then match
+    sets with a smaller total residual, until the budget is exhausted.
     """
 
+    weights = {
+        id(x): fixed_point.rescale(x.scaled_weight, scale)
+        for txn_matchable_postings in matchable_postings
+        for x in txn_matchable_postings
+    }  # type: Dict[int, int]
+
     b_lookup_table = SortedList(
-        (x.weight.number, x) for x in matchable_postings[1])
+        (weights[id(x)], x) for x in matchable_postings[1])
 
     def get_possible_matches_for_posting_a(a: MatchablePosting):
-        weight = a[1]
-        matching_postings = b_lookup_table.find(weight.number - max_residual,
-                                                weight.number + max_residual)
+        weight = weights[id(a)]
+        matching_postings = b_lookup_table.find(weight - max_residual,
+                                                weight + max_residual)
         for b in matching_postings:
             if not are_postings_mergeable(a, b, is_cleared):
                 continue
@@ -992,96 +1736,155 @@ def compute_single_sign_match_groups(
     possible_matches = [(a, b) for a in matchable_postings[0]
                         for b in get_possible_matches_for_posting_a(a)]
 
-    possible_matches_for = {}  # type: Dict[int, List[MatchablePosting]]
+    # Assign each underlying posting of the two transactions a dense bit
+    # position, so that sets of used postings are represented as integer
+    # bitmasks.
+    posting_bits = {}  # type: Dict[int, int]
+
+    def get_posting_mask(mp: MatchablePosting) -> int:
+        mask = 0
+        for p in mp.source_postings:
+            mask |= 1 << posting_bits.setdefault(id(p), len(posting_bits))
+        return mask
+
+    posting_masks = {
+        id(x): get_posting_mask(x)
+        for txn_matchable_postings in matchable_postings
+        for x in txn_matchable_postings
+    }  # type: Dict[int, int]
+    match_masks = [
+        posting_masks[id(a)] | posting_masks[id(b)] for a, b in possible_matches
+    ]
+
+    # Bitmasks of the possible partners of each matchable posting.
+    possible_match_masks_for = {}  # type: Dict[int, List[int]]
     for a, b in possible_matches:
-        possible_matches_for.setdefault(id(a), []).append(b)
-        possible_matches_for.setdefault(id(b), []).append(a)
+        possible_match_masks_for.setdefault(id(a), []).append(
+            posting_masks[id(b)])
+        possible_match_masks_for.setdefault(id(b), []).append(
+            posting_masks[id(a)])
+
+    def can_be_matched(x: MatchablePosting, used_postings: int) -> bool:
+        # Returns `True` if `x` has a possible partner disjoint from
+        # `used_postings`.
+        return any(not used_postings & mask
+                   for mask in possible_match_masks_for.get(id(x), ()))
 
     removal_candidates = [[
         x for x in txn_matchable_postings if is_removal_candidate(x)
     ] for txn_matchable_postings in matchable_postings]
 
-    used_postings = set()  # type: Set[int]
-
     result = SingleSignMatchGroups([], ([], []), [])
 
-    def consider_removal_extensions(current_sum, matches):
+    def consider_removal_extensions(current_sum: int,
+                                    matches: List[PostingMatch],
+                                    used_postings: int):
         for txn_removal_candidates, txn_removal_results in zip(
                 removal_candidates, result.single_removals):
             for x in txn_removal_candidates:
                 # Exclude this removal candidate if it is part of the match set.
-                if id(x.posting) in used_postings:
+                if used_postings & posting_masks[id(x)]:
                     continue
 
                 # Exclude this removal candidate if it can be matched.  We have
                 # already verified that it is not part of the match set, so we
                 # only need to find a single partner that is also disjoint from
                 # the match set.
-                if any(
-                        used_postings.isdisjoint(
-                            id(p) for p in m.source_postings)
-                        for m in possible_matches_for.get(id(x), ())):
+                if can_be_matched(x, used_postings):
                     continue
-                txn_removal_results.append((current_sum + x.weight.number,
+                txn_removal_results.append((current_sum + weights[id(x)],
                                             PostingMatchSet(matches, (x, ))))
 
         for a in removal_candidates[0]:
-            if id(a.posting) in used_postings:
+            a_mask = posting_masks[id(a)]
+            if used_postings & a_mask:
                 continue
-            used_postings.add(id(a.posting))
             for b in removal_candidates[1]:
-                if id(b.posting) in used_postings:
+                b_mask = posting_masks[id(b)]
+                if (used_postings | a_mask) & b_mask:
                     continue
-                used_postings.add(id(b.posting))
-                if (not any(
-                        used_postings.isdisjoint(
-                            id(p) for p in m.source_postings)
-                        for m in possible_matches_for.get(id(a), ())) and  #
-                        not any(
-                            used_postings.isdisjoint(
-                                id(p) for p in m.source_postings)
-                            for m in possible_matches_for.get(id(b), ()))):
+                used_with_removals = used_postings | a_mask | b_mask
+                if (not can_be_matched(a, used_with_removals) and
+                        not can_be_matched(b, used_with_removals)):
                     result.double_removals.append(
-                        (current_sum + a.weight.number + b.weight.number,
+                        (current_sum + weights[id(a)] + weights[id(b)],
                          PostingMatchSet(matches,
                                          (a, b))))
-                used_postings.remove(id(b.posting))
-            used_postings.remove(id(a.posting))
 
-    def consider_match_extensions(current_sum: Decimal,
+    def consider_match_extensions(current_sum: int,
                                   matches: List[PostingMatch],
-                                  next_match_i: int):
+                                  next_match_i: int, used_postings: int):
         # Search for the possible match, starting at next_match_i, that does not
         # conflict with `used_postings`.
         for match_i in range(next_match_i, len(possible_matches)):
-            m = possible_matches[match_i]
-            posting_ids_in_match = get_posting_ids_in_match(m)
-            if not used_postings.isdisjoint(posting_ids_in_match):
+            match_mask = match_masks[match_i]
+            if used_postings & match_mask:
                 continue
+            m = possible_matches[match_i]
             # Consider match extensions that do not include `m`.
-            consider_match_extensions(current_sum, matches, match_i + 1)
-            used_postings.update(posting_ids_in_match)
-            new_sum = current_sum + m[0].weight.number
+            consider_match_extensions(current_sum, matches, match_i + 1,
+                                      used_postings)
+            new_sum = current_sum + weights[id(m[0])]
             new_matches = list(matches)
             new_matches.append(m)
             result.no_removals.append((new_sum, PostingMatchSet(
                 new_matches, ())))
             # Consider match extensions that do include `m`.
-            consider_match_extensions(new_sum, new_matches, match_i + 1)
-            used_postings.difference_update(posting_ids_in_match)
+            consider_match_extensions(new_sum, new_matches, match_i + 1,
+                                      used_postings | match_mask)
             return
         if next_match_i != 0:
-            consider_removal_extensions(current_sum, matches)
+            consider_removal_extensions(current_sum, matches, used_postings)
+
+    def get_match_residual(m: PostingMatch) -> int:
+        return abs(weights[id(m[0])] - weights[id(m[1])])
+
+    def search_best_first(search_budget: MatchSearchBudget):
+        # Each queue entry is `(-len(matches), residual, sequence_number,
+        # current_sum, matches, used_postings, next_match_i)`.  The sequence
+        # number breaks ties in the order in which match sets were generated.
+        queue = [
+            (0, 0, 0, 0, [], 0, 0)
+        ]  # type: List[Tuple[int, int, int, int, PostingMatches, int, int]]
+        sequence_number = 1
+        num_nodes = 0
+        while queue:
+            if search_budget.is_exhausted(num_nodes):
+                break
+            num_nodes += 1
+            (_, residual, _, current_sum, matches, used_postings,
+             next_match_i) = heapq.heappop(queue)
+            if matches:
+                result.no_removals.append((current_sum,
+                                           PostingMatchSet(matches, ())))
+            consider_removal_extensions(current_sum, matches, used_postings)
+            for match_i in range(next_match_i, len(possible_matches)):
+                match_mask = match_masks[match_i]
+                if used_postings & match_mask:
+                    continue
+                m = possible_matches[match_i]
+                new_matches = list(matches)
+                new_matches.append(m)
+                heapq.heappush(
+                    queue,
+                    (-len(new_matches), residual + get_match_residual(m),
+                     sequence_number, current_sum + weights[id(m[0])],
+                     new_matches, used_postings | match_mask, match_i + 1))
+                sequence_number += 1
+
+    if search_budget is not None:
+        search_best_first(search_budget)
+        return result
 
     # Start from the empty match.
-    consider_match_extensions(ZERO, [], 0)
-    consider_removal_extensions(ZERO, [])
+    consider_match_extensions(0, [], 0, 0)
+    consider_removal_extensions(0, [], 0)
     return result
 
 
 def get_valid_single_sign_group_combinations(
         match_groups: BothSignMatchGroups
-) -> Sequence[Tuple[SingleSignMatchGroup, SortedList[Decimal, PostingMatchSet]]]:
+) -> Sequence[Tuple[SingleSignMatchGroup, SortedList[int, PostingMatchSet]]]:
 
     """Given the negative and positive weight match groups for a single currency,
     returns the list of valid pairings of one negative-weight match group with
@@ -1114,11 +1917,6 @@ def get_valid_single_sign_group_combinations(
     )
 
 
-def _get_posting_match_frozenset(
-        matches: Sequence[PostingMatch]) -> FrozenSet[Tuple[int, int]]:
-    return frozenset((id(a), id(b)) for a, b in matches)
-
-
 def filter_dominated_match_sets(
         match_sets: List[PostingMatchSet]) -> List[PostingMatchSet]:
     """Computes a filtered list of PostingMatchSet objects with dominated match sets
@@ -1126,37 +1924,73 @@ def filter_dominated_match_sets(
 
     A PostingMatchSet `a` dominates another PostingMatchSet `b` if `a` contains
     all of the matches in `b`.
+
+    Each distinct `(a, b)` match is assigned a bit position, so that each match
+    set is represented by an integer bitmask and dominance reduces to
+    `x & y == x`.  The accepted match sets are bucketed by the number of
+    matches, since a match set can only be dominated by an accepted match set
+    with the same matches or with strictly more matches.
     """
     match_sets.sort(key=lambda x: -len(x.matches))
+    bit_positions = {}  # type: Dict[Tuple[int, int], int]
+
+    def get_mask(matches: PostingMatches) -> int:
+        mask = 0
+        for a, b in matches:
+            mask |= 1 << bit_positions.setdefault((id(a), id(b)),
+                                                  len(bit_positions))
+        return mask
+
     filtered_results = []
-    filtered_posting_match_frozensets = [
-    ]  # type: List[FrozenSet[Tuple[int,int]]]
+    # Maps the number of matches to the set of bitmasks of accepted match sets
+    # with that number of matches.
+    filtered_masks = {}  # type: Dict[int, Set[int]]
     for match_set in match_sets:
-        if any(
-                all((id(a), id(b)) in existing for a, b in match_set.matches)
-                for existing in filtered_posting_match_frozensets):
+        mask = get_mask(match_set.matches)
+        size = bin(mask).count('1')
+        if any(mask in masks if existing_size == size else
+               (existing_size > size and
+                any(mask & existing == mask for existing in masks))
+               for existing_size, masks in filtered_masks.items()):
             continue
-        filtered_posting_match_frozensets.append(
-            _get_posting_match_frozenset(match_set.matches))
+        filtered_masks.setdefault(size, set()).add(mask)
         filtered_results.append(match_set)
     return filtered_results
 
 
 # [[neg_a, neg_b], [pos_a, pos_b]]
 def compute_balanced_match_group(
-        matchable_postings: BothSignMatchablePostings, max_residual: Decimal,
-        is_cleared: IsClearedFunction) -> Sequence[PostingMatchSet]:
+        matchable_postings: BothSignMatchablePostings,
+        max_residual: Decimal,
+        is_cleared: IsClearedFunction,
+        search_budget: Optional[MatchSearchBudget] = None,
+        metrics: Optional[MatchingMetrics] = None
+) -> Sequence[PostingMatchSet]:
     if any(
             all(not txn_matchable_postings
                 for txn_matchable_postings in single_sign_matchable_postings)
             for single_sign_matchable_postings in matchable_postings):
         return []
 
+    # Perform all weight arithmetic on integers at a common scale, which is
+    # exact.
+    scale = max(
+        max((x.scaled_weight.scale
+             for single_sign_matchable_postings in matchable_postings
+             for txn_matchable_postings in single_sign_matchable_postings
+             for x in txn_matchable_postings),
+            default=0), fixed_point.get_scale(max_residual))
+    scaled_max_residual = fixed_point.to_scaled_int(max_residual, scale)
+
     match_groups = cast(
         BothSignMatchGroups,
         tuple(
-            compute_single_sign_match_groups(single_sign_matchable_postings,
-                                             is_cleared, max_residual)
+            compute_single_sign_match_groups(
+                single_sign_matchable_postings,
+                is_cleared,
+                scaled_max_residual,
+                scale,
+                search_budget=search_budget)
             for single_sign_matchable_postings in matchable_postings))
 
     # Include the empty match in the result.
@@ -1164,27 +1998,51 @@ def compute_balanced_match_group(
     for neg_group, pos_table in get_valid_single_sign_group_combinations(
             match_groups):
         for total, neg_match_set in neg_group:
-            for pos_match_set in pos_table.find(-total - max_residual,
-                                                -total + max_residual):
+            for pos_match_set in pos_table.find(-total - scaled_max_residual,
+                                                -total + scaled_max_residual):
                 results.append(
                     PostingMatchSet(
                         neg_match_set.matches + pos_match_set.matches,
                         tuple(neg_match_set.removals) + tuple(
                             pos_match_set.removals)))
-    return filter_dominated_match_sets(results)
+    filtered_results = filter_dominated_match_sets(results)
+    if metrics is not None:
+        metrics.match_sets += len(results)
+        metrics.dominated_match_sets += len(results) - len(filtered_results)
+    return filtered_results
 
 
-def get_combined_transactions(txns: Tuple[Transaction, Transaction],
-                              is_cleared: IsClearedFunction):
+def get_combined_transactions(
+        txns: Tuple[Transaction, Transaction],
+        is_cleared: IsClearedFunction,
+        txns_matchable_postings: Optional[Tuple[MatchablePostings,
+                                                MatchablePostings]] = None,
+        search_budget: Optional[MatchSearchBudget] = None,
+        metrics: Optional[MatchingMetrics] = None):
+    """Computes the valid merges of two transactions.
+
+    :param txns_matchable_postings: Optional precomputed matchable postings of each
+        transaction, as returned by `get_matchable_postings_from_transaction`.
+    :param search_budget: Optional bound on the search, passed to
+        `compute_single_sign_match_groups`.
+    :param metrics: Optional object in which to record the number of match
+        sets computed.
+    """
 
     results = []
 
     weighted_postings = [get_weighted_postings(txn.postings) for txn in txns]
 
-    matchable_posting_groups = [
-        get_matchable_posting_groups(txn_weighted_postings, is_cleared)
-        for txn_weighted_postings in weighted_postings
-    ]
+    if txns_matchable_postings is None:
+        matchable_posting_groups = [
+            get_matchable_posting_groups(txn_weighted_postings, is_cleared)
+            for txn_weighted_postings in weighted_postings
+        ]
+    else:
+        matchable_posting_groups = [
+            group_matchable_postings(txn_matchable_postings)
+            for txn_matchable_postings in txns_matchable_postings
+        ]
 
     match_groups = collections.OrderedDict(
         (key.currency, None)  # type: ignore
@@ -1208,7 +2066,9 @@ def get_combined_transactions(txns: Tuple[Transaction, Transaction],
         match_groups[currency] = compute_balanced_match_group(
             matchable_postings,
             max_residual=max_residuals.get(currency, ZERO),
-            is_cleared=is_cleared)
+            is_cleared=is_cleared,
+            search_budget=search_budget,
+            metrics=metrics)
 
     postings_matched = set()  # type: Set[int]
 
@@ -1237,16 +2097,42 @@ def get_posting_identifier(posting: Posting) -> Posting:
     return posting._replace(meta=frozenset(meta))
 
 
-CandidateIdentifier = Tuple[FrozenSet[int], FrozenSet[Posting]]
+CandidateIdentifier = Tuple[FrozenSet[int], FrozenSet[int]]
 
 
-def get_candidate_identifier(
-        transaction: Transaction,
-        used_transaction_ids: Set[int]) -> CandidateIdentifier:
-    # Returns a key that can be used to check for duplicate candidate states.
-    # The result depends only on the set of postings.
-    return (frozenset(used_transaction_ids),
-            frozenset(map(get_posting_identifier, transaction.postings)))
+class CandidateIdentifiers(object):
+    """Computes keys used to check for duplicate candidate states.
+
+    Each distinct `get_posting_identifier` result is assigned a dense number,
+    which is computed once for each posting object; most postings of a merged
+    transaction are shared with the transactions from which it was merged.
+    """
+
+    def __init__(self) -> None:
+        # Keyed by `id(posting)`; the posting is retained so that its id is not
+        # reused.
+        self._posting_numbers = {}  # type: Dict[int, Tuple[Posting, int]]
+        self._identifier_numbers = {}  # type: Dict[Posting, int]
+
+    def _get_posting_number(self, posting: Posting) -> int:
+        numbered = self._posting_numbers.get(id(posting))
+        if numbered is not None:
+            return numbered[1]
+        identifier_numbers = self._identifier_numbers
+        number = identifier_numbers.setdefault(
+            get_posting_identifier(posting), len(identifier_numbers))
+        self._posting_numbers[id(posting)] = (posting, number)
+        return number
+
+    def get(self, transaction: Transaction,
+            used_transaction_numbers: Set[int]) -> CandidateIdentifier:
+        """Returns the key of the state in which `transaction` was obtained by
+        merging the transactions with `used_transaction_numbers`.
+
+        The result depends only on the set of postings.
+        """
+        return (frozenset(used_transaction_numbers),
+                frozenset(map(self._get_posting_number, transaction.postings)))
 
 
 def debug_format_transaction(entry, indent=0):
@@ -1295,74 +2181,208 @@ class IsTransactionMergeablePredicate(object):
     The opposite posting constraint is a heuristic based on the idea that a
     transaction containing two postings that cancel each other out is unlikely
     to be correct.
+
+    The constraint is checked using the fingerprints computed by
+    `get_transaction_merge_fingerprint`; the fingerprints of transactions in
+    `posting_db` are precomputed.  Results are cached by the identity of `b`;
+    since a predicate is created for each transaction extended by
+    `get_extended_transactions`, this caches the result for each pair of
+    transactions within a single search.
     """
 
-    def __init__(self, transaction: Transaction) -> None:
+    def __init__(self,
+                 transaction: Transaction,
+                 posting_db: Optional[PostingDatabase] = None) -> None:
         self.transaction = transaction
-        self.posting_specs = get_transaction_posting_specs(transaction)
+        self.posting_db = posting_db
+        self.fingerprint = get_transaction_merge_fingerprint(transaction)
+        self._results = {}  # type: Dict[int, Tuple[Transaction, bool]]
 
     def __call__(self, b: Transaction) -> bool:
-        a = self.transaction
-        if not is_metadata_mergeable(a.meta, b.meta):
-            return False
-        if transaction_has_opposite_posting(b, self.posting_specs):
-            return False
-        return True
+        cached = self._results.get(id(b))
+        if cached is not None and cached[0] is b:
+            return cached[1]
+        if self.posting_db is not None:
+            b_fingerprint = self.posting_db.get_merge_fingerprint(b)
+        else:
+            b_fingerprint = get_transaction_merge_fingerprint(b)
+        result = are_merge_fingerprints_compatible(self.fingerprint,
+                                                   b_fingerprint)
+        self._results[id(b)] = (b, result)
+        return result
 
 
 MergedTransaction = NamedTuple('MergedTransaction',
                                [('transaction', Transaction),
                                 ('used_transactions', List[Transaction])])
 
-SingleStepMergedTransaction = NamedTuple('SingleStepMergedTransaction',
-                                         [('transaction', Transaction),
-                                          ('matched_transaction', Transaction)])
+# `matched_transaction_number` is the number assigned to `matched_transaction`
+# by the `PostingDatabase`.
+SingleStepMergedTransaction = NamedTuple(
+    'SingleStepMergedTransaction', [('transaction', Transaction),
+                                    ('matched_transaction', Transaction),
+                                    ('matched_transaction_number', int)])
 
 def _get_valid_posting_matches(
         transaction_constraint: IsTransactionMergeablePredicate,
         posting: Posting, negate: bool, posting_db: PostingDatabase,
-        excluded_transaction_ids: FrozenSet[int]
-) -> Iterable[Tuple[Transaction, MatchablePosting]]:
-    """Returns the matching transaction, posting pairs.
+        excluded_transaction_numbers: FrozenSet[int],
+        metrics: Optional[MatchingMetrics] = None
+) -> Iterable[Tuple[int, Transaction, MatchablePosting]]:
+    """Returns the matching transaction number, transaction, posting triples.
 
-    Transactions already present in `excluded_transaction_ids` are excluded, as
-    are transactions that do not satisfy `transaction_constraint`.
+    Transactions whose numbers are present in `excluded_transaction_numbers` are
+    excluded, as are transactions that do not satisfy `transaction_constraint`.
     """
-    matches = posting_db.get_posting_matches(
-        transaction_constraint.transaction, posting, negate=negate)
-    for matching_transaction, mp in matches:
-        if id(matching_transaction) in excluded_transaction_ids:
+    with _time_phase(metrics, 'lookup'):
+        matches = posting_db.get_numbered_posting_matches(
+            transaction_constraint.transaction,
+            posting,
+            negate=negate,
+            metrics=metrics)
+    for transaction_number, matching_transaction, mp in matches:
+        if transaction_number in excluded_transaction_numbers:
             continue
         if not transaction_constraint(matching_transaction): continue
-        yield matching_transaction, mp
+        yield transaction_number, matching_transaction, mp
 
 def get_unknown_to_opposite_unknown_extensions(
         transaction_constraint: IsTransactionMergeablePredicate,
         posting_db: PostingDatabase,
-        excluded_transaction_ids: FrozenSet[int],
-        mp: MatchablePosting) -> Iterable[SingleStepMergedTransaction]:
+        excluded_transaction_numbers: FrozenSet[int],
+        mp: MatchablePosting,
+        metrics: Optional[MatchingMetrics] = None
+) -> Iterable[SingleStepMergedTransaction]:
     """Finds extensions that remove both `mp` and an unknown posting of opposite
     weight in the matching transaction.
     """
-    for matching_transaction, other_mp in _get_valid_posting_matches(
-            transaction_constraint,
-            mp.posting,
-            negate=True,
-            posting_db=posting_db,
-            excluded_transaction_ids=excluded_transaction_ids):
+    for transaction_number, matching_transaction, other_mp in (
+            _get_valid_posting_matches(
+                transaction_constraint,
+                mp.posting,
+                negate=True,
+                posting_db=posting_db,
+                excluded_transaction_numbers=excluded_transaction_numbers,
+                metrics=metrics)):
         if not is_removal_candidate(other_mp): continue
         yield SingleStepMergedTransaction(
             combine_transactions_using_match_set(
                 (transaction_constraint.transaction, matching_transaction),
                 match_set=PostingMatchSet(matches=[], removals=(mp, other_mp)),
-                is_cleared=posting_db.is_cleared), matching_transaction)
+                is_cleared=posting_db.is_cleared), matching_transaction,
+            transaction_number)
+
+
+CombinedTransactionsResult = Tuple[List[Transaction], Set[int]]
+
+# `is_cleared` function of a `CombinationProcessPool` worker process.
+_worker_is_cleared = None  # type: Optional[IsClearedFunction]
+
+
+def _init_combination_worker(is_cleared: IsClearedFunction) -> None:
+    global _worker_is_cleared
+    _worker_is_cleared = is_cleared
+
+
+def _get_combined_transactions_in_worker(
+        txns: Tuple[Transaction, Transaction],
+        txns_matchable_postings: Tuple[MatchablePostings, MatchablePostings],
+        search_budget: Optional[MatchSearchBudget],
+        metrics: Optional[MatchingMetrics]
+) -> Tuple[List[Transaction], List[Tuple[int, int]], bool,
+           Optional[MatchingMetrics]]:
+    assert _worker_is_cleared is not None
+    combined_transactions, postings_matched = get_combined_transactions(
+        txns,
+        is_cleared=_worker_is_cleared,
+        txns_matchable_postings=txns_matchable_postings,
+        search_budget=search_budget,
+        metrics=metrics)
+    # The ids of the unpickled postings are meaningless to the caller, so
+    # matched postings are identified by their position instead.
+    posting_positions = {
+        id(posting): (txn_i, posting_i)
+        for txn_i, txn in enumerate(txns)
+        for posting_i, posting in enumerate(txn.postings)
+    }
+    return (combined_transactions, [
+        posting_positions[posting_id] for posting_id in postings_matched
+        if posting_id in posting_positions
+    ], search_budget is not None and search_budget.truncated, metrics)
+
+
+class CombinationProcessPool(object):
+    """Evaluates `get_combined_transactions` in a pool of worker processes.
+
+    The worker processes are started by the `forkserver` method where it is
+    supported, and otherwise by the `spawn` method, rather than being forked
+    from the calling process, whose other threads may hold locks.  The
+    `is_cleared` function must therefore be picklable; it is pickled as each
+    worker process is started.  The two transactions and their matchable
+    postings are pickled together for each task, which preserves the identity
+    of the postings shared between them.
+    """
+
+    def __init__(self, is_cleared: IsClearedFunction,
+                 max_workers: Optional[int] = None) -> None:
+        start_method = 'spawn'
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            start_method = 'forkserver'
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_combination_worker,
+            initargs=(is_cleared, ))
+
+    def get_combined_transactions(
+            self, txns_list: Sequence[Tuple[Transaction, Transaction]],
+            txns_matchable_postings_list: Sequence[Tuple[MatchablePostings,
+                                                         MatchablePostings]],
+            search_budget: Optional[MatchSearchBudget] = None,
+            metrics: Optional[MatchingMetrics] = None
+    ) -> List[CombinedTransactionsResult]:
+        """Computes `get_combined_transactions` for each pair of transactions.
+
+        The counts recorded by the worker processes are added to `metrics`.
+
+        :returns: The list of results, in the same order as `txns_list`.
+        """
+        futures = [
+            self.executor.submit(
+                _get_combined_transactions_in_worker, txns,
+                (list(txns_matchable_postings[0]),
+                 list(txns_matchable_postings[1])), search_budget,
+                None if metrics is None else MatchingMetrics())
+            for txns, txns_matchable_postings in zip(
+                txns_list, txns_matchable_postings_list)
+        ]
+        results = []  # type: List[CombinedTransactionsResult]
+        for txns, future in zip(txns_list, futures):
+            (combined_transactions, posting_positions, truncated,
+             worker_metrics) = future.result()
+            if truncated:
+                assert search_budget is not None
+                search_budget.truncated = True
+            if metrics is not None and worker_metrics is not None:
+                metrics.update(worker_metrics)
+            results.append((combined_transactions, set(
+                id(txns[txn_i].postings[posting_i])
+                for txn_i, posting_i in posting_positions)))
+        return results
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
 
 
 def get_single_step_extended_transactions(
         transaction: Transaction,
         posting_db: PostingDatabase,
-        excluded_transaction_ids: FrozenSet[int],
-        debug_level=0) -> Iterable[SingleStepMergedTransaction]:
+        excluded_transaction_numbers: FrozenSet[int],
+        debug_level=0,
+        search_budget: Optional[MatchSearchBudget] = None,
+        combination_pool: Optional[CombinationProcessPool] = None,
+        metrics: Optional[MatchingMetrics] = None
+) -> Iterable[SingleStepMergedTransaction]:
     """Finds valid merges of `transaction` with a single additional transaction.
 
     This is done by first computing the set of `matchable_postings` by calling
@@ -1377,24 +2397,29 @@ def get_single_step_extended_transactions(
        was not matched in any of the merged results computed by step 1, outputs
        the list of merged transactions computed by calling
        `get_unknown_to_opposite_unknown_extentsions`.
+
+    If `combination_pool` is specified, the calls to `get_combined_transactions`
+    in step 1 are evaluated in parallel.  The results are the same.
     """
 
     matching_transactions = collections.OrderedDict(
     )  # type: Dict[int, Transaction]
-    matchable_postings = list(
-        get_matchable_postings_from_transaction(transaction,
-                                                posting_db.is_cleared))
-    transaction_constraint = IsTransactionMergeablePredicate(transaction)
+    matchable_postings = posting_db.get_matchable_postings(
+        transaction, metrics=metrics)
+    transaction_constraint = IsTransactionMergeablePredicate(
+        transaction, posting_db)
     for mp in matchable_postings:
-        for orig_matching_transaction, _ in _get_valid_posting_matches(
-                transaction_constraint,
-                mp.posting,
-                negate=False,
-                posting_db=posting_db,
-                excluded_transaction_ids=excluded_transaction_ids,
-        ):
-            matching_transactions[id(
-                orig_matching_transaction)] = orig_matching_transaction
+        for (transaction_number, orig_matching_transaction,
+             _) in _get_valid_posting_matches(
+                 transaction_constraint,
+                 mp.posting,
+                 negate=False,
+                 posting_db=posting_db,
+                 excluded_transaction_numbers=excluded_transaction_numbers,
+                 metrics=metrics,
+             ):
+            matching_transactions[
+                transaction_number] = orig_matching_transaction
 
     postings_matched = set()  # type: Set[int]
 
@@ -1406,21 +2431,53 @@ def get_single_step_extended_transactions(
         debug_print(
             'Matching transactions: (%d)' % (len(matching_transactions), ),
             level=debug_level)
-    for matching_transaction in matching_transactions.values():
+
+    def get_txns_matchable_postings(matching_transaction: Transaction):
+        return (matchable_postings,
+                posting_db.get_matchable_postings(
+                    matching_transaction, metrics=metrics))
+
+    def get_combined_results() -> Iterable[CombinedTransactionsResult]:
+        for matching_transaction in matching_transactions.values():
+            txns_matchable_postings = get_txns_matchable_postings(
+                matching_transaction)
+            with _time_phase(metrics, 'combine'):
+                combined_result = get_combined_transactions(
+                    (transaction, matching_transaction),
+                    is_cleared=posting_db.is_cleared,
+                    txns_matchable_postings=txns_matchable_postings,
+                    search_budget=search_budget,
+                    metrics=metrics)
+            yield combined_result
+
+    if combination_pool is not None and len(matching_transactions) > 1:
+        with _time_phase(metrics, 'combine'):
+            combined_results = combination_pool.get_combined_transactions(
+                [(transaction, matching_transaction)
+                 for matching_transaction in matching_transactions.values()],
+                [
+                    get_txns_matchable_postings(matching_transaction)
+                    for matching_transaction in matching_transactions.values()
+                ],
+                search_budget=search_budget,
+                metrics=metrics)  # type: Iterable[CombinedTransactionsResult]
+    else:
+        combined_results = get_combined_results()
+
+    for (transaction_number, matching_transaction), combined_result in zip(
+            matching_transactions.items(), combined_results):
+        combined_transactions, new_postings_matched = combined_result
         if DEBUG:
             debug_print(
                 debug_format_transaction(matching_transaction, 2),
                 level=debug_level)
-        combined_transactions, new_postings_matched = get_combined_transactions(
-            (transaction, matching_transaction),
-            is_cleared=posting_db.is_cleared)
-        if DEBUG:
             debug_print(
                 '   got %d matches' % (len(combined_transactions)),
                 level=debug_level)
         postings_matched.update(new_postings_matched)
         for new_transaction in combined_transactions:
-            yield SingleStepMergedTransaction(new_transaction, matching_transaction)
+            yield SingleStepMergedTransaction(
+                new_transaction, matching_transaction, transaction_number)
 
     for mp in matchable_postings:
         # Only search for a match between an unknown account posting and another
@@ -1431,13 +2488,18 @@ def get_single_step_extended_transactions(
         yield from get_unknown_to_opposite_unknown_extensions(
             transaction_constraint=transaction_constraint,
             posting_db=posting_db,
-            excluded_transaction_ids=excluded_transaction_ids,
-            mp=mp)
+            excluded_transaction_numbers=excluded_transaction_numbers,
+            mp=mp,
+            metrics=metrics)
 
 
 def get_extended_transactions(
         initial_transaction: Transaction,
-        posting_db: PostingDatabase) -> List[MergedTransaction]:
+        posting_db: PostingDatabase,
+        search_budget: Optional[MatchSearchBudget] = None,
+        combination_pool: Optional[CombinationProcessPool] = None,
+        metrics: Optional[MatchingMetrics] = None
+) -> List[MergedTransaction]:
     """Finds valid merges of `initial_transaction`.
 
     Performs a depth-first search over the space of merged transactions.  The
@@ -1445,26 +2507,63 @@ def get_extended_transactions(
     the existing merged transaction, are obtained by calling
     `get_single_step_extended_transactions`.
 
+    If `search_budget` is specified, the search is bounded by it, and
+    `search_budget.truncated` indicates whether any results may be missing.
+
+    Complete results are stored in `posting_db.match_result_cache`, and reused
+    until the database changes in a way that may affect them.
+
+    If `combination_pool` is specified, it is used to merge pairs of
+    transactions in parallel.
+
+    If `metrics` is specified, counts and timings of the work done are added to
+    it.
+
     :returns: The list of merged transactions, ordered by
         `merged_transaction_sort_key`.
     """
-    used_transaction_ids = set()  # type: Set[int]
+    with _time_phase(metrics, 'total'):
+        return _get_extended_transactions(initial_transaction, posting_db,
+                                          search_budget, combination_pool,
+                                          metrics)
+
+
+def _get_extended_transactions(
+        initial_transaction: Transaction, posting_db: PostingDatabase,
+        search_budget: Optional[MatchSearchBudget],
+        combination_pool: Optional[CombinationProcessPool],
+        metrics: Optional[MatchingMetrics]) -> List[MergedTransaction]:
+    match_result_cache = posting_db.match_result_cache
+    cached_results = match_result_cache.get(initial_transaction, posting_db)
+    if cached_results is not None:
+        if metrics is not None:
+            metrics.cached_results += 1
+        return list(cached_results)
+
+    # Numbers assigned by `posting_db` to the transactions in
+    # `used_transactions`.
+    used_transaction_numbers = set()  # type: Set[int]
     used_transactions = []  # type: List[Transaction]
 
     results = [] # type: List[Tuple[Transaction, List[Transaction]]]
 
+    candidate_identifiers = CandidateIdentifiers()
     previously_seen_states = set()  # type: Set[CandidateIdentifier]
 
     def maybe_extend_candidate(transaction: Transaction,
-                               ref_transaction: Transaction, level: int):
+                               ref_transaction: Transaction,
+                               ref_transaction_number: int, level: int):
         # Check if we have already seen this state.
         if ref_transaction is not None:
-            used_transaction_ids.add(id(ref_transaction))
+            used_transaction_numbers.add(ref_transaction_number)
             used_transactions.append(ref_transaction)
 
-        state_id = get_candidate_identifier(transaction, used_transaction_ids)
+        state_id = candidate_identifiers.get(transaction,
+                                             used_transaction_numbers)
         if state_id not in previously_seen_states:
             previously_seen_states.add(state_id)
+            if metrics is not None:
+                metrics.states_visited += 1
 
             if ref_transaction is not None:
 
@@ -1474,23 +2573,45 @@ def get_extended_transactions(
             do_extend_candidate(transaction, level)
 
         if ref_transaction is not None:
-            used_transaction_ids.remove(id(ref_transaction))
+            used_transaction_numbers.remove(ref_transaction_number)
             del used_transactions[-1]
 
     def do_extend_candidate(transaction: Transaction, level: int):
-        for new_transaction, matching_transaction in get_single_step_extended_transactions(
-                transaction=transaction,
-                posting_db=posting_db,
-                excluded_transaction_ids=cast(FrozenSet[int],
-                                              used_transaction_ids),
-                debug_level=level):
+        for (new_transaction, matching_transaction,
+             matching_transaction_number
+             ) in get_single_step_extended_transactions(
+                 transaction=transaction,
+                 posting_db=posting_db,
+                 excluded_transaction_numbers=cast(FrozenSet[int],
+                                                   used_transaction_numbers),
+                 debug_level=level,
+                 search_budget=search_budget,
+                 combination_pool=combination_pool,
+                 metrics=metrics):
+            if search_budget is not None and search_budget.is_expired():
+                return
             maybe_extend_candidate(new_transaction, matching_transaction,
-                                   level + 1)
-
-    maybe_extend_candidate(initial_transaction, initial_transaction, level=0)
+                                   matching_transaction_number, level + 1)
+
+    # The initial transaction need not be in `posting_db`, in which case no
+    # transaction there has to be excluded in its place.
+    initial_transaction_number = posting_db.get_transaction_number(
+        initial_transaction)
+    if initial_transaction_number is None:
+        initial_transaction_number = -1
+    with posting_db.record_lookups() as lookup_dependencies:
+        maybe_extend_candidate(
+            initial_transaction,
+            initial_transaction,
+            initial_transaction_number,
+            level=0)
 
     results.sort(key=lambda x: merged_transaction_sort_key(x[0]))
-    return [
+    merged_transactions = [
         MergedTransaction(normalize_transaction(entry), used_transactions)
         for entry, used_transactions in results
     ]
+    if search_budget is None or not search_budget.truncated:
+        match_result_cache.put(initial_transaction, posting_db,
+                               lookup_dependencies, merged_transactions)
+    return list(merged_transactions)
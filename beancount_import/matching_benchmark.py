@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""Benchmarks for transaction matching on synthetic journals.
+
+The journals are produced by a deterministic generator, so that results can be
+compared across releases.  Each scale is specified as an approximate number of
+journal postings.  The results are written as JSON.
+
+Example usage:
+
+    python -m beancount_import.matching_benchmark --scales 10000 100000 \\
+        --output results.json
+"""
+
+from typing import List, Dict, Any, Tuple, Optional, NamedTuple, Sequence, cast
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from beancount.core.amount import Amount
+from beancount.core.data import Transaction, Posting, Open, Directive, Entries
+from beancount.core.number import D, Decimal, ZERO
+import beancount.parser.printer
+
+from . import matching
+from . import reconcile
+
+BENCHMARK_NAMES = [
+    'posting_db_construction',
+    'get_extended_transactions',
+    'compute_balanced_match_group',
+    'reconciler_startup',
+]
+
+DEFAULT_SCALES = [10000, 100000, 1000000]
+
+START_DATE = datetime.date(2015, 1, 1)
+
+CLEARED_KEY = 'source_desc'
+
+SyntheticJournalConfig = NamedTuple('SyntheticJournalConfig', [
+    ('num_transactions', int),
+    ('num_accounts', int),
+    ('num_pending', int),
+    ('duplicate_rate', float),
+    ('split_rate', float),
+    ('fixme_density', float),
+    ('seed', int),
+])
+
+SyntheticJournal = NamedTuple('SyntheticJournal', [
+    ('accounts', List[str]),
+    ('transactions', List[Transaction]),
+    ('pending', List[Transaction]),
+    ('num_postings', int),
+])
+
+
+def get_num_transactions_for_scale(num_postings: int,
+                                   split_rate: float) -> int:
+    """Returns the number of transactions that yields about `num_postings`
+    postings.
+
+    A split transaction has 3 to 5 postings, and any other transaction has 2.
+    """
+    postings_per_transaction = 2 + 2 * split_rate
+    return max(1, int(round(num_postings / postings_per_transaction)))
+
+
+def _get_accounts(num_accounts: int) -> Tuple[List[str], List[str]]:
+    num_funding_accounts = max(1, num_accounts // 4)
+    funding_accounts = [
+        'Assets:Bank%d' % i if i % 2 == 0 else 'Liabilities:Card%d' % i
+        for i in range(num_funding_accounts)
+    ]
+    expense_accounts = [
+        'Expenses:Category%d' % i
+        for i in range(max(1, num_accounts - num_funding_accounts))
+    ]
+    return funding_accounts, expense_accounts
+
+
+def _make_posting(account: str, number: Decimal,
+                  meta: Optional[Dict[str, Any]] = None) -> Posting:
+    return Posting(
+        account=account,
+        units=Amount(number, 'USD'),
+        cost=None,
+        price=None,
+        flag=None,
+        meta=meta)
+
+
+def _make_transaction(index: int, date: datetime.date, narration: str,
+                      postings: List[Posting]) -> Transaction:
+    return Transaction(
+        meta=collections.OrderedDict([('filename', '<synthetic>'),
+                                      ('lineno', index)]),
+        date=date,
+        flag='*',
+        payee=None,
+        narration=narration,
+        tags=frozenset(),
+        links=frozenset(),
+        postings=postings)
+
+
+def _get_random_number(rng: random.Random) -> Decimal:
+    return Decimal(rng.randrange(100, 50000)).scaleb(-2)
+
+
+def generate_journal(config: SyntheticJournalConfig) -> SyntheticJournal:
+    """Generates a synthetic journal and pending imports.
+
+    Each journal transaction moves money from a funding account to one expense
+    account, or, with probability `split_rate`, to 2 to 4 expense accounts.
+    Each expense posting is replaced by an `Expenses:FIXME` posting with
+    probability `fixme_density`.
+
+    Each pending import is a funding account posting with cleared metadata,
+    balanced by an `Expenses:FIXME` posting.  With probability
+    `duplicate_rate`, it duplicates the funding posting of a journal
+    transaction, with a date that differs by up to 2 days.
+    """
+    rng = random.Random(config.seed)
+    funding_accounts, expense_accounts = _get_accounts(config.num_accounts)
+    # Spread the transactions over about 20 transactions per day.
+    num_days = max(1, config.num_transactions // 20)
+    transactions = []  # type: List[Transaction]
+    num_postings = 0
+    for i in range(config.num_transactions):
+        date = START_DATE + datetime.timedelta(days=rng.randrange(num_days))
+        funding_account = rng.choice(funding_accounts)
+        if rng.random() < config.split_rate:
+            numbers = [
+                _get_random_number(rng) for _ in range(rng.randint(2, 4))
+            ]
+        else:
+            numbers = [_get_random_number(rng)]
+        postings = [_make_posting(funding_account, -sum(numbers, ZERO))]
+        for number in numbers:
+            if rng.random() < config.fixme_density:
+                account = matching.FIXME_ACCOUNT
+            else:
+                account = rng.choice(expense_accounts)
+            postings.append(_make_posting(account, number))
+        num_postings += len(postings)
+        transactions.append(
+            _make_transaction(i, date, 'Transaction %d' % i, postings))
+
+    pending = []  # type: List[Transaction]
+    for i in range(config.num_pending):
+        if transactions and rng.random() < config.duplicate_rate:
+            original = rng.choice(transactions)
+            date = original.date + datetime.timedelta(
+                days=rng.randint(-2, 2))
+            funding_account = original.postings[0].account
+            number = original.postings[0].units.number
+        else:
+            date = START_DATE + datetime.timedelta(
+                days=rng.randrange(num_days))
+            funding_account = rng.choice(funding_accounts)
+            number = -_get_random_number(rng)
+        pending.append(
+            _make_transaction(
+                config.num_transactions + i, date, 'Pending %d' % i, [
+                    _make_posting(
+                        funding_account,
+                        number,
+                        meta=collections.OrderedDict([
+                            ('date', date),
+                            (CLEARED_KEY, 'Pending %d' % i),
+                        ])),
+                    _make_posting(matching.FIXME_ACCOUNT, -number),
+                ]))
+    return SyntheticJournal(
+        accounts=funding_accounts + expense_accounts,
+        transactions=transactions,
+        pending=pending,
+        num_postings=num_postings)
+
+
+def is_posting_cleared(posting: Posting) -> bool:
+    return bool(posting.meta) and CLEARED_KEY in posting.meta
+
+
+def _make_posting_db(journal: SyntheticJournal) -> matching.PostingDatabase:
+    posting_db = matching.PostingDatabase(
+        fuzzy_match_days=5,
+        fuzzy_match_amount=D('0.01'),
+        is_cleared=is_posting_cleared,
+        metadata_keys=frozenset([matching.CHECK_KEY]),
+    )
+    for transaction in journal.transactions:
+        posting_db.add_transaction(transaction)
+    return posting_db
+
+
+def _get_timing_summary(durations: Sequence[float]) -> Dict[str, Any]:
+    return collections.OrderedDict([
+        ('count', len(durations)),
+        ('seconds', sum(durations)),
+        ('mean_seconds', sum(durations) / len(durations) if durations else 0),
+        ('max_seconds', max(durations, default=0)),
+    ])
+
+
+def benchmark_posting_db_construction(
+        journal: SyntheticJournal) -> Dict[str, Any]:
+    start_time = time.perf_counter()
+    _make_posting_db(journal)
+    return collections.OrderedDict([
+        ('seconds', time.perf_counter() - start_time),
+    ])
+
+
+def benchmark_get_extended_transactions(
+        journal: SyntheticJournal) -> Dict[str, Any]:
+    posting_db = _make_posting_db(journal)
+    metrics = matching.MatchingMetrics()
+    durations = []  # type: List[float]
+    num_results = 0
+    for transaction in journal.pending:
+        start_time = time.perf_counter()
+        results = matching.get_extended_transactions(
+            transaction, posting_db, metrics=metrics)
+        durations.append(time.perf_counter() - start_time)
+        num_results += len(results)
+    summary = _get_timing_summary(durations)
+    summary['num_results'] = num_results
+    summary['metrics'] = metrics.to_dict()
+    return summary
+
+
+def _get_balanced_match_group_args(
+        txns: Tuple[Transaction, Transaction]
+) -> List[Tuple[matching.BothSignMatchablePostings, Decimal]]:
+    """Returns the arguments of each `compute_balanced_match_group` call made by
+    `get_combined_transactions` for `txns`."""
+    weighted_postings = [
+        matching.get_weighted_postings(txn.postings) for txn in txns
+    ]
+    matchable_posting_groups = [
+        matching.get_matchable_posting_groups(txn_weighted_postings,
+                                              is_posting_cleared)
+        for txn_weighted_postings in weighted_postings
+    ]
+    max_residuals = matching.get_max_residuals_from_weights(
+        *[[weight for _, weight in txn_weighted_postings]
+          for txn_weighted_postings in weighted_postings])
+    currencies = collections.OrderedDict(
+        (key.currency, None) for groups in matchable_posting_groups
+        for key in groups)
+    return [(cast(
+        matching.BothSignMatchablePostings,
+        tuple(
+            tuple(
+                groups.get(matching.MatchGroupKey(currency, is_positive), [])
+                for groups in matchable_posting_groups)
+            for is_positive in (False, True))), max_residuals.get(
+                currency, ZERO)) for currency in currencies]
+
+
+def benchmark_compute_balanced_match_group(
+        journal: SyntheticJournal) -> Dict[str, Any]:
+    posting_db = _make_posting_db(journal)
+    durations = []  # type: List[float]
+    num_match_sets = 0
+    for transaction in journal.pending:
+        matching_transactions = collections.OrderedDict(
+        )  # type: Dict[int, Transaction]
+        for posting in transaction.postings:
+            for matching_transaction, _ in posting_db.get_posting_matches(
+                    transaction, posting):
+                matching_transactions[id(
+                    matching_transaction)] = matching_transaction
+        for matching_transaction in matching_transactions.values():
+            for matchable_postings, max_residual in (
+                    _get_balanced_match_group_args(
+                        (transaction, matching_transaction))):
+                start_time = time.perf_counter()
+                match_sets = matching.compute_balanced_match_group(
+                    matchable_postings,
+                    max_residual=max_residual,
+                    is_cleared=is_posting_cleared)
+                durations.append(time.perf_counter() - start_time)
+                num_match_sets += len(match_sets)
+    summary = _get_timing_summary(durations)
+    summary['num_match_sets'] = num_match_sets
+    return summary
+
+
+def write_journal(journal: SyntheticJournal, journal_dir: str) -> str:
+    """Writes the journal transactions to `journal_dir`.
+
+    :returns: The path to the journal file.
+    """
+    journal_path = os.path.join(journal_dir, 'journal.beancount')
+    entries = [
+        Open(
+            meta=collections.OrderedDict([('filename', '<synthetic>'),
+                                          ('lineno', 0)]),
+            date=START_DATE,
+            account=account,
+            currencies=None,
+            booking=None)
+        for account in journal.accounts + [matching.FIXME_ACCOUNT]
+    ]  # type: List[Directive]
+    entries.extend(journal.transactions)
+    with open(journal_path, 'w') as f:
+        f.write('plugin "beancount.plugins.auto_accounts"\n\n')
+        for entry in entries:
+            f.write(beancount.parser.printer.format_entry(entry))
+            f.write('\n')
+    with open(os.path.join(journal_dir, 'ignore.beancount'), 'w') as f:
+        pass
+    return journal_path
+
+
+def benchmark_reconciler_startup(journal: SyntheticJournal) -> Dict[str, Any]:
+    from . import webserver
+    with tempfile.TemporaryDirectory() as journal_dir:
+        journal_path = write_journal(journal, journal_dir)
+        args = webserver.parse_arguments([
+            '--journal_input', journal_path, '--ignored_journal',
+            os.path.join(journal_dir, 'ignore.beancount'), '--default_output',
+            os.path.join(journal_dir, 'output.beancount')
+        ])
+        start_time = time.perf_counter()
+        reconciler = reconcile.Reconciler(
+            journal_path=journal_path,
+            ignore_path=args.ignored_journal,
+            log_status=lambda message: None,
+            options=vars(args))
+        loaded_reconciler = reconciler.loaded_future.result()
+        seconds = time.perf_counter() - start_time
+        loaded_reconciler.close()
+    return collections.OrderedDict([('seconds', seconds)])
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('posting_db_construction', benchmark_posting_db_construction),
+    ('get_extended_transactions', benchmark_get_extended_transactions),
+    ('compute_balanced_match_group', benchmark_compute_balanced_match_group),
+    ('reconciler_startup', benchmark_reconciler_startup),
+])
+
+
+def run_benchmarks(config: SyntheticJournalConfig,
+                   benchmark_names: Sequence[str] = BENCHMARK_NAMES
+                   ) -> Dict[str, Any]:
+    """Generates a journal according to `config` and runs the benchmarks.
+
+    :returns: A JSON-serializable description of the results.
+    """
+    start_time = time.perf_counter()
+    journal = generate_journal(config)
+    generate_seconds = time.perf_counter() - start_time
+    results = collections.OrderedDict()  # type: Dict[str, Any]
+    for name in benchmark_names:
+        results[name] = BENCHMARKS[name](journal)
+    return collections.OrderedDict([
+        ('config', collections.OrderedDict(config._asdict())),
+        ('num_postings', journal.num_postings),
+        ('generate_seconds', generate_seconds),
+        ('benchmarks', results),
+    ])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argparser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    argparser.add_argument(
+        '--scales',
+        type=int,
+        nargs='+',
+        default=DEFAULT_SCALES,
+        help='Approximate numbers of journal postings at which to run.')
+    argparser.add_argument(
+        '--num_transactions',
+        type=int,
+        help='Number of journal transactions.  Overrides --scales.')
+    argparser.add_argument(
+        '--num_accounts',
+        type=int,
+        default=100,
+        help='Number of distinct known accounts.')
+    argparser.add_argument(
+        '--num_pending',
+        type=int,
+        default=200,
+        help='Number of pending imports to match.')
+    argparser.add_argument(
+        '--duplicate_rate',
+        type=float,
+        default=0.5,
+        help='Fraction of pending imports that duplicate a journal posting.')
+    argparser.add_argument(
+        '--split_rate',
+        type=float,
+        default=0.2,
+        help='Fraction of journal transactions with multiple expense postings.'
+    )
+    argparser.add_argument(
+        '--fixme_density',
+        type=float,
+        default=0.3,
+        help='Fraction of expense postings with an unknown account.')
+    argparser.add_argument('--seed', type=int, default=0)
+    argparser.add_argument(
+        '--benchmarks',
+        nargs='+',
+        choices=BENCHMARK_NAMES,
+        default=BENCHMARK_NAMES,
+        help='Benchmarks to run.')
+    argparser.add_argument(
+        '--output',
+        type=str,
+        help='File to which the JSON results are written.  Defaults to stdout.'
+    )
+    args = argparser.parse_args(argv)
+
+    if args.num_transactions is not None:
+        transaction_counts = [args.num_transactions]
+    else:
+        transaction_counts = [
+            get_num_transactions_for_scale(scale, args.split_rate)
+            for scale in args.scales
+        ]
+    runs = []
+    for num_transactions in transaction_counts:
+        config = SyntheticJournalConfig(
+            num_transactions=num_transactions,
+            num_accounts=args.num_accounts,
+            num_pending=args.num_pending,
+            duplicate_rate=args.duplicate_rate,
+            split_rate=args.split_rate,
+            fixme_density=args.fixme_density,
+            seed=args.seed)
+        runs.append(run_benchmarks(config, args.benchmarks))
+    output = collections.OrderedDict([
+        ('python_version', platform.python_version()),
+        ('runs', runs),
+    ])
+    if args.output is None:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import json
+
+from . import matching_benchmark
+
+
+def _make_config(seed=0):
+    return matching_benchmark.SyntheticJournalConfig(
+        num_transactions=50,
+        num_accounts=8,
+        num_pending=10,
+        duplicate_rate=0.5,
+        split_rate=0.3,
+        fixme_density=0.3,
+        seed=seed)
+
+
+def test_generate_journal_deterministic():
+    a = matching_benchmark.generate_journal(_make_config())
+    b = matching_benchmark.generate_journal(_make_config())
+    assert a == b
+    assert len(a.transactions) == 50
+    assert len(a.pending) == 10
+    assert a.num_postings == sum(len(t.postings) for t in a.transactions)
+    c = matching_benchmark.generate_journal(_make_config(seed=1))
+    assert a != c
+
+
+def test_run_benchmarks():
+    results = matching_benchmark.run_benchmarks(_make_config())
+    assert list(results['benchmarks']) == matching_benchmark.BENCHMARK_NAMES
+    assert results['benchmarks']['get_extended_transactions']['count'] == 10
+    json.dumps(results)
@@ -872,3 +872,367 @@ def test_match_grouped_maximal_differing_signs():
             note2: "C"
         """,
     )
+
+
+def _make_posting_db(entries):
+    posting_db = matching.PostingDatabase(
+        fuzzy_match_days=3,
+        fuzzy_match_amount=0.01,
+        is_cleared=lambda posting: False,
+        metadata_keys=frozenset([matching.CHECK_KEY]),
+    )
+    add_entries_to_db(posting_db, entries)
+    return posting_db
+
+
+def _format_posting_matches(matches):
+    return [(txn.narration, mp.posting.account, str(mp.weight))
+            for txn, mp in matches]
+
+
+def test_posting_database_lookup():
+    entries = test_util.parse("""
+        2020-01-01 * "A"
+          Assets:Checking  -10 USD
+          Expenses:FIXME    10 USD
+
+        2020-01-03 * "B"
+          Assets:Savings   -10 USD
+          Expenses:Food     10 USD
+
+        2020-01-02 * "C"
+          Assets:Checking  -10 USD
+          Expenses:FIXME:A  10 USD
+
+        2020-01-10 * "D"
+          Assets:Checking  -10 USD
+          Expenses:FIXME    10 USD
+
+        2020-01-02 * "E"
+          Assets:Checking  -10 EUR
+          Expenses:FIXME    10 EUR
+        """)
+    query, = test_util.parse("""
+        2020-01-02 * "Q"
+          Assets:Checking  -10 USD
+          Expenses:FIXME    10 USD
+        """)
+    entries_by_narration = {entry.narration: entry for entry in entries}
+    posting_db = _make_posting_db(entries)
+
+    # Known account: only postings in the same account or an unknown account,
+    # ordered by date and then insertion order.
+    assert _format_posting_matches(
+        posting_db.get_posting_matches(query, query.postings[0])) == [
+            ('A', 'Assets:Checking', '-10 USD'),
+            ('C', 'Assets:Checking', '-10 USD'),
+        ]
+    assert _format_posting_matches(
+        posting_db.get_posting_matches(query, query.postings[0],
+                                       negate=True)) == [
+            ('A', 'Expenses:FIXME', '10 USD'),
+            ('C', 'Expenses:FIXME:A', '10 USD'),
+        ]
+
+    # Unknown account: postings in any account.
+    assert _format_posting_matches(
+        posting_db.get_posting_matches(query, query.postings[1])) == [
+            ('A', 'Expenses:FIXME', '10 USD'),
+            ('C', 'Expenses:FIXME:A', '10 USD'),
+            ('B', 'Expenses:Food', '10 USD'),
+        ]
+
+    posting_db.remove_transaction(entries_by_narration['A'])
+    posting_db.add_transaction(entries_by_narration['A'])
+    posting_db.remove_transaction(entries_by_narration['C'])
+    assert _format_posting_matches(
+        posting_db.get_posting_matches(query, query.postings[1])) == [
+            ('A', 'Expenses:FIXME', '10 USD'),
+            ('B', 'Expenses:Food', '10 USD'),
+        ]
+
+
+def test_posting_database_missing_index():
+    entries = test_util.parse("""
+        2020-01-01 * "A"
+          Assets:Checking  -10 USD
+          Expenses:Food     10 USD
+        """)
+    query, later = test_util.parse("""
+        2020-01-02 * "Q"
+          Assets:Savings   -10 EUR
+          Expenses:FIXME    10 EUR
+
+        2020-01-03 * "B"
+          Assets:Savings   -10 EUR
+          Expenses:Food     10 EUR
+        """)
+    posting_db = _make_posting_db(entries)
+    num_indices = (len(posting_db._account_index),
+                   len(posting_db._currency_index))
+    with posting_db.record_lookups() as dependencies:
+        for posting in query.postings:
+            assert posting_db.get_posting_matches(query, posting) == []
+    # Lookups do not create index buckets.
+    assert (len(posting_db._account_index),
+            len(posting_db._currency_index)) == num_indices
+    assert dependencies.is_valid(posting_db)
+
+    # Creating a bucket consulted by the lookups invalidates them.
+    posting_db.add_transaction(later)
+    assert not dependencies.is_valid(posting_db)
+
+
+def test_matchable_postings_cache():
+    entry, = test_util.parse("""
+        2020-01-01 * "A"
+          Assets:Checking  -10 USD
+          Expenses:FIXME     4 USD
+          Expenses:FIXME     6 USD
+        """)
+    posting_db = _make_posting_db([entry])
+    cache = posting_db.matchable_postings_cache
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    matchable_postings = posting_db.get_matchable_postings(entry)
+    assert len(matchable_postings) == 4
+    assert posting_db.get_matchable_postings(entry) is matchable_postings
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # After invalidation, the postings are recomputed but removal still uses
+    # the postings that were added.
+    cache.invalidate()
+    assert posting_db.get_matchable_postings(entry) is not matchable_postings
+    assert (cache.hits, cache.misses) == (2, 2)
+    posting_db.remove_transaction(entry)
+    assert (cache.hits, cache.misses) == (3, 2)
+    assert posting_db.get_posting_matches(entry, entry.postings[0]) == []
+
+
+def test_aggregate_posting_candidates_limit(caplog):
+    entry, = test_util.parse("""
+        2020-01-01 * "A"
+          Assets:Checking  -10 USD
+          Expenses:FIXME     1 USD
+          Expenses:FIXME     2 USD
+          Expenses:FIXME     3 USD
+          Expenses:FIXME     4 USD
+        """)
+
+    def is_cleared(posting):
+        return False
+
+    def format_candidates(candidates):
+        return [(str(p.units), tuple(str(x.units) for x in subset))
+                for p, subset in candidates]
+
+    all_candidates = format_candidates(
+        matching.get_aggregate_posting_candidates(entry.postings, is_cleared))
+    assert len(all_candidates) == 11
+    assert all_candidates[:2] == [
+        ('3 USD', ('1 USD', '2 USD')),
+        ('4 USD', ('1 USD', '3 USD')),
+    ]
+    assert all_candidates[-1] == ('10 USD', ('1 USD', '2 USD', '3 USD',
+                                             '4 USD'))
+    assert format_candidates(
+        matching.get_aggregate_posting_candidates(
+            entry.postings, is_cleared, max_candidates=3)) == all_candidates[:3]
+    assert caplog.messages == [
+        'Limited aggregate posting candidates to 3 for transaction with 5 '
+        'postings'
+    ]
+
+
+def test_match_search_budget():
+    name = 'match_many_merged'
+    candidate_entry, = test_util.parse(
+        load_match_test_data(name, 'pending_candidate'))
+    posting_db = _make_posting_db(
+        test_util.parse(load_match_test_data(name, 'pending')))
+
+    def get_formatted_results(search_budget=None):
+        posting_db.match_result_cache.clear()
+        return test_util.format_entries([
+            txn for txn, _ in matching.get_extended_transactions(
+                candidate_entry, posting_db, search_budget=search_budget)
+        ])
+
+    expected = get_formatted_results()
+    assert expected != ''
+
+    # An unlimited budget explores the same match sets in a different order.
+    search_budget = matching.MatchSearchBudget()
+    assert get_formatted_results(search_budget) == expected
+    assert not search_budget.truncated
+
+    search_budget = matching.MatchSearchBudget(max_nodes=1)
+    assert get_formatted_results(search_budget) == ''
+    assert search_budget.truncated
+
+    search_budget = matching.MatchSearchBudget(timeout=0)
+    assert get_formatted_results(search_budget) == ''
+    assert search_budget.truncated
+
+
+def test_filter_dominated_match_sets():
+    postings = [object() for _ in range(4)]
+    matches = [(a, b) for a in postings[:2] for b in postings[2:]]
+
+    def make_match_set(indices):
+        return matching.PostingMatchSet([matches[i] for i in indices], ())
+
+    match_sets = [
+        make_match_set(indices) for indices in [
+            (), (0, ), (0, 3), (1, ), (1, 2), (0, 3), (2, ), (1, 2, 3)
+        ]
+    ]
+    filtered = matching.filter_dominated_match_sets(list(match_sets))
+    assert filtered == [match_sets[7], match_sets[2]]
+
+
+def test_match_result_cache():
+    candidate, = test_util.parse("""
+        2020-01-01 * "A"
+          Assets:Checking  -10 USD
+            cleared: TRUE
+          Expenses:FIXME    10 USD
+        """)
+    entries = test_util.parse("""
+        2020-01-02 * "B"
+          Liabilities:Credit-Card  10 USD
+            cleared: TRUE
+          Expenses:FIXME          -10 USD
+        """)
+    unrelated, later, = test_util.parse("""
+        2020-01-02 * "C"
+          Liabilities:Credit-Card  10 EUR
+          Expenses:FIXME          -10 EUR
+
+        2020-01-03 * "D"
+          Liabilities:Credit-Card  10 USD
+          Expenses:FIXME          -10 USD
+        """)
+    posting_db = _make_posting_db(entries)
+    cache = posting_db.match_result_cache
+
+    results = matching.get_extended_transactions(candidate, posting_db)
+    assert len(results) == 1
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert matching.get_extended_transactions(candidate, posting_db) == results
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Changes to postings that were not consulted by the search do not
+    # invalidate the result.
+    posting_db.add_transaction(unrelated)
+    assert matching.get_extended_transactions(candidate, posting_db) == results
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    posting_db.add_transaction(later)
+    results = matching.get_extended_transactions(candidate, posting_db)
+    assert len(results) == 3
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.clear()
+    assert matching.get_extended_transactions(candidate, posting_db) == results
+
+    posting_db.matchable_postings_cache.invalidate()
+    matching.get_extended_transactions(candidate, posting_db)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_transaction_mergeable_predicate():
+    a, b, c, d, e = test_util.parse("""
+        2020-01-01 * "A"
+          note: "x"
+          Assets:Checking  -10 USD
+          Expenses:FIXME    10 USD
+
+        2020-01-01 * "B"
+          Assets:Checking   10 USD
+          Expenses:FIXME   -10 USD
+
+        2020-01-01 * "C"
+          note: "y"
+          Assets:Savings    10 USD
+          Expenses:FIXME   -10 USD
+
+        2020-01-01 * "D"
+          note: "x"
+          other: "z"
+          Expenses:FIXME   -10 USD
+          Expenses:FIXME    10 USD
+
+        2020-01-01 * "E"
+          Assets:Checking  -10 USD
+          Expenses:Food     10 USD
+        """)
+    posting_db = _make_posting_db([b, c, d, e])
+    for predicate in (matching.IsTransactionMergeablePredicate(a),
+                      matching.IsTransactionMergeablePredicate(a, posting_db)):
+        for other in (b, c, d, e):
+            expected = (matching.is_metadata_mergeable(a.meta, other.meta) and
+                        not matching.transaction_has_opposite_posting(
+                            other,
+                            matching.get_transaction_posting_specs(a)))
+            assert predicate(other) == expected
+            assert predicate(other) == expected
+        assert [predicate(other) for other in (b, c, d, e)] == [
+            False, False, True, True
+        ]
+
+
+def _is_never_cleared(posting):
+    return False
+
+
+def test_combination_process_pool():
+    name = 'match_many_merged'
+    candidate_entry, = test_util.parse(
+        load_match_test_data(name, 'pending_candidate'))
+    posting_db = _make_posting_db(
+        test_util.parse(load_match_test_data(name, 'pending')))
+
+    def get_formatted_results(combination_pool=None):
+        posting_db.match_result_cache.clear()
+        return test_util.format_entries([
+            txn for txn, _ in matching.get_extended_transactions(
+                candidate_entry, posting_db, combination_pool=combination_pool)
+        ])
+
+    expected = get_formatted_results()
+    # The `is_cleared` function is pickled for the worker processes.
+    combination_pool = matching.CombinationProcessPool(
+        is_cleared=_is_never_cleared, max_workers=2)
+    try:
+        assert get_formatted_results(combination_pool) == expected
+    finally:
+        combination_pool.shutdown()
+
+
+def test_matching_metrics():
+    name = 'match_many_merged'
+    candidate_entry, = test_util.parse(
+        load_match_test_data(name, 'pending_candidate'))
+    posting_db = _make_posting_db(
+        test_util.parse(load_match_test_data(name, 'pending')))
+
+    metrics = matching.MatchingMetrics()
+    results = matching.get_extended_transactions(
+        candidate_entry, posting_db, metrics=metrics)
+    assert metrics.states_visited > len(results) > 0
+    assert metrics.lookups > 0
+    assert metrics.lookup_candidates >= metrics.lookup_matches > 0
+    assert metrics.aggregate_subsets > 0
+    assert metrics.match_sets > metrics.dominated_match_sets > 0
+    assert metrics.cached_results == 0
+    assert metrics.phase_seconds['total'] >= metrics.phase_seconds['combine']
+
+    matching.get_extended_transactions(
+        candidate_entry, posting_db, metrics=metrics)
+    assert metrics.cached_results == 1
+
+    combined_metrics = matching.MatchingMetrics()
+    combined_metrics.update(metrics)
+    combined_metrics.update(metrics)
+    assert combined_metrics.lookups == 2 * metrics.lookups
+    assert 'states_visited=' in str(combined_metrics)
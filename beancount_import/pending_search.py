@@ -0,0 +1,245 @@
+"""Index for filtering pending entries by text and by field.
+
+A filter query is normally a single case-insensitive substring, which matches a
+pending entry if it occurs in the source name, or in the narration, payee,
+date, or the units or account of a posting of one of its transactions.
+
+If the query contains any terms of the form `field:value`, it is instead split
+into whitespace-separated terms (which may be quoted), all of which must match:
+
+- `account:text`, `payee:text`, `narration:text`, `source:text` match a
+  substring of the specified field;
+
+- `amount:low..high` matches if the absolute value of the units of any posting
+  is in the specified range, where either bound may be omitted, and
+  `amount:number` matches an exact absolute value;
+
+- `date:low..high` and `date:YYYY-MM-DD` similarly match transaction dates;
+  values that are not valid dates match a substring of the date, such that
+  e.g. `date:2017-03` matches dates in March 2017.
+
+The remaining terms are joined by spaces and matched as a substring of any
+field.
+"""
+
+import collections
+import datetime
+import re
+import shlex
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+from beancount.core.amount import Amount
+from beancount.core.data import Transaction
+
+from .sorted_list import SortedList
+
+if False:
+    from .reconcile import PendingEntry  # For typing only.
+
+QUERY_FIELDS = ('account', 'payee', 'narration', 'source', 'amount', 'date')
+
+_query_field_pattern = re.compile(
+    r'(?:^|\s)(' + '|'.join(QUERY_FIELDS) + r'):', re.IGNORECASE)
+
+# Separates the values of text fields, such that a query, which cannot contain
+# it, only matches within a single value.
+TEXT_SEPARATOR = '\x00'
+
+IndexedEntry = NamedTuple('IndexedEntry', [
+    ('text', str),
+    ('field_texts', Dict[str, str]),
+    ('dates', List[int]),
+    ('amounts', List[Decimal]),
+])
+
+# Range of date ordinals or absolute amounts, where `None` indicates an omitted
+# bound.
+QueryRange = Tuple[Optional[Union[int, Decimal]], Optional[Union[int, Decimal]]]
+
+QueryTerm = NamedTuple('QueryTerm', [
+    ('field', Optional[str]),
+    ('text', Optional[str]),
+    ('range', Optional[QueryRange]),
+])
+
+
+def get_indexed_entry(pending: 'PendingEntry') -> IndexedEntry:
+    """Returns the normalized text fields, dates and absolute amounts of a
+    pending entry."""
+    field_values = collections.OrderedDict(
+    )  # type: Dict[str, List[str]]
+    dates = []  # type: List[int]
+    amounts = []  # type: List[Decimal]
+
+    def add_text(field_name, value):
+        if not value: return
+        field_values.setdefault(field_name, []).append(str(value).lower())
+
+    if pending.source:
+        add_text('source', pending.source.name)
+    for entry in pending.entries:
+        if not isinstance(entry, Transaction):
+            # assume we only want transactions when filtering
+            continue
+        add_text('narration', entry.narration)
+        add_text('payee', entry.payee)
+        add_text('date', entry.date.isoformat())
+        dates.append(entry.date.toordinal())
+        for posting in entry.postings:
+            add_text('amount', posting.units)
+            add_text('account', posting.account)
+            units = posting.units
+            if isinstance(units, Amount) and isinstance(units.number, Decimal):
+                amounts.append(abs(units.number))
+    field_texts = {
+        field_name: TEXT_SEPARATOR.join(values)
+        for field_name, values in field_values.items()
+    }
+    return IndexedEntry(
+        text=TEXT_SEPARATOR.join(field_texts.values()),
+        field_texts=field_texts,
+        dates=dates,
+        amounts=amounts)
+
+
+def _parse_range(value: str, parse_bound) -> Optional[QueryRange]:
+    parts = value.split('..')
+    try:
+        if len(parts) == 1:
+            bound = parse_bound(parts[0])
+            return (bound, bound)
+        if len(parts) == 2 and (parts[0] or parts[1]):
+            return (parse_bound(parts[0]) if parts[0] else None,
+                    parse_bound(parts[1]) if parts[1] else None)
+    except (ValueError, InvalidOperation):
+        pass
+    return None
+
+
+def _parse_date_bound(value: str) -> int:
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date().toordinal()
+
+
+def _parse_amount_bound(value: str) -> Decimal:
+    return abs(Decimal(value))
+
+
+def parse_query(query: str) -> List[QueryTerm]:
+    """Parses a filter query into terms, all of which must match."""
+    if _query_field_pattern.search(query) is None:
+        return [QueryTerm(field=None, text=query.lower(), range=None)]
+    try:
+        tokens = shlex.split(query)
+    except ValueError:
+        tokens = query.split()
+    terms = []  # type: List[QueryTerm]
+    unscoped_tokens = []  # type: List[str]
+    for token in tokens:
+        field_name, sep, value = token.partition(':')
+        field_name = field_name.lower()
+        if not sep or field_name not in QUERY_FIELDS:
+            unscoped_tokens.append(token)
+            continue
+        value_range = None  # type: Optional[QueryRange]
+        if field_name == 'date':
+            value_range = _parse_range(value, _parse_date_bound)
+        elif field_name == 'amount':
+            value_range = _parse_range(value, _parse_amount_bound)
+        if value_range is not None:
+            terms.append(
+                QueryTerm(field=field_name, text=None, range=value_range))
+        else:
+            terms.append(
+                QueryTerm(field=field_name, text=value.lower(), range=None))
+    if unscoped_tokens:
+        terms.append(
+            QueryTerm(
+                field=None, text=' '.join(unscoped_tokens).lower(),
+                range=None))
+    return terms
+
+
+class PendingEntrySearchIndex(object):
+    """Index of pending entries, keyed by `id` of the pending entry.
+
+    Range terms are resolved using sorted lists of the dates and amounts, and
+    substring terms by scanning the normalized text of the remaining entries.
+    """
+
+    def __init__(self, pending_entries: Iterable['PendingEntry'] = ()) -> None:
+        entries = self.entries = collections.OrderedDict(
+            (id(pending), get_indexed_entry(pending))
+            for pending in pending_entries)  # type: Dict[int, IndexedEntry]
+        self.dates = SortedList((date, key) for key, entry in entries.items()
+                                for date in entry.dates
+                                )  # type: SortedList[int, int]
+        self.amounts = SortedList(
+            (amount, key) for key, entry in entries.items()
+            for amount in entry.amounts)  # type: SortedList[Decimal, int]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, pending: 'PendingEntry') -> None:
+        key = id(pending)
+        if key in self.entries:
+            return
+        entry = get_indexed_entry(pending)
+        self.entries[key] = entry
+        for date in entry.dates:
+            self.dates.add(date, key)
+        for amount in entry.amounts:
+            self.amounts.add(amount, key)
+
+    def remove(self, pending: 'PendingEntry') -> None:
+        key = id(pending)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for date in entry.dates:
+            self.dates.remove(date, key)
+        for amount in entry.amounts:
+            self.amounts.remove(amount, key)
+
+    def _get_range_candidates(self, term: QueryTerm) -> Set[int]:
+        assert term.range is not None
+        sorted_list = self.dates if term.field == 'date' else self.amounts
+        keys = sorted_list.keys
+        if not keys:
+            return set()
+        lower, upper = term.range
+        if lower is None:
+            lower = keys[0]
+        if upper is None:
+            upper = keys[-1]
+        return set(sorted_list.find(lower, upper))  # type: ignore
+
+    def search(self, query: str) -> Set[int]:
+        """Returns the keys of the entries matching `query`."""
+        entries = self.entries
+        terms = parse_query(query)
+        keys = None  # type: Optional[Set[int]]
+        for term in terms:
+            if term.range is None: continue
+            range_keys = self._get_range_candidates(term)
+            if keys is None:
+                keys = range_keys
+            else:
+                keys.intersection_update(range_keys)
+        matching = (entries.items() if keys is None else
+                    [(key, entries[key]) for key in keys])
+        for term in terms:
+            text = term.text
+            if text is None: continue
+            if TEXT_SEPARATOR in text:
+                return set()
+            field_name = term.field
+            if field_name is None:
+                matching = [(key, entry) for key, entry in matching
+                            if entry.text and text in entry.text]
+            else:
+                matching = [(key, entry) for key, entry in matching
+                            if text in entry.field_texts.get(field_name, '')
+                            and field_name in entry.field_texts]
+        return set(key for key, _ in matching)
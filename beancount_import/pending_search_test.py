@@ -0,0 +1,106 @@
+import collections
+
+from . import pending_search
+from . import reconcile
+from . import test_util
+from .source import ImportResult
+
+FakeSource = collections.namedtuple('FakeSource', ['name'])
+
+ofx_source = FakeSource(name='ofx')
+mint_source = FakeSource(name='mint')
+
+
+def make_pending(text: str, source):
+    entries = test_util.parse(text)
+    return reconcile.make_pending_entry(
+        ImportResult(date=entries[0].date, entries=entries, info=None),
+        source=source)
+
+
+pending_entries = [
+    make_pending(
+        """
+        2017-03-01 * "Whole Foods" "Groceries"
+          Liabilities:Credit-Card  -42.10 USD
+          Expenses:FIXME            42.10 USD
+        """, ofx_source),
+    make_pending(
+        """
+        2017-03-15 * "Coffee shop"
+          Assets:Checking  -3.50 USD
+          Expenses:FIXME    3.50 USD
+        """, mint_source),
+    make_pending(
+        """
+        2017-04-02 * "Paycheck"
+          Assets:Checking   1500.00 USD
+          Income:Salary    -1500.00 USD
+        """, mint_source),
+]
+
+
+def get_matching(index, query):
+    keys = index.search(query)
+    return [i for i, pending in enumerate(pending_entries) if id(pending) in keys]
+
+
+def make_index():
+    index = pending_search.PendingEntrySearchIndex()
+    for pending in pending_entries:
+        index.add(pending)
+    return index
+
+
+def test_substring():
+    index = make_index()
+    assert get_matching(index, 'whole foods') == [0]
+    assert get_matching(index, 'CHECKING') == [1, 2]
+    assert get_matching(index, 'usd') == [0, 1, 2]
+    assert get_matching(index, '2017-03') == [0, 1]
+    assert get_matching(index, 'mint') == [1, 2]
+    assert get_matching(index, 'fo') == [0]
+    assert get_matching(index, '3.50 usd') == [1]
+    assert get_matching(index, 'nonexistent') == []
+
+
+def test_field_scoped():
+    index = make_index()
+    assert get_matching(index, 'account:checking') == [1, 2]
+    assert get_matching(index, 'account:checking payee:coffee') == []
+    assert get_matching(index, 'account:checking narration:coffee') == [1]
+    assert get_matching(index, 'payee:"whole foods"') == [0]
+    assert get_matching(index, 'source:ofx') == [0]
+    assert get_matching(index, 'source:mint paycheck') == [2]
+
+
+def test_ranges():
+    index = make_index()
+    assert get_matching(index, 'amount:42.1') == [0]
+    assert get_matching(index, 'amount:-3.50') == [1]
+    assert get_matching(index, 'amount:1..50') == [0, 1]
+    assert get_matching(index, 'amount:100..') == [2]
+    assert get_matching(index, 'amount:..5') == [1]
+    assert get_matching(index, 'date:2017-03-15') == [1]
+    assert get_matching(index, 'date:2017-03-10..2017-04-30') == [1, 2]
+    assert get_matching(index, 'date:..2017-03-10') == [0]
+    # Invalid dates match a substring of the date.
+    assert get_matching(index, 'date:2017-04') == [2]
+    assert get_matching(index, 'date:2017-03 account:checking') == [1]
+
+
+def test_remove():
+    index = make_index()
+    index.remove(pending_entries[1])
+    assert len(index) == 2
+    assert get_matching(index, 'checking') == [2]
+    assert get_matching(index, 'amount:..5') == []
+    assert get_matching(index, 'date:2017-03-15') == []
+    index.add(pending_entries[1])
+    assert get_matching(index, 'checking') == [1, 2]
+
+
+def test_empty_field_value():
+    index = make_index()
+    assert get_matching(index, 'payee:') == [0]
+    assert get_matching(index, 'payee: narration:paycheck') == []
@@ -0,0 +1,105 @@
+"""Records the time and memory taken by each phase of loading the reconciler.
+
+Each phase records its wall time, the CPU time of the thread that ran it, and
+the increase in the peak resident set size (RSS) of the process.  Since phases,
+such as the preparation of each data source, may run concurrently in separate
+threads, the peak RSS increase of a phase may include memory allocated by
+other threads.  The peak RSS is not available on platforms without the
+`resource` module, in which case it is reported as `None`.
+"""
+
+import contextlib
+import json
+import sys
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore
+
+PhaseTiming = NamedTuple('PhaseTiming', [
+    ('name', str),
+    ('start_time', float),
+    ('wall_time', float),
+    ('cpu_time', float),
+    ('max_rss_delta', Optional[int]),
+])
+
+
+def get_max_rss() -> Optional[int]:
+    """Returns the peak resident set size of the process in bytes, or `None` if
+    not available."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Reported in kilobytes except on macOS.
+        max_rss *= 1024
+    return max_rss
+
+
+class PhaseTimer(object):
+    """Collects the `PhaseTiming` of each phase.
+
+    Phases may be timed concurrently from multiple threads.
+    """
+
+    def __init__(self) -> None:
+        self._start_time = time.perf_counter()
+        self._lock = threading.Lock()
+        self.phases = []  # type: List[PhaseTiming]
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Context manager that records the timing of the enclosed phase.
+
+        The timing is recorded even if the phase raises an exception.
+        """
+        start_max_rss = get_max_rss()
+        start_cpu_time = time.thread_time()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            end_time = time.perf_counter()
+            end_cpu_time = time.thread_time()
+            end_max_rss = get_max_rss()
+            max_rss_delta = None
+            if start_max_rss is not None and end_max_rss is not None:
+                max_rss_delta = end_max_rss - start_max_rss
+            timing = PhaseTiming(
+                name=name,
+                start_time=start_time - self._start_time,
+                wall_time=end_time - start_time,
+                cpu_time=end_cpu_time - start_cpu_time,
+                max_rss_delta=max_rss_delta)
+            with self._lock:
+                self.phases.append(timing)
+
+    def get_report(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable report of the recorded phases, in order
+        of completion.
+
+        Times are in seconds, and `start_time` is relative to the creation of
+        the timer.  Memory sizes are in bytes.
+        """
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            'phases': [timing._asdict() for timing in phases],
+            'max_rss': get_max_rss(),
+        }
+
+
+def write_report(timer: PhaseTimer, path: str) -> None:
+    """Writes the report of `timer` as JSON to `path`, or to standard output if
+    `path` is `-`."""
+    report = json.dumps(timer.get_report(), indent=2)
+    if path == '-':
+        print(report)
+        return
+    with open(path, 'w') as f:
+        f.write(report + '\n')
@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+
+import py
+import pytest
+
+from .phase_timing import PhaseTimer, write_report
+
+
+def test_phase_timer():
+    timer = PhaseTimer()
+    with timer.phase('a'):
+        sum(range(100000))
+    with pytest.raises(ValueError):
+        with timer.phase('b'):
+            raise ValueError()
+    assert [timing.name for timing in timer.phases] == ['a', 'b']
+    a = timer.phases[0]
+    assert a.start_time >= 0
+    assert a.wall_time >= 0
+    assert a.cpu_time >= 0
+    assert timer.phases[1].start_time >= a.start_time + a.wall_time
+
+
+def test_phase_timer_threads():
+    timer = PhaseTimer()
+
+    def run(name):
+        with timer.phase(name):
+            pass
+
+    threads = [
+        threading.Thread(target=run, args=('c%d' % i, )) for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(timing.name for timing in timer.phases) == [
+        'c0', 'c1', 'c2', 'c3'
+    ]
+
+
+def test_write_report(tmpdir: py.path.local):
+    timer = PhaseTimer()
+    with timer.phase('a'):
+        pass
+    path = os.path.join(str(tmpdir), 'report.json')
+    write_report(timer, path)
+    with open(path, 'r') as f:
+        report = json.load(f)
+    assert [phase['name'] for phase in report['phases']] == ['a']
+    assert sorted(report['phases'][0].keys()) == [
+        'cpu_time', 'max_rss_delta', 'name', 'start_time', 'wall_time'
+    ]
@@ -1,4 +1,5 @@
 import collections
+import concurrent.futures
 import datetime
 import re
 from typing import List, Optional, Union, Callable, Dict, Mapping, Tuple, Any, Iterable, Set, NamedTuple
@@ -7,8 +8,11 @@ import os
 import tempfile
 import hashlib
 import string
+import itertools
 import random
 import pickle
+import threading
+import time
 
 from beancount.core.data import Transaction, Posting, Balance, Open, Close, Price, Directive, Entries, Amount
 from beancount.core.flags import FLAG_PADDING
@@ -18,10 +22,15 @@ import beancount.parser.printer
 from . import training
 from . import matching
 from . import journal_editor
+from . import state_snapshot
 from .source import ImportResult, load_source, SourceResults, Source, LogFunction, AssociatedData, InvalidSourceReference, invalid_source_reference_sort_key
 from .posting_date import get_posting_date
 
-from .thread_helpers import call_in_new_thread
+from .thread_helpers import call_in_new_thread, map_in_daemon_threads
+from .pending_search import PendingEntrySearchIndex
+from .sorted_list import IndexedSortedList
+from .phase_timing import PhaseTimer
+from .cleared_dates import ClearedDateIndex
 
 from .matching import FIXME_ACCOUNT, is_unknown_account, CLEARED_KEY
 
@@ -38,6 +47,13 @@ PendingEntry = NamedTuple('PendingEntry', [
     ('id', str),
 ])
 
+# Pending entries ordered by date, identified by the `id` of their first entry.
+PendingEntryList = IndexedSortedList[PendingEntry]
+
+# Uncleared postings ordered by transaction date, identified by the `id` of the
+# transaction and the index of the posting.
+UnclearedPostingList = IndexedSortedList[Tuple[Transaction, Posting]]
+
 AcceptCandidateResult = NamedTuple('AcceptCandidateResult', [
     ('new_entries', Entries),
     ('modified_filenames', List[str]),
@@ -169,56 +185,125 @@ AccountSubstitution = collections.namedtuple('AccountSubstitution', [
 ])
 
 
+class _LazyValue(object):
+    """Value computed by a function when first accessed."""
+
+    def __init__(self, compute: Callable[[], Any]) -> None:
+        self._compute = compute  # type: Optional[Callable[[], Any]]
+        self._value = None  # type: Any
+
+    def get(self) -> Any:
+        if self._compute is not None:
+            self._value = self._compute()
+            self._compute = None
+        return self._value
+
+
+def _make_lazy_value(value: Any) -> _LazyValue:
+    """Returns a `_LazyValue` for `value` if it is callable, or for the value
+    itself otherwise."""
+    if callable(value):
+        return _LazyValue(value)
+    return _LazyValue(lambda: value)
+
+
 class Candidate(object):
+    """A way of resolving one or more pending entries.
+
+    The staged changes and the substituted accounts may be specified either
+    directly or as functions of no arguments that compute them.  In the latter
+    case, they are computed when first accessed, such that candidates that are
+    neither displayed in detail nor accepted remain cheap to construct.
+    """
+
     def __init__(
             self,
-            staged_changes: journal_editor.StagedChanges,
-            staged_changes_with_unique_account_names: journal_editor.
-            StagedChanges,
+            staged_changes: Union[journal_editor.StagedChanges, Callable[
+                [], journal_editor.StagedChanges]],
+            staged_changes_with_unique_account_names: Union[
+                journal_editor.StagedChanges, Callable[
+                    [], journal_editor.StagedChanges]],
             used_import_results: List[Union[Transaction, ImportResult]],
             used_transactions: List[Transaction],
-            substituted_accounts: Optional[List[AccountSubstitution]] = None,
+            substituted_accounts: Union[None, List[AccountSubstitution],
+                                        Callable[[], List[AccountSubstitution]]] = None,
             original_transaction_properties: Optional[dict] = None,
             substitute: Optional[Callable[[Dict[str, Any]], 'Candidate']] = None,
+            unsubstituted_transaction: Optional[Transaction] = None,
     ) -> None:
-        self.staged_changes = staged_changes
-        self.staged_changes_with_unique_account_names = staged_changes_with_unique_account_names
+        self._staged_changes = _make_lazy_value(staged_changes)
+        self._staged_changes_with_unique_account_names = _make_lazy_value(
+            staged_changes_with_unique_account_names)
         self.used_import_results = used_import_results
         self.used_transactions = used_transactions
 
         # If not None, list of (unique_id, account_name, group_number)
-        self.substituted_accounts = substituted_accounts
+        self._substituted_accounts = _make_lazy_value(substituted_accounts)
 
         self.original_transaction_properties = original_transaction_properties
 
         # If not None, Function that when called with list of account names (of same length as substituted_accounts) returns a new candidate.
         self.substitute = substitute
 
+        # If not None, the transaction, still containing unknown accounts, in which the accounts were substituted.
+        self.unsubstituted_transaction = unsubstituted_transaction
+
         self.used_transaction_ids = None  # type: Optional[List[int]]
-        self.associated_data = []  # type: List[AssociatedData]
+        self._associated_data_sources = []  # type: List[Source]
+        self._associated_data = None  # type: Optional[List[AssociatedData]]
+
+    @property
+    def staged_changes(self) -> journal_editor.StagedChanges:
+        return self._staged_changes.get()
+
+    @property
+    def staged_changes_with_unique_account_names(
+            self) -> journal_editor.StagedChanges:
+        return self._staged_changes_with_unique_account_names.get()
+
+    @property
+    def substituted_accounts(self) -> Optional[List[AccountSubstitution]]:
+        return self._substituted_accounts.get()
+
+    @property
+    def new_entries(self) -> List[Directive]:
+        """The entries added by `staged_changes`, without line numbers.
+
+        Unlike the new entries of `staged_changes.get_diff()`, these do not
+        require the changes to be formatted."""
+        return self.staged_changes.get_all_new_entries()
 
     def update_associated_data(self, sources: List[Source]) -> None:
-        self.associated_data = []
-        diff = self.staged_changes.get_diff()
-        for entry in diff.new_entries:
-            for source in sources:
-                results = source.get_associated_data(entry)
-                if results is not None:
-                    self.associated_data.extend(results)
+        self._associated_data_sources = sources
+        self._associated_data = None
+
+    @property
+    def associated_data(self) -> List[AssociatedData]:
+        if self._associated_data is None:
+            associated_data = []  # type: List[AssociatedData]
+            for entry in self.new_entries:
+                for source in self._associated_data_sources:
+                    results = source.get_associated_data(entry)
+                    if results is not None:
+                        associated_data.extend(results)
+            self._associated_data = associated_data
+        return self._associated_data
 
 
 class Candidates(object):
     def __init__(
             self,
             candidates: List[Candidate],
-            pending_data: List[PendingEntry],
+            pending_data: PendingEntryList,
             sources: List[Source],
             date: Optional[datetime.date] = None,
             number: Optional[Decimal] = None,
+            search_truncated: bool = False,
     ) -> None:
         self.candidates = candidates
         self.date = date
         self.number = number
+        self.search_truncated = search_truncated
         self.pending_data = pending_data
         self.sources = sources
 
@@ -232,14 +317,8 @@ class Candidates(object):
                 for transaction in candidate.used_transactions
             ]
             candidate.update_associated_data(self.sources)
-        used_transaction_id_to_pending_index = {
-            id(pending.entries[0]): index
-            for index, pending in enumerate(pending_data)
-        }
-        self.used_transactions = [(transaction,
-                                   used_transaction_id_to_pending_index.get(
-                                       id_value, None)) for id_value,
-                                  (transaction, _) in
+        self.used_transactions = [(transaction, pending_data.index_of(id_value))
+                                  for id_value, (transaction, _) in
                                   used_transaction_ids.items()]
 
     def change_transaction(self, candidate_index: int, changes: Dict[str, Any]):
@@ -349,6 +428,28 @@ def stage_missing_accounts(stage, entry_file_selector, account_map=None):
         stage.add_entry(open_entry, entry_file_selector(open_entry))
 
 
+def get_pending_entry_id(
+        import_result: Union[Transaction, PendingEntry]) -> int:
+    """Returns the id identifying the pending entry of a used import result of a
+    `Candidate` in a `PendingEntryList`."""
+    if isinstance(import_result, PendingEntry):
+        return id(import_result.entries[0])
+    return id(import_result)
+
+
+def _get_posting_index(entry: Transaction, posting: Posting) -> int:
+    for posting_i, p in enumerate(entry.postings):
+        if p is posting:
+            return posting_i
+    raise ValueError('posting not found in entry')
+
+
+def make_pending_entry_list(
+        pending_entries: Iterable[PendingEntry]) -> PendingEntryList:
+    return IndexedSortedList((id(pending.entries[0]), pending.date, pending)
+                             for pending in pending_entries)
+
+
 def make_pending_entry(import_result: ImportResult, source: Optional[Source]):
     printer = beancount.parser.printer.EntryPrinter()
     formatted = '\n'.join(printer(e) for e in import_result.entries)
@@ -363,29 +464,105 @@ def make_pending_entry(import_result: ImportResult, source: Optional[Source]):
     )
 
 
+def _ignore_status(message: str) -> None:
+    pass
+
+
+def _load_source_cleared_predicate(data: bytes) -> '_SourceClearedPredicate':
+    return _SourceClearedPredicate(
+        state_snapshot.loads(data, _ignore_status), _ignore_status)
+
+
+class _SourceClearedPredicate(object):
+    """Picklable equivalent of `LoadedReconciler.is_posting_cleared`, used by
+    the worker processes of the `CombinationProcessPool`.
+
+    The sources are pickled as by `state_snapshot`, with references to the
+    status logging function replaced by one that ignores messages.  They are
+    pickled once, on construction, which raises an exception if any source
+    cannot be pickled.
+    """
+
+    def __init__(self, account_source_map: Dict[str, Source],
+                 log_status: LogFunction) -> None:
+        self.account_source_map = dict(account_source_map)
+        self._pickled_account_source_map = state_snapshot.dumps(
+            self.account_source_map, log_status)
+
+    def __call__(self, posting: Posting) -> bool:
+        source = self.account_source_map.get(posting.account)
+        if source is None: return False
+        return source.is_posting_cleared(posting)
+
+    def __reduce__(self):
+        return (_load_source_cleared_predicate,
+                (self._pickled_account_source_map, ))
+
+
 class LoadedReconciler(object):
     """Represents the loaded reconciler state."""
 
-    def __init__(self, reconciler, sources=None, classifier=None) -> None:
+    def __init__(self,
+                 reconciler,
+                 sources=None,
+                 classifier=None,
+                 phase_timer: Optional[PhaseTimer] = None,
+                 initial_manifest: Optional[List[
+                     state_snapshot.ManifestEntry]] = None) -> None:
         self.reconciler = reconciler
+        # Timings of the phases of loading, reported by the
+        # `phase_timing_report` option.
+        self.phase_timer = phase_timer or PhaseTimer()
+        # Manifest of the inputs computed by
+        # `state_snapshot.get_initial_manifest` before loading, if the
+        # `state_snapshot` option is set.
+        self.initial_manifest = initial_manifest
         reconciler.log_status('Loading journal')
-        self.editor = journal_editor.JournalEditor(reconciler.journal_path,
-                                                   reconciler.ignore_path)
+        self.editor = journal_editor.JournalEditor(
+            reconciler.journal_path,
+            reconciler.ignore_path,
+            phase_timer=self.phase_timer)
+        if reconciler.options.get('write_behind_delay') is not None:
+            self.editor.defer_writes(write_behind_log=True)
         self.errors = [('error', e[1], e[0]) for e in self.editor.errors]
 
         if sources is not None:
             self.sources = sources
         else:
             # Load sources
-            self._load_sources()
+            with self.phase_timer.phase('load_sources'):
+                self._load_sources()
 
         self.posting_db = matching.PostingDatabase(
             fuzzy_match_days=reconciler.options['fuzzy_match_days'],
             fuzzy_match_amount=reconciler.options['fuzzy_match_amount'],
             is_cleared=self.is_posting_cleared,
             metadata_keys=frozenset([matching.CHECK_KEY]),
+            max_aggregate_posting_candidates=reconciler.options.get(
+                'max_aggregate_posting_candidates'),
         )
+        # Pool of worker processes used for matching, if the `match_processes`
+        # option is set.  Created by `_get_combination_pool` when first needed.
+        self.combination_pool = None  # type: Optional[matching.CombinationProcessPool]
+        # Indicates that the sources could not be pickled for the worker
+        # processes of `combination_pool`.
+        self._combination_pool_unavailable = False
+        # Metrics of the most recent match search, and of all match searches,
+        # if the `match_metrics` option is set.
+        self.last_match_metrics = None  # type: Optional[matching.MatchingMetrics]
+        self.total_match_metrics = None  # type: Optional[matching.MatchingMetrics]
+        if reconciler.options.get('match_metrics'):
+            self.total_match_metrics = matching.MatchingMetrics()
+        # Held while `posting_db` is searched for matches, which may also be
+        # done in the background by `_start_prefetching_matches`.
+        self._match_lock = threading.Lock()
+        # Incremented to stop the background search started by
+        # `_start_prefetching_matches`.
+        self._prefetch_generation = 0
+        self._prefetch_future = None  # type: Optional[concurrent.futures.Future]
         self.filter_text = ""
+        # Index of `full_pending_data`, built by `set_filter` when first needed.
+        self._pending_search_index = None  # type: Optional[PendingEntrySearchIndex]
 
         # Set of ids of transactions pending import.  Used to determine whether a transaction found
         # in the posting_db is an existing or pending transaction.
@@ -394,8 +571,24 @@ class LoadedReconciler(object):
         self.balance_entries = dict(
         )  # type: Dict[Tuple[datetime.date, str, str], Decimal]
         self.price_values = set()  # type: Set[Tuple[datetime.date, str, Amount]]
-        all_source_results = self._prepare_sources()
-        self._preprocess_entries()
+
+        # If the `stream_pending` option is set, the sources are prepared in the
+        # background, and their results are applied by
+        # `publish_prepared_sources`.
+        self.source_futures = [
+        ]  # type: List[concurrent.futures.Future]
+        self._num_published_sources = 0
+        # Maps each account to the journal transactions with postings to it,
+        # keyed by id, in journal order.  Maintained along with
+        # `uncleared_postings`.
+        self._journal_transactions_by_account = {
+        }  # type: Dict[str, Dict[int, Transaction]]
+        if reconciler.options.get('stream_pending') and self.sources:
+            all_source_results = self._start_preparing_sources()
+        else:
+            all_source_results = self._prepare_sources()
+        with self.phase_timer.phase('preprocess_entries'):
+            self._preprocess_entries()
         self._match_sources(all_source_results)
         self._feature_extractor = training.FeatureExtractor(
             account_source_map=self.account_source_map,
@@ -404,7 +597,9 @@ class LoadedReconciler(object):
             sources=self.sources,
         )
         self.training_examples = training.TrainingExamples()
-        self._extract_training_examples(self.editor.entries)
+        if not self.sources_pending:
+            with self.phase_timer.phase('training_examples'):
+                self._extract_training_examples(self.editor.entries)
 
         self.classifier = classifier
         if self.classifier is None:
@@ -412,7 +607,8 @@ class LoadedReconciler(object):
             if classifier_cache_path is not None and os.path.exists(
                     classifier_cache_path):
                 try:
-                    with open(classifier_cache_path, 'rb') as cache_f:
+                    with self.phase_timer.phase('classifier_load'), \
+                         open(classifier_cache_path, 'rb') as cache_f:
                         cache_data = pickle.load(cache_f)
                         version = cache_data['version']
                         if version != classifier_cache_version_number:
@@ -423,13 +619,67 @@ class LoadedReconciler(object):
                     traceback.print_exc()
                     print('Not using classifier cache due to above error')
 
-        if self.classifier is None:
+        if self.classifier is None and not self.sources_pending:
             self._maybe_train_classifier()
 
+    @property
+    def sources_pending(self) -> bool:
+        """Indicates whether the results of some sources are not yet
+        published."""
+        return self._num_published_sources < len(self.source_futures)
+
+    def restore_from_snapshot(self, reconciler) -> None:
+        """Completes the state loaded by `state_snapshot.load`."""
+        self.reconciler = reconciler
+        if reconciler.options.get('match_metrics'):
+            self.total_match_metrics = matching.MatchingMetrics()
+        self.editor.stop_deferring_writes()
+        if reconciler.options.get('write_behind_delay') is not None:
+            self.editor.defer_writes(write_behind_log=True)
+
+    def _get_combination_pool(
+            self) -> Optional[matching.CombinationProcessPool]:
+        """Returns the pool of worker processes used for matching, creating it
+        if necessary.
+
+        The worker processes receive a copy of `account_source_map`, so the
+        pool must be reset by `_reset_combination_pool` when it changes.  If
+        the sources cannot be pickled for the worker processes, this is
+        reported, and `None` is returned until the pool is reset, such that
+        matches are searched for in this process.
+        """
+        match_processes = self.reconciler.options.get('match_processes')
+        if not match_processes or self._combination_pool_unavailable:
+            return None
+        if self.combination_pool is None:
+            try:
+                is_cleared = _SourceClearedPredicate(
+                    self.account_source_map, self.reconciler.log_status)
+            except Exception as e:
+                self.reconciler.log_status(
+                    'Searching for matches without worker processes, since '
+                    'the sources cannot be pickled: %r' % (e, ))
+                self._combination_pool_unavailable = True
+                return None
+            self.combination_pool = matching.CombinationProcessPool(
+                is_cleared=is_cleared, max_workers=match_processes)
+        return self.combination_pool
+
+    def _reset_combination_pool(self) -> None:
+        self._combination_pool_unavailable = False
+        if self.combination_pool is not None:
+            self.combination_pool.shutdown()
+            self.combination_pool = None
+
     def _extract_training_examples(self, entries: Entries) -> None:
         self._feature_extractor.extract_examples(entries,
                                                  self.training_examples)
 
+    def _remove_training_examples(self, entries: Entries) -> None:
+        removed_examples = training.TrainingExamples()
+        self._feature_extractor.extract_examples(entries, removed_examples)
+        self.training_examples.remove_examples(removed_examples)
+
     def _load_sources(self):
         sources = self.sources = [
             load_source(spec, log_status=self.reconciler.log_status)
@@ -441,6 +691,11 @@ class LoadedReconciler(object):
         for entry in self.editor.entries:
             if isinstance(entry, Transaction):
                 posting_db.add_transaction(entry)
+        self._get_balance_and_price_entries()
+
+    def _get_balance_and_price_entries(self):
+        self.balance_entries.clear()
+        self.price_values.clear()
         for entry in self.editor.all_entries:
             if isinstance(entry, Price):
                 self.price_values.add((entry.date, entry.currency,
@@ -456,6 +711,27 @@ class LoadedReconciler(object):
 
     def retrain(self):
         self._maybe_train_classifier()
+
+    def log_write_conflicts(self) -> None:
+        """Reports the journal files whose deferred writes were not flushed
+        because they were modified concurrently."""
+        write_conflicts = self.editor.write_conflicts
+        if write_conflicts:
+            self.reconciler.log_status(
+                'Not writing changes to %s, since modified concurrently' %
+                ', '.join(map(repr, write_conflicts)))
+
+    def close(self):
+        """Releases the worker processes, if any, used for matching.
+
+        This waits for any sources still being prepared in the background, and
+        writes any journal changes whose writes were deferred.
+        """
+        concurrent.futures.wait(self.source_futures)
+        self._stop_prefetching_matches()
+        self.editor.flush_deferred_writes()
+        self.log_write_conflicts()
+        self._reset_combination_pool()
         return self
 
     def _maybe_train_classifier(self):
@@ -471,7 +747,8 @@ class LoadedReconciler(object):
 
             self.classifier = nltk.classify.scikitlearn.SklearnClassifier(
                 estimator=sklearn.tree.DecisionTreeClassifier())
-            self.classifier.train(training_examples)
+            with self.phase_timer.phase('classifier_train'):
+                self.classifier.train(training_examples)
             self.reconciler.log_status(
                 'Trained classifier with %d examples.' % len(training_examples))
             classifier_cache_path = self.reconciler.options['classifier_cache']
@@ -509,79 +786,210 @@ class LoadedReconciler(object):
     def _prepare_sources(self) -> List[SourceResults]:
         self.reconciler.log_status('Matching source data')
         self.account_source_map = dict()  # type: Dict[str, Source]
-        invalid_references = [
+        self.invalid_references = [
         ]  # type: List[Tuple[Source, InvalidSourceReference]]
+        self._source_errors = []  # type: List[Tuple[str, str, Any]]
         all_source_results = []  # type: List[SourceResults]
-        for source in self.sources:
-            source_results = SourceResults()
-            source.prepare(self.editor, source_results)
-            for account in source_results.accounts:
-                self.account_source_map[account] = source
-            for message in source_results.messages:
-                message_source = {'source': source.name}
-                meta = message[2]
-                if meta is not None:
-                    for k in ('filename', 'lineno'):
-                        if k in meta:
-                            message_source[k] = meta[k]
-                self.errors.append((message[0], message[1], message_source))
-            invalid_references.extend(
-                (source, r) for r in source_results.invalid_references)
+        prepare_threads = self.reconciler.options.get('prepare_threads')
+        if prepare_threads and len(self.sources) > 1:
+            # Compute the lazily-initialized `all_entries` before the sources
+            # access the editor concurrently.
+            self.editor.all_entries
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=prepare_threads) as executor:
+                prepared_sources = list(
+                    executor.map(self._prepare_source, self.sources)
+                )  # type: Iterable[Tuple[SourceResults, float]]
+        else:
+            prepared_sources = map(self._prepare_source, self.sources)
+        # Results are merged in the order in which the sources are specified,
+        # regardless of the order in which they finish.
+        for source, (source_results, seconds) in zip(self.sources,
+                                                      prepared_sources):
+            self._add_source_results(source, source_results, seconds)
             all_source_results.append(source_results)
-        invalid_references.sort(
+        self.errors.extend(self._source_errors)
+        self.invalid_references.sort(
             key=lambda x: invalid_source_reference_sort_key(x[1]))
-        self.invalid_references = invalid_references
         return all_source_results
 
+    def _add_source_results(self, source: Source,
+                            source_results: SourceResults,
+                            seconds: float) -> None:
+        self.reconciler.log_status(
+            '%s: prepared in %.3f seconds' % (source.name, seconds))
+        for account in source_results.accounts:
+            self.account_source_map[account] = source
+        for message in source_results.messages:
+            message_source = {'source': source.name}
+            meta = message[2]
+            if meta is not None:
+                for k in ('filename', 'lineno'):
+                    if k in meta:
+                        message_source[k] = meta[k]
+            self._source_errors.append((message[0], message[1],
+                                        message_source))
+        self.invalid_references.extend(
+            (source, r) for r in source_results.invalid_references)
+
+    def _start_preparing_sources(self) -> List[SourceResults]:
+        """Starts preparing the sources in background threads.
+
+        :returns: An empty list of source results, since no results are
+            available yet.
+        """
+        self.reconciler.log_status('Matching source data')
+        self.account_source_map = dict()
+        self.invalid_references = []
+        self._source_errors = []
+        # Compute the lazily-initialized `all_entries` before the sources
+        # access the editor concurrently.
+        self.editor.all_entries
+        self.source_futures = map_in_daemon_threads(
+            self._prepare_source,
+            self.sources,
+            max_workers=self.reconciler.options.get('prepare_threads') or 1)
+        return []
+
+    def _prepare_source(self, source: Source) -> Tuple[SourceResults, float]:
+        """Calls `source.prepare`.
+
+        :returns: The results and the number of seconds taken.
+        """
+        start_time = time.perf_counter()
+        source_results = SourceResults()
+        with self.phase_timer.phase('prepare_source:%s' % source.name):
+            source.prepare(self.editor, source_results)
+        return source_results, time.perf_counter() - start_time
+
     def _match_sources(self, all_source_results: List[SourceResults]):
-        source_balance_and_price_entries = collections.OrderedDict(
-        )  # type: Dict[Source, List[Directive]]
-
-        import_results = []
-        for source, source_results in zip(self.sources, all_source_results):
-            filtered_import_results, balance_and_price_entries = self._filter_import_results(
-                source, source_results.pending)
-            if balance_and_price_entries:
-                balance_and_price_entries.sort(key=lambda x: x.date)
-                source_balance_and_price_entries[
-                    source] = balance_and_price_entries
-            import_results.extend(filtered_import_results)
-        import_results.sort(key=lambda x: x.date)
-        self.errors.sort(key=lambda x: x[0] == 'warning')
+        with self.phase_timer.phase('match_sources'):
+            pending_data = make_pending_entry_list(
+                self._get_pending_entries(all_source_results))
 
-        # Produce final candidates with pending balance and price entries.
-        for source, balance_and_price_entries in source_balance_and_price_entries.items(
-        ):
-            import_results.append(
-                make_pending_entry(
-                    ImportResult(
-                        date=balance_and_price_entries[0].date,
-                        entries=balance_and_price_entries,
-                        info=None),
-                    source=source))
+        self.uncleared_postings = IndexedSortedList(
+        )  # type: UnclearedPostingList
+        with self.phase_timer.phase('uncleared_postings'):
+            self._get_uncleared_postings()
+
+        self.pending_data = pending_data
+        self.full_pending_data = pending_data
+        if not self.sources_pending:
+            self.reconciler.log_status('Done loading')
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Returns the state saved by `state_snapshot.save`.
+
+        The reconciler, and the resources used for matching and for preparing
+        sources in the background, are excluded.
+        """
+        state = self.__dict__.copy()
+        for key in ('reconciler', 'combination_pool',
+                    '_combination_pool_unavailable', '_match_lock',
+                    '_prefetch_future', 'source_futures',
+                    '_pending_search_index', 'last_match_metrics',
+                    'total_match_metrics', 'phase_timer',
+                    '_journal_transactions_by_account', 'initial_manifest'):
+            del state[key]
+        # Object ids are not preserved by pickling, so the pending
+        # transactions are saved in place of their ids.
+        state['pending_transaction_ids'] = [
+            entry for pending in self.full_pending_data
+            for entry in pending.entries
+            if id(entry) in self.pending_transaction_ids
+        ]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.pending_transaction_ids = set(
+            map(id, state['pending_transaction_ids']))
+        # Rebuild the lists keyed by object ids, retaining their order.
+        full_pending_data = self.full_pending_data
+        self.full_pending_data = make_pending_entry_list(full_pending_data)
+        if self.pending_data is full_pending_data:
+            self.pending_data = self.full_pending_data
+        else:
+            self.pending_data = make_pending_entry_list(self.pending_data)
+        self.uncleared_postings = IndexedSortedList(
+            ((id(entry), _get_posting_index(entry, posting)), entry.date,
+             (entry, posting)) for entry, posting in self.uncleared_postings)
+        self.combination_pool = None
+        self._combination_pool_unavailable = False
+        self._match_lock = threading.Lock()
+        self._prefetch_future = None
+        self.source_futures = []
+        self._pending_search_index = None
+        self.last_match_metrics = None
+        self.total_match_metrics = None
+        self.phase_timer = PhaseTimer()
+        self.initial_manifest = None
+        self._journal_transactions_by_account = {}
+        self._add_journal_transactions(self.editor.entries)
+
+    def _get_pending_entries(self, all_source_results: List[SourceResults]
+                             ) -> List[PendingEntry]:
+        self.errors.sort(key=lambda x: x[0] == 'warning')
+        # The filtered import results of each source, and the pending entry
+        # containing its balance and price entries.
+        self._source_pending_entries = [
+            self._get_source_pending_entries(source, source_results)
+            for source, source_results in zip(self.sources, all_source_results)
+        ]  # type: List[Tuple[List[PendingEntry], Optional[PendingEntry]]]
 
         # Add FIXME transactions
         fixme_transactions = self._get_fixme_transactions()
         fixme_transactions.sort(key=lambda x: x.date)
-        for entry in fixme_transactions:
-            import_results.append(
-                make_pending_entry(
-                    ImportResult(date=entry.date, entries=(entry, ), info=None),
-                    None))
+        self._fixme_pending_entries = [
+            make_pending_entry(
+                ImportResult(date=entry.date, entries=(entry, ), info=None),
+                None) for entry in fixme_transactions
+        ]
+        return self._combine_pending_entries()
+
+    def _get_source_pending_entries(
+            self, source: Source, source_results: SourceResults
+    ) -> Tuple[List[PendingEntry], Optional[PendingEntry]]:
+        filtered_import_results, balance_and_price_entries = self._filter_import_results(
+            source, source_results.pending)
+        if not balance_and_price_entries:
+            return filtered_import_results, None
+        balance_and_price_entries.sort(key=lambda x: x.date)
+        return filtered_import_results, make_pending_entry(
+            ImportResult(
+                date=balance_and_price_entries[0].date,
+                entries=balance_and_price_entries,
+                info=None),
+            source=source)
+
+    def _combine_pending_entries(self) -> List[PendingEntry]:
+        import_results = [
+            pending for filtered_import_results, _ in self._source_pending_entries
+            for pending in filtered_import_results
+        ]
+        import_results.sort(key=lambda x: x.date)
 
-        self.uncleared_postings = []  # type: List[Tuple[Transaction, Posting]]
-        self._get_uncleared_postings()
+        # Produce final candidates with pending balance and price entries.
+        for _, balance_and_price_pending in self._source_pending_entries:
+            if balance_and_price_pending is not None:
+                import_results.append(balance_and_price_pending)
 
+        import_results.extend(self._fixme_pending_entries)
         import_results.sort(key=lambda pendingEntry: pendingEntry.date)
-
-        self.pending_data = import_results
-        self.full_pending_data = import_results
-        self.reconciler.log_status('Done loading')
+        return import_results
 
     def set_filter(self, filter: str):
         self.filter_text = filter
-        self.pending_data = [ p for p in self.full_pending_data if
-                              self._match_candidate(p) ]
+        if not filter:
+            self.pending_data = make_pending_entry_list(self.full_pending_data)
+            return
+        index = self._pending_search_index
+        if index is None:
+            index = self._pending_search_index = PendingEntrySearchIndex(
+                self.full_pending_data)
+        matching_ids = index.search(filter)
+        self.pending_data = make_pending_entry_list(
+            p for p in self.full_pending_data if id(p) in matching_ids)
 
     def _get_fixme_transactions(self):
         output = []
@@ -593,16 +1001,21 @@ class LoadedReconciler(object):
                     output.append(entry)
         return output
 
-    def _add_uncleared_postings_from(self,
-                                     entries: Iterable[Directive]) -> None:
-        cleared_dates = self.cleared_dates
+    def _add_uncleared_postings_from(
+            self,
+            entries: Iterable[Directive],
+            accounts: Optional[Set[str]] = None) -> None:
+        """Adds the uncleared postings of `entries`, only considering postings
+        in `accounts` if specified."""
+        cleared_date_index = self.cleared_date_index
         uncleared = self.uncleared_postings
         account_source_map = self.account_source_map
-        default_cleared = (datetime.date.min, datetime.date.max)
         for entry in entries:
             if not isinstance(entry, Transaction): continue
             if entry.flag == FLAG_PADDING: continue
-            for posting in entry.postings:
+            for posting_i, posting in enumerate(entry.postings):
+                if accounts is not None and posting.account not in accounts:
+                    continue
                 if posting.meta and posting.meta.get(CLEARED_KEY) == True:
                     continue
                 if posting.units is not MISSING and posting.units.number == ZERO:
@@ -610,51 +1023,86 @@ class LoadedReconciler(object):
                 source = account_source_map.get(posting.account)
                 if source is None: continue
                 if source.is_posting_cleared(posting): continue
-                cleared_before, cleared_after = cleared_dates.get(
-                    posting.account, default_cleared)
+                cleared_before, cleared_after = cleared_date_index.get(
+                    posting.account)
                 d = get_posting_date(entry, posting)
                 if d < cleared_before or d > cleared_after:
                     continue
-                uncleared.append((entry, posting))
+                uncleared.add((id(entry), posting_i), entry.date,
+                              (entry, posting))
+
+    def _remove_uncleared_postings_from(self,
+                                        entries: Iterable[Directive]) -> None:
+        uncleared = self.uncleared_postings
+        for entry in entries:
+            if not isinstance(entry, Transaction): continue
+            for posting_i in range(len(entry.postings)):
+                uncleared.remove((id(entry), posting_i))
+
+    def _add_journal_transactions(self, entries: Iterable[Directive]) -> None:
+        transactions_by_account = self._journal_transactions_by_account
+        for entry in entries:
+            if not isinstance(entry, Transaction): continue
+            for posting in entry.postings:
+                transactions_by_account.setdefault(posting.account,
+                                                   {})[id(entry)] = entry
+
+    def _remove_journal_transactions(self,
+                                     entries: Iterable[Directive]) -> None:
+        transactions_by_account = self._journal_transactions_by_account
+        for entry in entries:
+            if not isinstance(entry, Transaction): continue
+            for posting in entry.postings:
+                transactions = transactions_by_account.get(posting.account)
+                if transactions is None: continue
+                transactions.pop(id(entry), None)
+                if not transactions:
+                    del transactions_by_account[posting.account]
 
     def _get_uncleared_postings(self):
-        cleared_dates = dict(
-        )  # type: Dict[str, Tuple[datetime.date,datetime.date]]
-        for account_name in sorted(self.editor.accounts):
-            account = self.editor.accounts[account_name]
-            meta = account.meta
-            if meta is None: continue
-            parts = account_name.split(':')
-            cleared_before = datetime.date.min
-            cleared_after = datetime.date.max
-            for part_i in range(1, len(parts)):
-                ancestor_account_name = ':'.join(parts[:part_i])
-                ancestor_cleared_dates = cleared_dates.get(ancestor_account_name)
-                if ancestor_cleared_dates is None: continue
-                (ancestor_cleared_before,
-                 ancestor_cleared_after) = ancestor_cleared_dates
-                cleared_before = max(cleared_before, ancestor_cleared_before)
-                cleared_after = min(cleared_after, ancestor_cleared_after)
-
-            cur_cleared_before = meta.get('cleared_before', datetime.date.min)
-            if not isinstance(cur_cleared_before, datetime.date):
-                self.errors.append(
-                    ('error', '%s: Expected cleared_before value to be a date' %
-                     (account_name, ), meta))
-                cur_cleared_before = datetime.date.min
-            cleared_before = max(cleared_before, cur_cleared_before)
-            cur_cleared_after = meta.get('cleared_after', datetime.date.max)
-            if not isinstance(cur_cleared_after, datetime.date):
-                self.errors.append(
-                    ('error', '%s: Expected cleared_after value to be a date' %
-                     (account_name, ), meta))
-                cur_cleared_after = datetime.date.max
-            cleared_after = min(cleared_after, cur_cleared_after)
-            if cleared_before != datetime.date.min or cleared_after != datetime.date.max:
-                cleared_dates[account_name] = (cleared_before, cleared_after)
-        self.cleared_dates = cleared_dates
+        self.cleared_date_index = self._get_cleared_date_index()
+        self._add_journal_transactions(self.editor.entries)
         self._add_uncleared_postings_from(self.editor.entries)
 
+    def _replace_uncleared_postings(
+            self, old_entries: Entries, new_entries: Entries,
+            cleared_date_index: ClearedDateIndex) -> None:
+        """Updates the uncleared postings after `old_entries` are replaced by
+        `new_entries` in the journal, and the cleared date ranges are replaced
+        by `cleared_date_index`.
+
+        Only `new_entries`, and the postings of the journal transactions in
+        accounts whose cleared date range changed, are evaluated.
+        """
+        changed_accounts = cleared_date_index.get_changed_accounts(
+            self.cleared_date_index)
+        self.cleared_date_index = cleared_date_index
+        self._remove_uncleared_postings_from(old_entries)
+        self._remove_journal_transactions(old_entries)
+        self._add_journal_transactions(new_entries)
+        changed_transactions = collections.OrderedDict(
+        )  # type: Dict[int, Transaction]
+        for account in sorted(changed_accounts):
+            changed_transactions.update(
+                self._journal_transactions_by_account.get(account, {}))
+        for entry_id in map(id, new_entries):
+            changed_transactions.pop(entry_id, None)
+        uncleared = self.uncleared_postings
+        for entry in changed_transactions.values():
+            for posting_i, posting in enumerate(entry.postings):
+                if posting.account in changed_accounts:
+                    uncleared.remove((id(entry), posting_i))
+        self._add_uncleared_postings_from(
+            changed_transactions.values(), accounts=changed_accounts)
+        self._add_uncleared_postings_from(new_entries)
+
+    def _get_cleared_date_index(self) -> ClearedDateIndex:
+        """Returns the cleared date ranges of the accounts, and adds any errors
+        in their specification to `errors`."""
+        cleared_date_index = ClearedDateIndex(self.editor.accounts)
+        self.errors.extend(cleared_date_index.errors)
+        return cleared_date_index
+
     def _filter_import_results(self, source: Source,
                                import_results: List[ImportResult]
                                ) -> Tuple[List[PendingEntry], List[Directive]]:
@@ -693,6 +1141,88 @@ class LoadedReconciler(object):
             output.append(make_pending_entry(import_result, source))
         return output, balance_and_price_entries
 
+    def publish_prepared_sources(self, wait: bool = False) -> bool:
+        """Applies the results of the sources prepared in the background.
+
+        The results are applied in the order in which the sources are
+        specified: the pending entries, errors and invalid references of each
+        source become available once it and all preceding sources have been
+        prepared.  Once all results have been applied, the state is the same as
+        if the sources had been prepared before loading.
+
+        :param wait: If `True`, waits for all sources to be prepared.
+        :returns: `True` if any results were applied.
+        """
+        num_published_sources = self._num_published_sources
+        while self.sources_pending:
+            future = self.source_futures[self._num_published_sources]
+            if not wait and not future.done():
+                break
+            source_results, seconds = future.result()
+            source = self.sources[self._num_published_sources]
+            self._num_published_sources += 1
+            with self.phase_timer.phase('publish_source:%s' % source.name):
+                self._publish_source_results(source, source_results, seconds)
+        if self._num_published_sources == num_published_sources:
+            return False
+
+        self.invalid_references = sorted(
+            self.invalid_references,
+            key=lambda x: invalid_source_reference_sort_key(x[1]))
+        self.errors = [('error', e[1], e[0]) for e in self.editor.errors]
+        self.errors.extend(self._source_errors)
+        self.errors.sort(key=lambda x: x[0] == 'warning')
+        self.cleared_date_index = self._get_cleared_date_index()
+        self.full_pending_data = make_pending_entry_list(
+            self._combine_pending_entries())
+        self._pending_search_index = None
+        self.set_filter(self.filter_text)
+        if not self.sources_pending:
+            self.uncleared_postings = IndexedSortedList()
+            with self.phase_timer.phase('uncleared_postings'):
+                self._add_uncleared_postings_from(self.editor.entries)
+            with self.phase_timer.phase('training_examples'):
+                self._extract_training_examples(self.editor.entries)
+            if self.classifier is None:
+                self._maybe_train_classifier()
+            self.reconciler.log_status('Done loading')
+        return True
+
+    def _publish_source_results(self, source: Source,
+                                source_results: SourceResults,
+                                seconds: float) -> None:
+        self._stop_prefetching_matches()
+        account_source_map = self.account_source_map
+        changed_accounts = set(
+            account for account in source_results.accounts
+            if account_source_map.get(account) is not source)
+        self._add_source_results(source, source_results, seconds)
+
+        # The cleared state of postings in `changed_accounts` may have changed,
+        # which affects their matchable postings.
+        changed_transactions = collections.OrderedDict(
+        )  # type: Dict[int, Transaction]
+        for account in sorted(changed_accounts):
+            changed_transactions.update(
+                self._journal_transactions_by_account.get(account, {}))
+        for pending in self.full_pending_data:
+            for entry in pending.entries:
+                if (id(entry) in self.pending_transaction_ids and any(
+                        p.account in changed_accounts for p in entry.postings)):
+                    changed_transactions[id(entry)] = entry
+        for transaction in changed_transactions.values():
+            self.posting_db.remove_transaction(transaction)
+            self.posting_db.add_transaction(transaction)
+        if changed_accounts:
+            self._reset_combination_pool()
+
+        self._source_pending_entries.append(
+            self._get_source_pending_entries(source, source_results))
+        self._add_uncleared_postings_from(
+            (transaction for transaction in changed_transactions.values()
+             if id(transaction) not in self.pending_transaction_ids),
+            accounts=changed_accounts)
+
     @property
     def num_pending(self) -> int:
         return len(self.pending_data)
@@ -709,6 +1239,32 @@ class LoadedReconciler(object):
             print('predicted account = %r' % (predicted_account, ))
         return predicted_account
 
+    def predict_account_with_confidence(
+            self, prediction_input: Optional[training.PredictionInput]
+    ) -> Tuple[str, float]:
+        """Returns the predicted account and the probability of it estimated by
+        the classifier."""
+        if self.classifier is None or prediction_input is None:
+            return FIXME_ACCOUNT, 0.0
+        prob_dist = self.classifier.prob_classify(
+            training.get_features(prediction_input))
+        predicted_account = prob_dist.max()
+        return predicted_account, prob_dist.prob(predicted_account)
+
+    def get_unknown_account_prediction_confidences(
+            self, transaction: Transaction) -> List[Tuple[str, float]]:
+        """Returns the predicted account and its probability for each unknown
+        account posting of `transaction`."""
+        group_predictions = [
+            self.predict_account_with_confidence(prediction_input)
+            for prediction_input in self._feature_extractor.
+            extract_unknown_account_group_features(transaction)
+        ]
+        group_numbers = training.get_unknown_account_group_numbers(transaction)
+        return [
+            group_predictions[group_number] for group_number in group_numbers
+        ]
+
     def _get_generic_stage(self, entries: Entries):
         stage = self.editor.stage_changes()
         for entry in entries:
@@ -744,112 +1300,156 @@ class LoadedReconciler(object):
             group_predictions[group_number] for group_number in group_numbers
         ]
 
-    def _make_candidate_with_substitutions(self,
-                                           transaction: Transaction,
-                                           used_transactions: List[Transaction],
-                                           predicted_accounts: List[str],
-                                           changes: dict = {}):
+    def _make_candidate_with_substitutions(
+            self,
+            transaction: Transaction,
+            used_transactions: List[Transaction],
+            predicted_accounts: Optional[List[str]] = None,
+            changes: dict = {}):
+        """Returns a candidate that replaces `used_transactions` with
+        `transaction`, with its unknown accounts substituted.
+
+        If `predicted_accounts` is `None`, the unknown accounts are predicted
+        when the substituted accounts or staged changes of the candidate are
+        first accessed.
+        """
         assert isinstance(changes, dict)
         new_accounts = changes.get('accounts')
-        if new_accounts is None:
-            new_accounts = predicted_accounts
-        else:
+        if new_accounts is not None:
             assert isinstance(new_accounts, list) and all(
                 isinstance(x, str) for x in new_accounts)
-        unique_ids = [
-            _get_unique_id_for_account(account) for account in new_accounts
-        ]
-        account_map = {
-            unique_id: account
-            for unique_id, account in zip(unique_ids, new_accounts)
-        }
-        group_numbers = training.get_unknown_account_group_numbers(transaction)
-        unknown_names = training.get_unknown_account_names(transaction)
-        substitutions = [
-            AccountSubstitution(
-                unique_name=unique_id,
-                account_name=new_account,
-                group_number=group_number,
-                unknown_account_name=unknown_account,
-                predicted_account_name=predicted_account)
-            for unique_id, new_account, group_number, unknown_account,
-            predicted_account in zip(unique_ids, new_accounts, group_numbers,
-                                     unknown_names, predicted_accounts)
-        ]
+        if predicted_accounts is None:
+            predictions = _LazyValue(
+                lambda: self._get_unknown_account_predictions(transaction))
+        else:
+            predictions = _make_lazy_value(predicted_accounts)
+
+        def get_substitutions():
+            cur_predicted_accounts = predictions.get()
+            accounts = new_accounts
+            if accounts is None:
+                accounts = cur_predicted_accounts
+            unique_ids = [
+                _get_unique_id_for_account(account) for account in accounts
+            ]
+            group_numbers = training.get_unknown_account_group_numbers(
+                transaction)
+            unknown_names = training.get_unknown_account_names(transaction)
+            substitutions = [
+                AccountSubstitution(
+                    unique_name=unique_id,
+                    account_name=new_account,
+                    group_number=group_number,
+                    unknown_account_name=unknown_account,
+                    predicted_account_name=predicted_account)
+                for unique_id, new_account, group_number, unknown_account,
+                predicted_account in zip(unique_ids, accounts, group_numbers,
+                                         unknown_names, cur_predicted_accounts)
+            ]
+            return accounts, unique_ids, substitutions
+
+        substitution_info = _LazyValue(get_substitutions)
 
         def substitute(changes: dict):
-            return self._make_candidate_with_substitutions(
+            new_candidate = self._make_candidate_with_substitutions(
                 transaction,
                 used_transactions,
                 changes=changes,
-                predicted_accounts=predicted_accounts)
+                predicted_accounts=predictions.get())
+            # Raise any error due to invalid changes now, rather than when the
+            # candidate is displayed.
+            new_candidate.staged_changes_with_unique_account_names
+            return new_candidate
 
         new_transaction = _replace_transaction_properties(transaction, changes)
-        real_transaction = _get_transaction_with_substitutions(
-            new_transaction, new_accounts)
-        transaction_with_unique_account_names = _get_transaction_with_substitutions(
-            new_transaction, unique_ids)
         existing_used_transactions = [
             t for t in used_transactions
             if id(t) not in self.pending_transaction_ids
         ]
 
-        def make_stage(new_transaction, account_map):
+        def make_stage(with_unique_account_names: bool):
+            accounts, unique_ids, _ = substitution_info.get()
+            if with_unique_account_names:
+                stage_transaction = _get_transaction_with_substitutions(
+                    new_transaction, unique_ids)
+                account_map = {
+                    unique_id: account
+                    for unique_id, account in zip(unique_ids, accounts)
+                }  # type: Optional[Dict[str, str]]
+            else:
+                stage_transaction = _get_transaction_with_substitutions(
+                    new_transaction, accounts)
+                account_map = None
             stage = self.editor.stage_changes()
             if existing_used_transactions:
                 stage.change_entry(existing_used_transactions[0],
-                                   new_transaction)
+                                   stage_transaction)
                 for old_entry in existing_used_transactions[1:]:
                     stage.remove_entry(old_entry)
             else:
                 stage.add_entry(
-                    new_transaction,
-                    self.reconciler.entry_file_selector(new_transaction))
+                    stage_transaction,
+                    self.reconciler.entry_file_selector(stage_transaction))
             stage_missing_accounts(stage, self.reconciler.entry_file_selector,
                                    account_map)
             return stage
 
-        real_stage = make_stage(real_transaction, account_map=None)
-        stage_with_unique_account_names = make_stage(
-            transaction_with_unique_account_names, account_map=account_map)
         return Candidate(
-            staged_changes=real_stage,
-            staged_changes_with_unique_account_names=
-            stage_with_unique_account_names,
+            staged_changes=lambda: make_stage(False),
+            staged_changes_with_unique_account_names=lambda: make_stage(True),
             used_import_results=used_transactions,
             used_transactions=used_transactions,
-            substituted_accounts=substitutions,
+            substituted_accounts=lambda: substitution_info.get()[2],
             original_transaction_properties=dict(
                 tags=transaction.tags,
                 links=transaction.links,
                 payee=transaction.payee,
                 narration=transaction.narration,
             ),
-            substitute=substitute)
+            substitute=substitute,
+            unsubstituted_transaction=transaction)
+
+    def _make_match_search_budget(
+            self) -> Optional[matching.MatchSearchBudget]:
+        options = self.reconciler.options
+        max_nodes = options.get('max_match_search_nodes')
+        timeout = options.get('match_search_timeout')
+        if max_nodes is None and timeout is None:
+            return None
+        return matching.MatchSearchBudget(max_nodes=max_nodes, timeout=timeout)
 
     def _make_candidates_from_import_result(self, next_pending):
+        self.last_match_metrics = None
         if len(next_pending.entries) == 1 and isinstance(
                 next_pending.entries[0], Transaction):
             next_entry = next_pending.entries[0]
             candidates = []
-            match_results = matching.get_extended_transactions(
-                next_entry, posting_db=self.posting_db)
+            search_budget = self._make_match_search_budget()
+            if self.total_match_metrics is not None:
+                self.last_match_metrics = matching.MatchingMetrics()
+            with self._match_lock:
+                match_results = matching.get_extended_transactions(
+                    next_entry,
+                    posting_db=self.posting_db,
+                    search_budget=search_budget,
+                    combination_pool=self._get_combination_pool(),
+                    metrics=self.last_match_metrics)
+            if self.total_match_metrics is not None:
+                self.total_match_metrics.update(self.last_match_metrics)
             # Always include the original transaction.
             match_results.append((next_entry, [next_entry]))
             for transaction, used_transactions in match_results:
-                predicted_accounts = self._get_unknown_account_predictions(
-                    transaction)
                 candidates.append(
                     self._make_candidate_with_substitutions(
-                        transaction,
-                        used_transactions,
-                        predicted_accounts=predicted_accounts))
+                        transaction, used_transactions))
             result = Candidates(
                 candidates=candidates,
                 date=next_entry.date,
                 number=self._get_primary_transaction_amount_number(next_entry),
                 pending_data=self.pending_data,
                 sources=self.sources,
+                search_truncated=(search_budget is not None and
+                                  search_budget.truncated),
             )
         else:
             assert next_pending.source is not None
@@ -868,29 +1468,48 @@ class LoadedReconciler(object):
             )
         return result
 
-    def _match_candidate(self, pending: PendingEntry):
-        if not self.filter_text:
-            return True
-        filter = self.filter_text.lower()
-
-        def match(field: Any):
-            if not field: return False
-            return filter in str(field).lower()
-
-        if pending.source and match(pending.source.name):
-            return True
-        for tran in pending.entries:
-            if not isinstance(tran, Transaction):
-                # assume we only want transactions when filtering
-                continue
-            if match(tran.narration) or match(tran.payee):
-                return True
-            if match(tran.date.isoformat()):
-                return True
-            for posting in tran.postings:
-                if match(posting.units) or match(posting.account):
-                    return True
-        return False
+    def _start_prefetching_matches(self, index: int) -> None:
+        """Searches in the background for matches of the pending entries
+        following position `index` of `pending_data`, if the
+        `prefetch_candidates` option is set.
+
+        The results are stored in the `MatchResultCache` of `posting_db`, which
+        discards any result affected by subsequent changes to the database.
+        """
+        self._prefetch_generation += 1
+        num_entries = self.reconciler.options.get('prefetch_candidates')
+        if not num_entries:
+            return
+        transactions = [
+            pending.entries[0]
+            for pending in self.pending_data[index + 1:index + 1 + num_entries]
+            if len(pending.entries) == 1 and
+            isinstance(pending.entries[0], Transaction)
+        ]
+        if transactions:
+            self._prefetch_future = call_in_new_thread(
+                self._prefetch_matches, transactions, self._prefetch_generation)
+
+    def _prefetch_matches(self, transactions: List[Transaction],
+                          generation: int) -> None:
+        for transaction in transactions:
+            with self._match_lock:
+                if generation != self._prefetch_generation:
+                    return
+                matching.get_extended_transactions(
+                    transaction,
+                    posting_db=self.posting_db,
+                    search_budget=self._make_match_search_budget(),
+                    combination_pool=self._get_combination_pool())
+
+    def _stop_prefetching_matches(self) -> None:
+        """Stops the background search, if any, such that `posting_db` may be
+        modified.
+
+        This waits for the search for the current transaction to finish."""
+        self._prefetch_generation += 1
+        with self._match_lock:
+            pass
 
     def get_next_candidates(self, skip_ids: Optional[Dict[str, int]] = None):
         if self.pending_data:
@@ -904,19 +1523,26 @@ class LoadedReconciler(object):
                     skip_ids[pending.id] -= 1
                 else:
                     break
-            return self._make_candidates_from_import_result(
-                pending), i, new_skip_ids
+            candidates = self._make_candidates_from_import_result(pending)
+            self._start_prefetching_matches(i)
+            return candidates, i, new_skip_ids
         return None, None, collections.Counter()
 
+    def get_candidates(self, index: int) -> 'Candidates':
+        """Returns the candidates for the pending entry at position `index` of
+        `pending_data`."""
+        return self._make_candidates_from_import_result(self.pending_data[index])
+
     def get_skip_ids_by_index(self, index: int):
         skip_ids = collections.Counter()  # type: Dict[str, int]
-        for i, pending in enumerate(self.pending_data):
-            if i >= index:
-                break
+        for pending in self.pending_data[:index]:
             skip_ids[pending.id] += 1
         return skip_ids
 
     def accept_candidate(self, candidate: Candidate, ignore=False) -> AcceptCandidateResult:
+        # The sources must not observe the journal while it is being modified.
+        self.publish_prepared_sources(wait=True)
+        self._stop_prefetching_matches()
         ignored_path = self.editor.ignored_path
         if ignored_path is None:
             raise RuntimeError(
@@ -934,37 +1560,105 @@ class LoadedReconciler(object):
             if isinstance(entry, Transaction):
                 self.posting_db.remove_transaction(entry)
 
-        old_entry_ids = set(id(x) for x in old_entries)
-        self.uncleared_postings = [
-            x for x in self.uncleared_postings if id(x[0]) not in old_entry_ids
-        ]
         for import_result in candidate.used_import_results:
             if isinstance(import_result, Transaction):
                 if id(import_result) in self.pending_transaction_ids:
                     self.pending_transaction_ids.remove(id(import_result))
                     self.posting_db.remove_transaction(import_result)
 
-        self._add_uncleared_postings_from(new_entries)
-        self.uncleared_postings.sort(key=lambda x: x[0].date)
+        # The cleared date ranges depend on the `open` directives.
+        cleared_date_index = self.cleared_date_index
+        if any(
+                isinstance(entry, Open)
+                for entry in itertools.chain(old_entries, new_entries)):
+            cleared_date_index = ClearedDateIndex(self.editor.accounts)
+        self._replace_uncleared_postings(old_entries, new_entries,
+                                         cleared_date_index)
         for entry in new_entries:
             if isinstance(entry, Transaction):
                 self.posting_db.add_transaction(entry)
 
         self._extract_training_examples(new_entries)
 
-        used_import_result_ids = frozenset(
-            map(id, candidate.used_import_results))
-        self.pending_data = [
-            e for e in self.pending_data
-            if id(e) not in used_import_result_ids and
-            id(e.entries[0]) not in used_import_result_ids
-        ]
+        for import_result in candidate.used_import_results:
+            entry_id = get_pending_entry_id(import_result)
+            index = self.full_pending_data.index_of(entry_id)
+            if index is None: continue
+            if self._pending_search_index is not None:
+                self._pending_search_index.remove(
+                    self.full_pending_data[index])
+            self.full_pending_data.remove(entry_id)
+            self.pending_data.remove(entry_id)
         return AcceptCandidateResult(
             new_entries=new_entries + result.new_ignored_entries,
             modified_filenames=staged_changes.get_modified_filenames(),
         )
 
 
+    def reload_modified_files(self, modified_filenames: Iterable[str]) -> bool:
+        """Updates the loaded state after the specified journal files were
+        modified, without loading the entire journal again.
+
+        The journal entries removed and added, as determined by
+        `JournalEditor.reload_modified_files`, are applied to the posting
+        database, the uncleared postings and the training examples.  The
+        sources are prepared again, since the pending entries depend on the
+        journal, but the classifier is retained.
+
+        :returns: `False` if the modifications cannot be applied incrementally,
+            in which case this object must be discarded and the journal loaded
+            again.
+        """
+        self.publish_prepared_sources(wait=True)
+        self._stop_prefetching_matches()
+        self.reconciler.log_status('Reloading modified journal files')
+        reload_result = self.editor.reload_modified_files(modified_filenames)
+        if reload_result is None:
+            return False
+        old_account_source_map = self.account_source_map
+        self.errors = [('error', e[1], e[0]) for e in self.editor.errors]
+        all_source_results = self._prepare_sources()
+        if self.account_source_map != old_account_source_map:
+            # The cleared state of existing postings may have changed.
+            return False
+
+        posting_db = self.posting_db
+        for entry in reload_result.old_entries:
+            if isinstance(entry, Transaction):
+                posting_db.remove_transaction(entry)
+        for entry in reload_result.new_entries:
+            if isinstance(entry, Transaction):
+                posting_db.add_transaction(entry)
+
+        # Replace the pending entries, which are produced again by the sources.
+        pending_transaction_ids = self.pending_transaction_ids
+        for pending in self.full_pending_data:
+            for entry in pending.entries:
+                if id(entry) in pending_transaction_ids:
+                    posting_db.remove_transaction(entry)
+        pending_transaction_ids.clear()
+        self._get_balance_and_price_entries()
+        pending_data = make_pending_entry_list(
+            self._get_pending_entries(all_source_results))
+
+        self._replace_uncleared_postings(reload_result.old_entries,
+                                         reload_result.new_entries,
+                                         self._get_cleared_date_index())
+
+        self._remove_training_examples(reload_result.old_entries)
+        self._extract_training_examples(reload_result.new_entries)
+
+        self.full_pending_data = pending_data
+        self._pending_search_index = None
+        self.set_filter(self.filter_text)
+
+        # The worker processes hold a copy of the sources made before they were
+        # prepared again.
+        self._reset_combination_pool()
+        self.reconciler.log_status('Done loading')
+        return True
+
+
 class Reconciler(object):
     """Holds the reconciler configuration and asynchronously loads a reconciler."""
 
@@ -975,19 +1669,110 @@ class Reconciler(object):
         self.ignore_path = ignore_path
         self.log_status = log_status
         self.entry_file_selector = EntryFileSelector.from_args(options)
-        self.loaded_future = call_in_new_thread(
-            LoadedReconciler, reconciler=self, classifier=None)
+        self.loaded_future = call_in_new_thread(self._load)
+
+    def _load(self) -> LoadedReconciler:
+        """Loads the journal and sources, or the state saved by
+        `state_snapshot` if the `state_snapshot` option is set."""
+        phase_timer = PhaseTimer()
+        snapshot_path = self.options.get('state_snapshot')
+        initial_manifest = None
+        if snapshot_path is not None:
+            try:
+                with phase_timer.phase('state_snapshot_load'):
+                    initial_manifest = self._get_initial_manifest()
+                    loaded_reconciler = state_snapshot.load(
+                        self, snapshot_path)
+            except Exception as e:
+                self.log_status(
+                    'Failed to load state snapshot: %r' % (e, ))
+                loaded_reconciler = None
+            if loaded_reconciler is not None:
+                self.log_status('Loaded state snapshot')
+                loaded_reconciler.phase_timer = phase_timer
+                return loaded_reconciler
+        loaded_reconciler = LoadedReconciler(
+            reconciler=self,
+            classifier=None,
+            phase_timer=phase_timer,
+            initial_manifest=initial_manifest)
+        self._maybe_save_state_snapshot(loaded_reconciler)
+        return loaded_reconciler
 
-    def reload_journal(self):
+    def _get_initial_manifest(
+            self,
+            source_manifest: Optional[List[state_snapshot.ManifestEntry]] = None
+    ) -> Optional[List[state_snapshot.ManifestEntry]]:
+        """Returns `state_snapshot.get_initial_manifest`, or `None` if the
+        `state_snapshot` option is not set or it fails."""
+        if self.options.get('state_snapshot') is None:
+            return None
+        try:
+            return state_snapshot.get_initial_manifest(self, source_manifest)
+        except Exception as e:
+            self.log_status('Failed to compute state snapshot manifest: %r' %
+                            (e, ))
+            return None
+
+    def _maybe_save_state_snapshot(self,
+                                   loaded_reconciler: LoadedReconciler) -> None:
+        snapshot_path = self.options.get('state_snapshot')
+        if (snapshot_path is None or loaded_reconciler.initial_manifest is None
+                or loaded_reconciler.sources_pending):
+            return
+        try:
+            with loaded_reconciler.phase_timer.phase('state_snapshot_save'):
+                saved = state_snapshot.save(loaded_reconciler, snapshot_path)
+        except Exception as e:
+            self.log_status('Failed to save state snapshot: %r' % (e, ))
+            return
+        if not saved:
+            self.log_status('Not saving state snapshot, since the inputs were '
+                            'modified while loading')
+
+    def reload_journal(self,
+                       modified_filenames: Optional[Iterable[str]] = None):
+        """Reloads the journal.
+
+        If `modified_filenames` is specified, only those files are parsed
+        again, unless the `full_journal_reload` option is set or the
+        modifications cannot be applied incrementally.
+        """
         assert self.loaded_future.done()
         loaded_reconciler = self.loaded_future.result()
-        classifier = loaded_reconciler.classifier
-        existing_sources = loaded_reconciler.sources
+        if (modified_filenames is not None and
+                not self.options.get('full_journal_reload')):
+            self.loaded_future = call_in_new_thread(
+                self._reload_modified_files,
+                loaded_reconciler=loaded_reconciler,
+                modified_filenames=list(modified_filenames))
+            return
         self.loaded_future = call_in_new_thread(
-            LoadedReconciler,
+            self._load_again, loaded_reconciler=loaded_reconciler)
+
+    def _load_again(self, loaded_reconciler: LoadedReconciler
+                    ) -> LoadedReconciler:
+        loaded_reconciler.close()
+        # The sources are reused, so their inputs must be unchanged since they
+        # were loaded.
+        initial_manifest = None
+        if loaded_reconciler.initial_manifest is not None:
+            initial_manifest = self._get_initial_manifest(
+                source_manifest=loaded_reconciler.initial_manifest)
+        new_loaded_reconciler = LoadedReconciler(
             reconciler=self,
-            classifier=classifier,
-            sources=existing_sources)
+            classifier=loaded_reconciler.classifier,
+            sources=loaded_reconciler.sources,
+            initial_manifest=initial_manifest)
+        self._maybe_save_state_snapshot(new_loaded_reconciler)
+        return new_loaded_reconciler
+
+    def _reload_modified_files(self, loaded_reconciler: LoadedReconciler,
+                               modified_filenames: List[str]
+                               ) -> LoadedReconciler:
+        if loaded_reconciler.reload_modified_files(modified_filenames):
+            return loaded_reconciler
+        return self._load_again(loaded_reconciler)
 
     def retrain(self):
         assert self.loaded_future.done()
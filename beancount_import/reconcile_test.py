@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional, Tuple, List, Union
+from typing import Dict, Any, Optional, Tuple, List, Union, Iterable
 import collections
 import io
 import os
@@ -11,7 +11,6 @@ from beancount.core.data import Directive, Posting, Transaction
 
 from . import reconcile
 from . import test_util
-from . import training
 
 testdata_root = os.path.realpath(
     os.path.join(os.path.dirname(__file__), '..', 'testdata'))
@@ -20,7 +19,7 @@ mint_data_path = os.path.realpath(
     os.path.join(testdata_root, 'source', 'mint', 'mint.csv'))
 
 
-def _encode_pending_entries(pending_list: List[reconcile.PendingEntry]) -> str:
+def _encode_pending_entries(pending_list: Iterable[reconcile.PendingEntry]) -> str:
     out = io.StringIO()
     for pending in pending_list:
         out.write(';; source: %s\n' % (pending.source.name
@@ -128,25 +127,7 @@ class ReconcileGoldenTester:
                 continue
             shutil.copyfile(
                 os.path.join(initial, name), os.path.join(temp_dir, name))
-        journal_path = os.path.join(temp_dir, 'journal.beancount')
-        self.reconciler = reconcile.Reconciler(
-            journal_path=journal_path,
-            ignore_path=os.path.join(temp_dir, 'ignore.beancount'),
-            log_status=print,
-            options=dict(
-                transaction_output_map=[],
-                price_output=None,
-                open_account_output_map=[],
-                default_output=journal_path,
-                balance_account_output_map=[],
-                fuzzy_match_days=5,
-                fuzzy_match_amount=0,
-                account_pattern=None,
-                ignore_account_for_classification_pattern=training.
-                DEFAULT_IGNORE_ACCOUNT_FOR_CLASSIFICATION_PATTERN,
-                classifier_cache=None,
-                **options),
-        )
+        self.reconciler = test_util.make_reconciler(temp_dir, **options)
         self.skip_ids = collections.Counter()  # type: Dict[str, int]
         self.next_candidates = None  # type: Optional[reconcile.Candidates]
         self._update_candidates()
@@ -249,6 +230,172 @@ def test_basic(tmpdir: py.path.local):
     tester.snapshot()
 
 
+def test_filter_pending(tmpdir: py.path.local):
+    tester = ReconcileGoldenTester(
+        golden_directory=os.path.join(testdata_root, 'reconcile', 'test_basic'),
+        temp_dir=str(tmpdir),
+        options=dict(
+            data_sources=[
+                {
+                    'module': 'beancount_import.source.mint',
+                    'filename': mint_data_path,
+                },
+            ],
+        ),
+    )
+    loaded_reconciler = tester.loaded_reconciler
+    all_pending = list(loaded_reconciler.pending_data)
+    filter_text = all_pending[0].entries[0].date.isoformat()
+
+    def get_expected_pending(pending_data):
+        return [
+            p for p in pending_data
+            if any(e.date.isoformat() == filter_text for e in p.entries)
+        ]
+
+    loaded_reconciler.set_filter(filter_text)
+    assert loaded_reconciler.pending_data == get_expected_pending(all_pending)
+    loaded_reconciler.set_filter('date:%s' % filter_text)
+    assert loaded_reconciler.pending_data == get_expected_pending(all_pending)
+
+    # Accepted entries are removed from the filtered and unfiltered entries.
+    loaded_reconciler.set_filter('')
+    tester.accept_candidate(0)
+    remaining_pending = list(loaded_reconciler.pending_data)
+    assert len(remaining_pending) < len(all_pending)
+    loaded_reconciler.set_filter(filter_text)
+    assert loaded_reconciler.pending_data == get_expected_pending(
+        remaining_pending)
+    loaded_reconciler.set_filter('')
+    assert loaded_reconciler.pending_data == remaining_pending
+
+
+def test_lazy_candidates(tmpdir: py.path.local, monkeypatch):
+    tester = ReconcileGoldenTester(
+        golden_directory=os.path.join(testdata_root, 'reconcile', 'test_basic'),
+        temp_dir=str(tmpdir),
+        options=dict(
+            data_sources=[
+                {
+                    'module': 'beancount_import.source.mint',
+                    'filename': mint_data_path,
+                },
+            ],
+        ),
+    )
+    loaded_reconciler = tester.loaded_reconciler
+    predicted_transactions = []  # type: List[Transaction]
+    get_predictions = loaded_reconciler._get_unknown_account_predictions
+
+    def get_predictions_wrapper(transaction: Transaction) -> List[str]:
+        predicted_transactions.append(transaction)
+        return get_predictions(transaction)
+
+    monkeypatch.setattr(loaded_reconciler, '_get_unknown_account_predictions',
+                        get_predictions_wrapper)
+    candidates = loaded_reconciler.get_candidates(0)
+    assert predicted_transactions == []
+    for i, candidate in enumerate(candidates.candidates):
+        candidate.substituted_accounts
+        candidate.substituted_accounts
+        assert len(predicted_transactions) == i + 1
+        # The new entries match those of the diff, apart from line numbers.
+        _, _, diff_new_entries = candidate.staged_changes.get_diff()
+        assert test_util.format_entries(
+            candidate.new_entries) == test_util.format_entries(diff_new_entries)
+
+
+def test_prefetch_candidates(tmpdir: py.path.local):
+    tester = ReconcileGoldenTester(
+        golden_directory=os.path.join(testdata_root, 'reconcile', 'test_basic'),
+        temp_dir=str(tmpdir),
+        options=dict(
+            data_sources=[
+                {
+                    'module': 'beancount_import.source.mint',
+                    'filename': mint_data_path,
+                },
+            ],
+            prefetch_candidates=2,
+            match_metrics=True,
+        ),
+    )
+    loaded_reconciler = tester.loaded_reconciler
+    assert len(loaded_reconciler.pending_data) >= 2
+    loaded_reconciler._prefetch_future.result()
+    expected_candidates = _encode_candidates(
+        loaded_reconciler.get_candidates(1))
+    assert loaded_reconciler.last_match_metrics.cached_results == 1
+
+    # The prefetched results are the same as those found without prefetching.
+    loaded_reconciler.posting_db.match_result_cache.clear()
+    assert _encode_candidates(
+        loaded_reconciler.get_candidates(1)) == expected_candidates
+    assert loaded_reconciler.last_match_metrics.cached_results == 0
+    tester.skip(1)
+    assert _encode_candidates(tester.next_candidates) == expected_candidates
+    # Accepting a candidate stops the background search of the following
+    # entries before modifying the posting database.
+    tester.accept_candidate(0)
+
+
+def test_match_processes(tmpdir: py.path.local):
+    initial = os.path.join(testdata_root, 'reconcile', 'test_basic', '0')
+    for name in ['journal.beancount', 'ignore.beancount']:
+        shutil.copyfile(
+            os.path.join(initial, name), os.path.join(str(tmpdir), name))
+    mint_filename = os.path.join(str(tmpdir), 'mint.csv')
+    with open(mint_filename, 'w') as f:
+        # The payment matches either transfer.
+        f.write(
+            '"Date","Description","Original Description","Amount",'
+            '"Transaction Type","Category","Account Name","Labels","Notes"\n'
+            '"11/27/2013","Payment","CR CARD PAYMENT","66.88","credit",'
+            '"Credit Card Payment","My Credit Card","",""\n'
+            '"11/26/2013","Transfer","TRANSFER 1","66.88","debit",'
+            '"Transfer","My Checking","",""\n'
+            '"11/28/2013","Transfer","TRANSFER 2","66.88","debit",'
+            '"Transfer","My Checking","",""\n')
+    messages = []  # type: List[str]
+    reconciler = test_util.make_reconciler(
+        str(tmpdir),
+        log_status=messages.append,
+        data_sources=[
+            {
+                'module': 'beancount_import.source.mint',
+                'filename': mint_filename,
+            },
+        ],
+        match_processes=2)
+    loaded_reconciler = reconciler.loaded_future.result()
+    index, = [
+        i for i, pending in enumerate(loaded_reconciler.pending_data)
+        if pending.entries[0].narration == 'CR CARD PAYMENT'
+    ]
+    candidates = _encode_candidates(loaded_reconciler.get_candidates(index))
+    assert loaded_reconciler.combination_pool is not None
+    assert 'TRANSFER 1' in candidates
+    assert 'TRANSFER 2' in candidates
+
+    # If the sources cannot be pickled for the worker processes, matches are
+    # searched for in the server process.
+    loaded_reconciler._reset_combination_pool()
+    loaded_reconciler.sources[0].unpicklable = lambda: None
+    loaded_reconciler.posting_db.match_result_cache.clear()
+    assert _encode_candidates(
+        loaded_reconciler.get_candidates(index)) == candidates
+    assert loaded_reconciler.combination_pool is None
+    assert any('cannot be pickled' in message for message in messages)
+
+    # The results are the same as those found in the server process.
+    loaded_reconciler.close()
+    reconciler.options['match_processes'] = None
+    loaded_reconciler.posting_db.match_result_cache.clear()
+    assert _encode_candidates(
+        loaded_reconciler.get_candidates(index)) == candidates
+    assert loaded_reconciler.combination_pool is None
+
+
 def test_ignore(tmpdir: py.path.local):
     tester = ReconcileGoldenTester(
         golden_directory=os.path.join(testdata_root, 'reconcile',
@@ -329,3 +476,236 @@ def test_ofx_cleared(tmpdir: py.path.local):
             ],
         ),
     )
+
+
+def _get_reloaded_state(loaded_reconciler: reconcile.LoadedReconciler):
+    return dict(
+        entries=test_util.format_entries(loaded_reconciler.editor.entries),
+        errors=loaded_reconciler.errors,
+        pending=_encode_pending_entries(loaded_reconciler.pending_data),
+        uncleared=[(transaction.date, posting.account, posting.units)
+                   for transaction, posting in
+                   loaded_reconciler.uncleared_postings],
+        training_examples=sorted(
+            repr((sorted(k for k, v in features.items() if v), target))
+            for features, target in
+            loaded_reconciler.training_examples.training_examples),
+    )
+
+
+def test_reload_modified_files(tmpdir: py.path.local):
+    tester = ReconcileGoldenTester(
+        golden_directory=os.path.join(testdata_root, 'reconcile', 'test_basic'),
+        temp_dir=str(tmpdir),
+        options=dict(
+            data_sources=[
+                {
+                    'module': 'beancount_import.source.mint',
+                    'filename': mint_data_path,
+                },
+            ],
+        ),
+    )
+    tester.accept_candidate(0)
+    reconciler = tester.reconciler
+    loaded_reconciler = tester.loaded_reconciler
+
+    with open(reconciler.journal_path, 'a', encoding='utf-8') as f:
+        f.write('\n2016-08-12 * "Coffee"\n'
+                '  Liabilities:Credit-Card  -3.50 USD\n'
+                '  Expenses:FIXME  3.50 USD\n')
+    mtime = os.stat(reconciler.journal_path).st_mtime + 10
+    os.utime(reconciler.journal_path, (mtime, mtime))
+    modified_filenames = loaded_reconciler.editor.check_any_journal_modification(
+    )
+    assert modified_filenames == {os.path.realpath(reconciler.journal_path)}
+    num_pending = loaded_reconciler.num_pending
+
+    reconciler.reload_journal(modified_filenames)
+    assert tester.loaded_reconciler is loaded_reconciler
+    assert loaded_reconciler.num_pending == num_pending + 1
+    assert not loaded_reconciler.editor.check_any_journal_modification()
+
+    full_reconciler = reconcile.Reconciler(
+        journal_path=reconciler.journal_path,
+        ignore_path=reconciler.ignore_path,
+        log_status=print,
+        options=reconciler.options)
+    assert _get_reloaded_state(loaded_reconciler) == _get_reloaded_state(
+        full_reconciler.loaded_future.result())
+
+
+def test_reload_cleared_dates(tmpdir: py.path.local):
+    tester = ReconcileGoldenTester(
+        golden_directory=os.path.join(testdata_root, 'reconcile',
+                                      'test_ofx_cleared'),
+        temp_dir=str(tmpdir),
+        options=dict(
+            data_sources=[
+                {
+                    'module':
+                    'beancount_import.source.ofx',
+                    'ofx_filenames': [
+                        os.path.join(testdata_root, 'source', 'ofx',
+                                     'vanguard_roth_ira.ofx')
+                    ],
+                },
+            ],
+        ),
+    )
+    reconciler = tester.reconciler
+    loaded_reconciler = tester.loaded_reconciler
+    old_uncleared = list(loaded_reconciler.uncleared_postings)
+
+    with open(reconciler.journal_path, 'r', encoding='utf-8') as f:
+        contents = f.read()
+    with open(reconciler.journal_path, 'w', encoding='utf-8') as f:
+        f.write(
+            contents.replace('cleared_before: 2018-01-01',
+                             'cleared_before: 2017-01-01'))
+    mtime = os.stat(reconciler.journal_path).st_mtime + 10
+    os.utime(reconciler.journal_path, (mtime, mtime))
+    reconciler.reload_journal(
+        loaded_reconciler.editor.check_any_journal_modification())
+    assert tester.loaded_reconciler is loaded_reconciler
+    assert len(loaded_reconciler.uncleared_postings) > len(old_uncleared)
+
+    full_reconciler = reconcile.Reconciler(
+        journal_path=reconciler.journal_path,
+        ignore_path=reconciler.ignore_path,
+        log_status=print,
+        options=reconciler.options)
+    assert _get_reloaded_state(loaded_reconciler) == _get_reloaded_state(
+        full_reconciler.loaded_future.result())
+
+
+def test_prepare_threads(tmpdir: py.path.local):
+    def get_state(**options):
+        reconciler = _make_ofx_and_mint_reconciler(tmpdir, **options)
+        return _get_reloaded_state(reconciler.loaded_future.result())
+
+    assert get_state(prepare_threads=2) == get_state()
+
+
+def _make_ofx_and_mint_reconciler(tmpdir: py.path.local,
+                                  log_status=print,
+                                  **options) -> reconcile.Reconciler:
+    """Returns a reconciler for a copy of the initial journal of the
+    `test_ofx_basic` test, with an OFX and a Mint data source."""
+    initial = os.path.join(testdata_root, 'reconcile', 'test_ofx_basic', '0')
+    for name in ['journal.beancount', 'ignore.beancount']:
+        path = os.path.join(str(tmpdir), name)
+        if not os.path.exists(path):
+            shutil.copyfile(os.path.join(initial, name), path)
+    return test_util.make_reconciler(
+        str(tmpdir),
+        log_status=log_status,
+        data_sources=[
+            {
+                'module':
+                'beancount_import.source.ofx',
+                'ofx_filenames': [
+                    os.path.join(testdata_root, 'source', 'ofx',
+                                 'vanguard_roth_ira.ofx')
+                ],
+            },
+            {
+                'module': 'beancount_import.source.mint',
+                'filename': mint_data_path,
+            },
+        ],
+        **options)
+
+
+def test_stream_pending(tmpdir: py.path.local):
+    def get_state(**options):
+        reconciler = _make_ofx_and_mint_reconciler(tmpdir, **options)
+        loaded_reconciler = reconciler.loaded_future.result()
+        loaded_reconciler.publish_prepared_sources(wait=True)
+        assert not loaded_reconciler.sources_pending
+        return _get_reloaded_state(loaded_reconciler)
+
+    assert get_state(stream_pending=True) == get_state()
+    assert get_state(stream_pending=True, prepare_threads=2) == get_state()
+
+
+def test_state_snapshot(tmpdir: py.path.local):
+    snapshot_path = os.path.join(str(tmpdir), 'state.pickle')
+    messages = []  # type: List[str]
+
+    def load():
+        del messages[:]
+        reconciler = _make_ofx_and_mint_reconciler(
+            tmpdir, log_status=messages.append, state_snapshot=snapshot_path)
+        return reconciler.loaded_future.result()
+
+    loaded_reconciler = load()
+    assert 'Loaded state snapshot' not in messages
+    assert os.path.exists(snapshot_path)
+    expected_state = _get_reloaded_state(loaded_reconciler)
+
+    loaded_reconciler = load()
+    assert 'Loaded state snapshot' in messages
+    assert _get_reloaded_state(loaded_reconciler) == expected_state
+
+    # The loaded state remains usable, and the snapshot is not used once the
+    # journal is modified.
+    candidates = loaded_reconciler.get_next_candidates()[0]
+    loaded_reconciler.accept_candidate(candidates.candidates[0])
+    loaded_reconciler.sources[0].log_status('Source status')
+    assert 'Source status' in messages
+    loaded_reconciler.close()
+    loaded_reconciler = load()
+    assert 'Loaded state snapshot' not in messages
+    expected_state = _get_reloaded_state(loaded_reconciler)
+    loaded_reconciler = load()
+    assert 'Loaded state snapshot' in messages
+    assert _get_reloaded_state(loaded_reconciler) == expected_state
+
+
+def test_state_snapshot_inputs_modified_while_loading(
+        tmpdir: py.path.local):
+    snapshot_path = os.path.join(str(tmpdir), 'state.pickle')
+    journal_path = os.path.join(str(tmpdir), 'journal.beancount')
+    messages = []  # type: List[str]
+
+    def log_status(message: str) -> None:
+        messages.append(message)
+        if message == 'Matching source data':
+            with open(journal_path, 'a') as f:
+                f.write('\n; Modified while loading\n')
+
+    reconciler = _make_ofx_and_mint_reconciler(
+        tmpdir, log_status=log_status, state_snapshot=snapshot_path)
+    reconciler.loaded_future.result()
+    assert ('Not saving state snapshot, since the inputs were modified while '
+            'loading') in messages
+    assert not os.path.exists(snapshot_path)
+
+
+def test_phase_timing(tmpdir: py.path.local):
+    snapshot_path = os.path.join(str(tmpdir), 'state.pickle')
+
+    def get_phase_names(**options):
+        reconciler = _make_ofx_and_mint_reconciler(
+            tmpdir, log_status=lambda message: None, **options)
+        loaded_reconciler = reconciler.loaded_future.result()
+        loaded_reconciler.publish_prepared_sources(wait=True)
+        return [timing.name for timing in loaded_reconciler.phase_timer.phases]
+
+    expected_phases = [
+        'journal_parse', 'journal_booking', 'journal_partial_booking',
+        'ignored_journal_parse', 'ignored_journal_booking', 'load_sources',
+        'prepare_source:ofx', 'prepare_source:mint', 'preprocess_entries',
+        'match_sources', 'uncleared_postings', 'training_examples'
+    ]
+    assert get_phase_names() == expected_phases
+    assert get_phase_names(state_snapshot=snapshot_path) == (
+        ['state_snapshot_load'] + expected_phases + ['state_snapshot_save'])
+    assert get_phase_names(state_snapshot=snapshot_path) == [
+        'state_snapshot_load'
+    ]
+    phase_names = get_phase_names(stream_pending=True)
+    assert sorted(phase_names) == sorted(
+        expected_phases +
+        ['publish_source:ofx', 'publish_source:mint', 'uncleared_postings'])
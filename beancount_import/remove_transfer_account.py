@@ -44,14 +44,14 @@ def get_matchable_posting_for_merge(
                 price=None,
                 flag=None,
                 meta=None)
-        return matching.MatchablePosting(
+        return matching.make_matchable_posting(
             posting=posting,
             weight=matching.get_posting_weight(posting),
             source_postings=[
                 p for p in x.transaction.postings if id(p) != id(x.posting)
             ],
         )
-    return matching.MatchablePosting(
+    return matching.make_matchable_posting(
         posting=x.posting,
         weight=matching.get_posting_weight(x.posting),
         source_postings=[x.posting],
@@ -136,7 +136,7 @@ def process(journal_path: str,
             for x in a_modified, b_modified:
                 if x.posting.units.number < ZERO:
                     removals.append(
-                        matching.MatchablePosting(
+                        matching.make_matchable_posting(
                             x.posting,
                             weight=matching.get_posting_weight(x.posting),
                             source_postings=[x.posting]))
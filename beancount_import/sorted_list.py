@@ -1,22 +1,46 @@
 from decimal import Decimal
-from typing import TypeVar, Generic, Tuple, Iterable
+from typing import Any, Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar, overload
 import bisect
 import itertools
 
 
-K = TypeVar('K', bound=Decimal)
+K = TypeVar('K', Decimal, int)
 V = TypeVar('V')
 
 
 class SortedList(Generic[K, V]):
     def __init__(self, items: Iterable[Tuple[K, V]]) -> None:
         entries = sorted(items, key=lambda x: x[0])
-        self.keys = [x[0] for x in entries]
-        self.values = [x[1] for x in entries]
+        self.keys = [x[0] for x in entries]  # type: List[K]
+        self.values = [x[1] for x in entries]  # type: List[V]
 
     def __repr__(self) -> str:
         return repr(list(zip(self.keys, self.values)))
 
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: K, value: V) -> None:
+        """Inserts `value`, after any existing values with an equal key."""
+        pos = bisect.bisect_right(self.keys, key)
+        self.keys.insert(pos, key)
+        self.values.insert(pos, value)
+
+    def remove(self, key: K, value: V) -> bool:
+        """Removes the first value with the specified key equal to `value`.
+
+        :returns: True if a value was removed.
+        """
+        keys = self.keys
+        values = self.values
+        end_pos = bisect.bisect_right(keys, key)
+        for pos in range(bisect.bisect_left(keys, key), end_pos):
+            if values[pos] == value:
+                del keys[pos]
+                del values[pos]
+                return True
+        return False
+
     def find(self, lower_bound: K, upper_bound: K) -> Iterable[V]:
         keys = self.keys
         begin_pos = bisect.bisect_left(keys, lower_bound)
@@ -24,3 +48,205 @@ class SortedList(Generic[K, V]):
         if begin_pos == end_pos:
             return ()
         return itertools.islice(self.values, begin_pos, end_pos)
+
+
+ValueId = Hashable
+FullKey = Tuple[Any, int]
+
+# Maximum number of values stored in a single block of an `IndexedSortedList`.
+MAX_BLOCK_SIZE = 512
+
+
+class IndexedSortedList(Generic[V]):
+    """Sequence of values ordered by a sort key, and then by insertion order.
+
+    Each value is identified by a unique hashable id, which allows it to be
+    removed and its position determined without scanning the sequence.  Values
+    with equal sort keys are ordered as if appended to a list that is then
+    stably sorted.
+
+    The values are stored in blocks of at most `MAX_BLOCK_SIZE` values, and a
+    Fenwick tree of the block sizes maps between positions and blocks, such
+    that insertion, removal and positional lookup take `O(log n)` time, plus a
+    copy of a single bounded-size block.
+    """
+
+    def __init__(self, items: Iterable[Tuple[ValueId, Any, V]] = ()) -> None:
+        """Initializes the sequence from `(value_id, sort_key, value)` tuples."""
+        self._next_order = 0
+        self._keys_by_id = {}  # type: Dict[ValueId, FullKey]
+        entries = []  # type: List[Tuple[FullKey, V]]
+        for value_id, sort_key, value in items:
+            key = (sort_key, self._next_order)
+            self._next_order += 1
+            if value_id in self._keys_by_id:
+                raise ValueError('Duplicate value id: %r' % (value_id, ))
+            self._keys_by_id[value_id] = key
+            entries.append((key, value))
+        entries.sort(key=lambda x: x[0])
+        self._block_keys = [
+            [key for key, _ in entries[i:i + MAX_BLOCK_SIZE // 2]]
+            for i in range(0, len(entries), MAX_BLOCK_SIZE // 2)
+        ]  # type: List[List[FullKey]]
+        self._block_values = [
+            [value for _, value in entries[i:i + MAX_BLOCK_SIZE // 2]]
+            for i in range(0, len(entries), MAX_BLOCK_SIZE // 2)
+        ]  # type: List[List[V]]
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        block_keys = self._block_keys
+        self._block_maxes = [keys[-1] for keys in block_keys]
+        num_blocks = len(block_keys)
+        tree = [0] * (num_blocks + 1)
+        for i, keys in enumerate(block_keys):
+            tree[i + 1] += len(keys)
+            parent = (i + 1) + ((i + 1) & -(i + 1))
+            if parent <= num_blocks:
+                tree[parent] += tree[i + 1]
+        self._tree = tree
+
+    def _update_block_size(self, block_index: int, delta: int) -> None:
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _get_block_start(self, block_index: int) -> int:
+        tree = self._tree
+        total = 0
+        i = block_index
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate_position(self, position: int) -> Tuple[int, int]:
+        """Returns the block index and offset within the block of the value at
+        the specified non-negative position."""
+        tree = self._tree
+        block_index = 0
+        bit = 1 << (len(tree).bit_length())
+        while bit:
+            next_index = block_index + bit
+            if next_index < len(tree) and tree[next_index] <= position:
+                block_index = next_index
+                position -= tree[next_index]
+            bit >>= 1
+        return block_index, position
+
+    def _locate_key(self, key: FullKey) -> Tuple[int, int]:
+        block_index = bisect.bisect_left(self._block_maxes, key)
+        offset = bisect.bisect_left(self._block_keys[block_index], key)
+        return block_index, offset
+
+    def __len__(self) -> int:
+        return len(self._keys_by_id)
+
+    def __iter__(self) -> Iterator[V]:
+        return itertools.chain.from_iterable(self._block_values)
+
+    def __repr__(self) -> str:
+        return 'IndexedSortedList(%r)' % (list(self), )
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (IndexedSortedList, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    @overload
+    def __getitem__(self, index: int) -> V:
+        pass
+
+    @overload
+    def __getitem__(self, index: slice) -> List[V]:
+        pass
+
+    def __getitem__(self, index):
+        size = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(size)
+            if step != 1:
+                return list(self)[index]
+            if start >= stop:
+                return []
+            block_index, offset = self._locate_position(start)
+            result = []  # type: List[V]
+            remaining = stop - start
+            block_values = self._block_values
+            while remaining > 0:
+                values = block_values[block_index][offset:offset + remaining]
+                result.extend(values)
+                remaining -= len(values)
+                block_index += 1
+                offset = 0
+            return result
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError('IndexedSortedList index out of range')
+        block_index, offset = self._locate_position(index)
+        return self._block_values[block_index][offset]
+
+    def index_of(self, value_id: ValueId) -> Optional[int]:
+        """Returns the position of the value with the specified id, or `None`
+        if there is no such value."""
+        key = self._keys_by_id.get(value_id)
+        if key is None:
+            return None
+        block_index, offset = self._locate_key(key)
+        return self._get_block_start(block_index) + offset
+
+    def add(self, value_id: ValueId, sort_key: Any, value: V) -> None:
+        """Inserts `value` after any existing values with an equal sort key."""
+        if value_id in self._keys_by_id:
+            raise ValueError('Duplicate value id: %r' % (value_id, ))
+        key = (sort_key, self._next_order)
+        self._next_order += 1
+        self._keys_by_id[value_id] = key
+        block_keys = self._block_keys
+        if not block_keys:
+            block_keys.append([key])
+            self._block_values.append([value])
+            self._rebuild_index()
+            return
+        block_index = min(
+            bisect.bisect_left(self._block_maxes, key),
+            len(block_keys) - 1)
+        keys = block_keys[block_index]
+        values = self._block_values[block_index]
+        offset = bisect.bisect_left(keys, key)
+        keys.insert(offset, key)
+        values.insert(offset, value)
+        if len(keys) > MAX_BLOCK_SIZE:
+            half = len(keys) // 2
+            block_keys[block_index:block_index + 1] = [keys[:half], keys[half:]]
+            self._block_values[block_index:block_index + 1] = [
+                values[:half], values[half:]
+            ]
+            self._rebuild_index()
+            return
+        self._block_maxes[block_index] = keys[-1]
+        self._update_block_size(block_index, 1)
+
+    def remove(self, value_id: ValueId) -> bool:
+        """Removes the value with the specified id.
+
+        :returns: True if a value was removed.
+        """
+        key = self._keys_by_id.pop(value_id, None)
+        if key is None:
+            return False
+        block_index, offset = self._locate_key(key)
+        keys = self._block_keys[block_index]
+        del keys[offset]
+        del self._block_values[block_index][offset]
+        if not keys:
+            del self._block_keys[block_index]
+            del self._block_values[block_index]
+            self._rebuild_index()
+            return True
+        self._block_maxes[block_index] = keys[-1]
+        self._update_block_size(block_index, -1)
+        return True
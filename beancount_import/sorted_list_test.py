@@ -0,0 +1,69 @@
+import bisect
+import random
+
+from beancount.core.number import D, Decimal
+
+from .sorted_list import SortedList, IndexedSortedList
+
+
+def test_find():
+    table = SortedList([(D('2'), 'b'), (D('1'), 'a'), (D('3'), 'c')])
+    assert list(table.find(D('1.5'), D('3'))) == ['b', 'c']
+    assert list(table.find(D('3.5'), D('4'))) == []
+
+
+def test_add_remove():
+    table = SortedList(())  # type: SortedList[Decimal, str]
+    table.add(D('2'), 'b')
+    table.add(D('1'), 'a')
+    table.add(D('2'), 'c')
+    assert len(table) == 3
+    assert list(table.find(D('2'), D('2'))) == ['b', 'c']
+    assert table.remove(D('2'), 'b')
+    assert not table.remove(D('1'), 'b')
+    assert list(table.find(D('0'), D('5'))) == ['a', 'c']
+
+
+def test_indexed_sorted_list():
+    values = IndexedSortedList([('c', 2, 'c'), ('a', 1, 'a'), ('b', 2, 'b')])
+    assert list(values) == ['a', 'c', 'b']
+    values.add('d', 2, 'd')
+    values.add('e', 0, 'e')
+    assert values == ['e', 'a', 'c', 'b', 'd']
+    assert values[1] == 'a'
+    assert values[-1] == 'd'
+    assert values[1:3] == ['a', 'c']
+    assert values.index_of('b') == 3
+    assert values.index_of('x') is None
+    assert values.remove('c')
+    assert not values.remove('c')
+    assert values == ['e', 'a', 'b', 'd']
+    assert len(values) == 4
+
+
+def test_indexed_sorted_list_random():
+    rng = random.Random(0)
+    items = [(i, rng.randrange(100), 'v%d' % i) for i in range(3000)]
+    values = IndexedSortedList(items[:1000])
+    expected = sorted(items[:1000], key=lambda x: x[1])
+    for value_id, sort_key, value in items[1000:]:
+        if rng.random() < 0.3 and expected:
+            removed = expected.pop(rng.randrange(len(expected)))
+            assert values.remove(removed[0])
+        values.add(value_id, sort_key, value)
+        expected.insert(
+            bisect.bisect_right([x[1] for x in expected], sort_key),
+            (value_id, sort_key, value))
+    assert list(values) == [x[2] for x in expected]
+    assert len(values) == len(expected)
+    for i, (value_id, _, value) in enumerate(expected):
+        assert values[i] == value
+        assert values.index_of(value_id) == i
+    assert values[10:1500] == [x[2] for x in expected[10:1500]]
+    rng.shuffle(expected)
+    for value_id, _, _ in expected:
+        assert values.remove(value_id)
+    assert len(values) == 0
+    assert list(values) == []
+    values.add('x', 5, 'x')
+    assert values == ['x']
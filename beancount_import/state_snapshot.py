@@ -0,0 +1,268 @@
+"""On-disk snapshot of the loaded reconciler state, for fast restarts.
+
+If the `state_snapshot` option specifies a path, the `LoadedReconciler` state,
+including the parsed journal, the posting database, the pending entries, the
+uncleared postings and the training examples, is saved there once the journal
+and data sources have been loaded.  When the reconciler is next started, the
+state is loaded from the snapshot in place of parsing the journal and preparing
+the data sources, provided that the inputs are unchanged.
+
+The snapshot is keyed by a manifest of the path, size, modification time and
+content hash of every journal file and every file referenced by the data source
+specifications (directories are searched recursively), and by the options that
+affect the loaded state.
+
+The data source objects are saved along with the state, with the exception of
+the status logging function, which is replaced by that of the new reconciler.
+"""
+
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+from typing import Any, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .journal_editor import (WRITE_BEHIND_CONFLICTS_SUFFIX,
+                             WRITE_BEHIND_LOG_SUFFIX)
+
+if False:
+    from .reconcile import LoadedReconciler, Reconciler  # For typing only.
+
+# Incremented when the format of the saved state changes.
+state_snapshot_version_number = 1
+
+# Options that affect the state saved in the snapshot.
+STATE_OPTIONS = (
+    'data_sources',
+    'fuzzy_match_days',
+    'fuzzy_match_amount',
+    'max_aggregate_posting_candidates',
+    'account_pattern',
+    'ignore_account_for_classification_pattern',
+)
+
+ManifestEntry = NamedTuple('ManifestEntry', [
+    ('path', str),
+    ('size', int),
+    ('mtime_ns', int),
+    ('sha256', str),
+])
+
+_LOG_STATUS_ID = 'log_status'
+
+
+def _get_file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_manifest(paths: Iterable[str]) -> List[ManifestEntry]:
+    """Returns the manifest entries of `paths`, sorted by path.
+
+    Paths that do not exist are included with a size and time of `-1`.
+    """
+    manifest = []
+    for path in sorted(set(paths)):
+        try:
+            stat_result = os.stat(path)
+            sha256 = _get_file_hash(path)
+        except OSError:
+            manifest.append(
+                ManifestEntry(path=path, size=-1, mtime_ns=-1, sha256=''))
+            continue
+        manifest.append(
+            ManifestEntry(
+                path=path,
+                size=stat_result.st_size,
+                mtime_ns=stat_result.st_mtime_ns,
+                sha256=sha256))
+    return manifest
+
+
+def _add_spec_paths(value: Any, paths: Set[str]) -> None:
+    if isinstance(value, str):
+        if not os.path.exists(value):
+            return
+        if os.path.isdir(value):
+            for dirpath, _, filenames in os.walk(value):
+                for filename in filenames:
+                    paths.add(
+                        os.path.realpath(os.path.join(dirpath, filename)))
+        else:
+            paths.add(os.path.realpath(value))
+    elif isinstance(value, dict):
+        for x in value.values():
+            _add_spec_paths(x, paths)
+    elif isinstance(value, (list, tuple)):
+        for x in value:
+            _add_spec_paths(x, paths)
+
+
+def get_source_input_paths(data_sources: Iterable[Any]) -> Set[str]:
+    """Returns the files referenced by the data source specifications.
+
+    Any string in a specification that names an existing file is included, as
+    are all files within a directory that it names.
+    """
+    paths = set()  # type: Set[str]
+    for spec in data_sources:
+        _add_spec_paths(spec, paths)
+    return paths
+
+
+def _get_state_key(reconciler: 'Reconciler') -> Tuple:
+    options = reconciler.options
+    return (os.path.realpath(reconciler.journal_path),
+            reconciler.ignore_path and os.path.realpath(reconciler.ignore_path),
+            repr([(key, options.get(key)) for key in STATE_OPTIONS]))
+
+
+class _StatePickler(pickle.Pickler):
+    def __init__(self, f, log_status) -> None:
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._log_status = log_status
+
+    def persistent_id(self, obj):
+        log_status = self._log_status
+        if type(obj) is type(log_status) and obj == log_status:
+            return _LOG_STATUS_ID
+        return None
+
+
+class _StateUnpickler(pickle.Unpickler):
+    def __init__(self, f, log_status) -> None:
+        super().__init__(f)
+        self._log_status = log_status
+
+    def persistent_load(self, pid):
+        if pid == _LOG_STATUS_ID:
+            return self._log_status
+        raise pickle.UnpicklingError('unsupported persistent id: %r' % (pid, ))
+
+
+def dumps(obj: Any, log_status: Any) -> bytes:
+    """Pickles `obj`, with references to `log_status` saved as by `save`."""
+    f = io.BytesIO()
+    _StatePickler(f, log_status).dump(obj)
+    return f.getvalue()
+
+
+def loads(data: bytes, log_status: Any) -> Any:
+    """Unpickles the result of `dumps`, with `log_status` substituted."""
+    return _StateUnpickler(io.BytesIO(data), log_status).load()
+
+
+def get_initial_manifest(
+        reconciler: 'Reconciler',
+        source_manifest: Optional[List[ManifestEntry]] = None
+) -> List[ManifestEntry]:
+    """Returns the manifest of the inputs known before the state is loaded.
+
+    This must be computed before loading the state that is passed to `save`.
+    The files included by the journal are not known until it is loaded; their
+    modification is detected by the `JournalEditor` instead.
+
+    :param source_manifest: If specified, the manifest from which the entries
+        of the files referenced by the data sources are taken, for a state
+        loaded using sources that were loaded when it was computed.
+    """
+    journal_path = os.path.realpath(reconciler.journal_path)
+    source_paths = get_source_input_paths(reconciler.options['data_sources'])
+    if source_manifest is not None:
+        source_entries = [
+            entry for entry in source_manifest if entry.path in source_paths
+        ]
+        if len(source_entries) != len(source_paths):
+            raise ValueError('Manifest does not include all source inputs')
+        input_paths = set()  # type: Set[str]
+    else:
+        source_entries = []
+        input_paths = source_paths
+    input_paths.add(journal_path)
+    if reconciler.ignore_path is not None:
+        input_paths.add(os.path.realpath(reconciler.ignore_path))
+    # The conflicts log is reported as an error while it exists.
+    input_paths.add(journal_path + WRITE_BEHIND_LOG_SUFFIX +
+                    WRITE_BEHIND_CONFLICTS_SUFFIX)
+    return sorted(get_manifest(input_paths) + source_entries)
+
+
+def save(loaded_reconciler: 'LoadedReconciler', path: str) -> bool:
+    """Saves the state of `loaded_reconciler` to `path`.
+
+    :returns: `False`, without saving the state, if any of the inputs were
+        modified since `loaded_reconciler.initial_manifest` was computed, since
+        the state may then not reflect their current contents.
+    """
+    reconciler = loaded_reconciler.reconciler
+    editor = loaded_reconciler.editor
+    initial_manifest = loaded_reconciler.initial_manifest
+    if initial_manifest is None:
+        return False
+    input_paths = set(editor.journal_filenames)
+    input_paths.update(editor.ignored_journal_filenames)
+    input_paths.update(entry.path for entry in initial_manifest)
+    manifest = get_manifest(input_paths)
+    if (editor.check_any_journal_modification() or
+            not set(initial_manifest).issubset(manifest)):
+        return False
+    header = {
+        'version': state_snapshot_version_number,
+        'key': _get_state_key(reconciler),
+        'manifest': manifest,
+    }
+    renamed = False
+    with tempfile.NamedTemporaryFile(
+            mode='wb',
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix='.' + os.path.basename(path),
+            suffix='.tmp',
+            delete=False) as f:
+        try:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            _StatePickler(f, reconciler.log_status).dump(loaded_reconciler)
+            f.flush()
+            os.replace(f.name, path)
+            renamed = True
+        finally:
+            if not renamed:
+                os.remove(f.name)
+    return True
+
+
+def load(reconciler: 'Reconciler', path: str) -> Optional['LoadedReconciler']:
+    """Loads the state saved by `save`.
+
+    :returns: The loaded state, or `None` if `path` does not exist or any of
+        the inputs or options have changed since it was saved.  `None` is also
+        returned if there are journal changes still to be replayed from a
+        write-behind log, since the journal must then be loaded again.
+    """
+    if os.path.exists(
+            os.path.realpath(reconciler.journal_path) +
+            WRITE_BEHIND_LOG_SUFFIX):
+        return None
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        header = pickle.load(f)
+        if (not isinstance(header, dict) or
+                header.get('version') != state_snapshot_version_number or
+                header['key'] != _get_state_key(reconciler)):
+            return None
+        manifest = header['manifest']
+        if get_manifest(entry.path for entry in manifest) != manifest:
+            return None
+        if get_source_input_paths(reconciler.options['data_sources']) - set(
+                entry.path for entry in manifest):
+            return None
+        loaded_reconciler = _StateUnpickler(f, reconciler.log_status).load()
+    loaded_reconciler.initial_manifest = manifest
+    loaded_reconciler.restore_from_snapshot(reconciler)
+    return loaded_reconciler
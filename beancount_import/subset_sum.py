@@ -0,0 +1,76 @@
+"""Enumeration of small subsets of amounts without zero-sum sub-subsets.
+
+This is the core of `matching.get_aggregate_posting_candidates`, which
+considers groups of postings that may be matched as a single aggregate posting.
+A group is only valid if neither it, nor any of its sub-groups with at least two
+elements, sums to zero.
+
+Since any superset of an invalid subset is also invalid, the valid subsets are
+enumerated by extending valid subsets one element at a time.  For each subset,
+the search keeps a bitmask of the elements whose addition would create a
+zero-sum sub-subset: these are the elements whose amount is the negation of the
+sum of some non-empty sub-subset.  Amounts are integers (see `fixed_point`), so
+sums are exact and cheap to compute.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SubsetIndices = Tuple[int, ...]
+
+
+def get_nonzero_subsets(
+        amounts: Sequence[int],
+        max_subset_size: int,
+        limit: Optional[int] = None) -> Tuple[List[SubsetIndices], bool]:
+    """Returns the subsets of `amounts` without zero-sum sub-subsets.
+
+    :param amounts: The amounts, as integers.
+    :param max_subset_size: Maximum number of elements in a returned subset.
+    :param limit: If not `None`, the maximum number of subsets to return.
+
+    :returns: A pair `(subsets, truncated)`.  `subsets` is the list of index
+        tuples of all subsets with between 2 and `max_subset_size` elements such
+        that no sub-subset with at least 2 elements (including the subset
+        itself) sums to zero.  The subsets are ordered by size, and then in the
+        order produced by `itertools.combinations`.  If `limit` is exceeded,
+        only the first `limit` subsets in this order are returned and
+        `truncated` is `True`.
+    """
+    n = len(amounts)
+    indices_by_amount = {}  # type: Dict[int, int]
+    for i, amount in enumerate(amounts):
+        indices_by_amount[amount] = indices_by_amount.get(amount, 0) | (1 << i)
+
+    # The subsets are extended breadth-first, so that each level is produced in
+    # lexicographic order.  Each state is `(subset, subset_sums, excluded)`,
+    # where `subset_sums` contains the sums of all non-empty sub-subsets of
+    # `subset`, and `excluded` is the bitmask of elements that would complete a
+    # zero-sum sub-subset.
+    states = [((i, ), [amount], indices_by_amount.get(-amount, 0))
+              for i, amount in enumerate(amounts)
+              ]  # type: List[Tuple[SubsetIndices, List[int], int]]
+    subsets = []  # type: List[SubsetIndices]
+    for size in range(2, max_subset_size + 1):
+        is_last_level = size == max_subset_size
+        new_states = []  # type: List[Tuple[SubsetIndices, List[int], int]]
+        for subset, subset_sums, excluded in states:
+            for i in range(subset[-1] + 1, n):
+                if excluded >> i & 1:
+                    continue
+                new_subset = subset + (i, )
+                if limit is not None and len(subsets) == limit:
+                    return subsets, True
+                subsets.append(new_subset)
+                if is_last_level:
+                    continue
+                amount = amounts[i]
+                new_sums = list(subset_sums)
+                new_sums.append(amount)
+                new_excluded = excluded | indices_by_amount.get(-amount, 0)
+                for s in subset_sums:
+                    s += amount
+                    new_sums.append(s)
+                    new_excluded |= indices_by_amount.get(-s, 0)
+                new_states.append((new_subset, new_sums, new_excluded))
+        states = new_states
+    return subsets, False
@@ -0,0 +1,43 @@
+import itertools
+import random
+
+from .subset_sum import get_nonzero_subsets
+
+
+def _get_reference_nonzero_subsets(amounts, max_subset_size):
+    sum_to_zero = set()
+    results = []
+    for subset_size in range(2, min(len(amounts), max_subset_size) + 1):
+        for subset in itertools.combinations(range(len(amounts)), subset_size):
+            if sum(amounts[i] for i in subset) == 0:
+                sum_to_zero.add(subset)
+                continue
+            if any(
+                    subsubset in sum_to_zero
+                    for subsubset_size in range(2, subset_size)
+                    for subsubset in itertools.combinations(
+                        subset, subsubset_size)):
+                continue
+            results.append(subset)
+    return results
+
+
+def test_matches_reference():
+    rng = random.Random(0)
+    for _ in range(200):
+        n = rng.randrange(0, 12)
+        amounts = [rng.randrange(-5, 6) for _ in range(n)]
+        for max_subset_size in (2, 3, 4):
+            assert get_nonzero_subsets(amounts, max_subset_size) == (
+                _get_reference_nonzero_subsets(amounts, max_subset_size),
+                False)
+
+
+def test_limit():
+    amounts = [1, 2, -3, 4]
+    subsets, truncated = get_nonzero_subsets(amounts, 4)
+    assert not truncated
+    assert subsets == [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3),
+                       (0, 1, 3), (0, 2, 3), (1, 2, 3)]
+    assert get_nonzero_subsets(amounts, 4, limit=7) == (subsets[:7], True)
+    assert get_nonzero_subsets(amounts, 4, limit=9) == (subsets, False)
@@ -1,4 +1,4 @@
-from typing import List, Optional, Union, Tuple, Dict
+from typing import Any, Callable, List, Optional, Union, Tuple, Dict
 import json
 import re
 import os
@@ -10,6 +10,9 @@ import beancount.parser.parser
 import beancount.parser.printer
 from beancount.core.data import Directive, Entries, Posting, Transaction, Meta
 
+from . import reconcile
+from . import training
+
 
 def parse(text: str) -> Entries:
     entries, errors, options = beancount.parser.parser.parse_string(
@@ -44,6 +47,38 @@ def normalize_entry(entry: Union[Directive, Posting]) -> Directive:
     return entry
 
 
+def make_reconciler(directory: str,
+                    log_status: Callable[[str], Any] = print,
+                    **options) -> reconcile.Reconciler:
+    """Returns a reconciler for the `journal.beancount` and `ignore.beancount`
+    files in `directory`.
+
+    The `data_sources` must be specified in `options`, which also override the
+    default values of the other options.
+    """
+    journal_path = os.path.join(directory, 'journal.beancount')
+    reconciler_options = dict(
+        transaction_output_map=[],
+        price_output=None,
+        open_account_output_map=[],
+        default_output=journal_path,
+        balance_account_output_map=[],
+        fuzzy_match_days=5,
+        fuzzy_match_amount=0,
+        account_pattern=None,
+        ignore_account_for_classification_pattern=training.
+        DEFAULT_IGNORE_ACCOUNT_FOR_CLASSIFICATION_PATTERN,
+        classifier_cache=None,
+    )  # type: Dict[str, Any]
+    reconciler_options.update(options)
+    return reconcile.Reconciler(
+        journal_path=journal_path,
+        ignore_path=os.path.join(directory, 'ignore.beancount'),
+        log_status=log_status,
+        options=reconciler_options,
+    )
+
+
 def check_golden_contents(path: str,
                           expected_contents: str,
                           replacements: List[Tuple[str, str]] = [],
@@ -1,4 +1,5 @@
 import concurrent.futures
+import queue
 import threading
 
 class DaemonThreadExecutor(concurrent.futures.Executor):
@@ -23,3 +24,37 @@ class DaemonThreadExecutor(concurrent.futures.Executor):
 def call_in_new_thread(f, *args, **kwargs):
     executor = DaemonThreadExecutor()
     return executor.submit(f, *args, **kwargs)
+
+
+def map_in_daemon_threads(f, items, max_workers=1):
+    """Calls `f` on each of `items` in up to `max_workers` daemon threads.
+
+    The calls are started in the order of `items`.
+
+    :returns: A list containing a future for each item.
+    """
+    work = queue.Queue()  # type: queue.Queue
+    futures = []
+    for item in items:
+        future = concurrent.futures.Future()  # type: concurrent.futures.Future
+        work.put((item, future))
+        futures.append(future)
+
+    def worker():
+        while True:
+            try:
+                item, future = work.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(f(item))
+            except Exception as e:
+                future.set_exception(e)
+
+    for _ in range(min(max_workers, len(futures))):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+    return futures
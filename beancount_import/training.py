@@ -1,7 +1,7 @@
 import collections
 import datetime
 import re
-from typing import Callable, Any, Dict, Iterable, List, NamedTuple, Sequence, Union, Optional, Tuple
+from typing import Callable, Any, Dict, FrozenSet, Iterable, List, NamedTuple, Sequence, Union, Optional, Tuple
 
 from beancount.core.data import Directive, Entries, Transaction, Posting
 from beancount.core.amount import Amount
@@ -26,7 +26,7 @@ PredictionInput = NamedTuple('PredictionInput',
 
 
 def get_features(example: PredictionInput) -> Dict[str, bool]:
-    features = collections.defaultdict(lambda: False)  # type: Dict[str, bool]
+    features = collections.defaultdict(bool)  # type: Dict[str, bool]
     features['account:%s' % example.source_account] = True
 
     # For now, skip amount and date.
@@ -54,6 +54,27 @@ class TrainingExamples(object):
     def add(self, example: PredictionInput, target_account: str):
         self.training_examples.append((get_features(example), target_account))
 
+    def remove_examples(self, examples: 'TrainingExamples') -> None:
+        """Removes one occurrence of each of the specified examples."""
+        remaining = collections.Counter(
+            _get_training_example_key(x) for x in examples.training_examples)
+        if not remaining:
+            return
+        kept_examples = []
+        for example in self.training_examples:
+            key = _get_training_example_key(example)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+                continue
+            kept_examples.append(example)
+        self.training_examples = kept_examples
+
+
+def _get_training_example_key(
+        example: Tuple[Dict[str, bool], str]) -> Tuple[FrozenSet[str], str]:
+    features, target_account = example
+    return frozenset(k for k, v in features.items() if v), target_account
+
 
 class MockTrainingExamples(object):
     def __init__(self):
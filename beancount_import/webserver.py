@@ -7,6 +7,7 @@ import datetime
 import time
 import io
 import collections
+import functools
 import sys
 import logging
 import traceback
@@ -32,9 +33,11 @@ import watchdog.events
 import watchdog.observers
 
 from . import reconcile
+from . import auto_reconcile
 
 from . import training
 from . import matching
+from . import phase_timing
 from .source import Source, InvalidSourceReference
 
 
@@ -146,12 +149,15 @@ def json_encode_candidates(candidates: reconcile.Candidates):
     result['candidates'] = candidates.candidates
     result['date'] = candidates.date
     result['number'] = candidates.number
+    result['search_truncated'] = candidates.search_truncated
     return result
 
 
 def json_encode_candidate(obj: reconcile.Candidate):
     change_sets, _, _ = obj.staged_changes_with_unique_account_names.get_diff()
-    _, _, new_entries = obj.staged_changes.get_diff()
+    # The frontend only uses the properties and accounts of the new entries,
+    # which do not require the real changes to be formatted.
+    new_entries = obj.new_entries
     return dict(
         change_sets=change_sets,
         used_transaction_ids=obj.used_transaction_ids,
@@ -419,6 +425,17 @@ class GetFileHandler(tornado.web.RequestHandler):
             self.finish('File not found')
 
 
+class PhaseTimingHandler(tornado.web.RequestHandler):
+    def get(self):
+        loaded_future = self.application.reconciler.loaded_future
+        if not loaded_future.done():
+            self.set_status(404)
+            return self.finish('Not yet loaded.')
+        report = loaded_future.result().phase_timer.get_report()
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(report).encode())
+
+
 class JournalModificationHandler(watchdog.events.FileSystemEventHandler):
     def __init__(self, application):
         super(JournalModificationHandler, self).__init__()
@@ -450,6 +467,7 @@ class Application(tornado.web.Application):
             (r'/%s/select_candidate' % secret_key, SelectCandidateHandler),
             (r'/%s/skip' % secret_key, SkipHandler),
             (r'/%s/retrain' % secret_key, RetrainHandler),
+            (r'/%s/phase_timing' % secret_key, PhaseTimingHandler),
         ], **kwargs)
         self.socket_clients = set()
         self.watched_files = dict()
@@ -461,6 +479,11 @@ class Application(tornado.web.Application):
         self.log_status('Initializing')
 
         self.check_modification_observer = None
+        self.write_behind_delay = args.write_behind_delay
+        self.write_behind_max_delay = args.write_behind_max_delay
+        self.deferred_writes_timeout = None
+        self.deferred_writes_deadline = None
+        self.phase_timing_report = args.phase_timing_report
         self.reconciler = reconcile.Reconciler(
             journal_path=args.journal_input,
             ignore_path=args.ignored_journal,
@@ -486,6 +509,37 @@ class Application(tornado.web.Application):
                 except:
                     traceback.print_exc()
 
+    def _schedule_deferred_writes(self):
+        """Schedules `flush_deferred_writes` after `write_behind_delay` seconds,
+        replacing any previously scheduled call."""
+        now = self.ioloop.time()
+        if self.deferred_writes_timeout is not None:
+            self.ioloop.remove_timeout(self.deferred_writes_timeout)
+        elif self.write_behind_max_delay is not None:
+            self.deferred_writes_deadline = now + self.write_behind_max_delay
+        deadline = now + self.write_behind_delay
+        if self.deferred_writes_deadline is not None:
+            deadline = min(deadline, self.deferred_writes_deadline)
+        self.deferred_writes_timeout = self.ioloop.call_at(
+            deadline, self.flush_deferred_writes)
+
+    def flush_deferred_writes(self):
+        if self.deferred_writes_timeout is not None:
+            self.ioloop.remove_timeout(self.deferred_writes_timeout)
+        self.deferred_writes_timeout = None
+        self.deferred_writes_deadline = None
+        if not self.reconciler.loaded_future.done():
+            return
+        loaded_reconciler = self.reconciler.loaded_future.result()
+        try:
+            modified_filenames = loaded_reconciler.editor.flush_deferred_writes(
+            )
+        except:
+            traceback.print_exc()
+            return
+        loaded_reconciler.log_write_conflicts()
+        self._notify_modified_files(modified_filenames)
+
     def check_modification(self):
         if self.reconciler.loaded_future.done():
             loaded_reconciler = self.reconciler.loaded_future.result()
@@ -493,7 +547,7 @@ class Application(tornado.web.Application):
             )
             if modified_filenames:
                 self._notify_modified_files(list(modified_filenames))
-                self.reconciler.reload_journal()
+                self.reconciler.reload_journal(modified_filenames)
                 self.reset()
 
     def reset(self):
@@ -531,10 +585,44 @@ class Application(tornado.web.Application):
             self.current_invalid = loaded_reconciler.invalid_references
             self.start_check_modification_observer(loaded_reconciler)
             self.get_next_candidates(new_pending=True)
+            if not loaded_reconciler.sources_pending:
+                self._write_phase_timing_report(loaded_reconciler)
+            for source_future in loaded_reconciler.source_futures:
+                self.ioloop.add_future(
+                    source_future,
+                    functools.partial(self._handle_source_prepared,
+                                      loaded_reconciler))
         except:
             traceback.print_exc()
             pdb.post_mortem()
 
+    def _handle_source_prepared(self, loaded_reconciler, source_future):
+        try:
+            if (not self.reconciler.loaded_future.done() or
+                    self.reconciler.loaded_future.result() is
+                    not loaded_reconciler):
+                return
+            if not loaded_reconciler.publish_prepared_sources():
+                return
+            generation = self.next_generation()
+            self.set_state(
+                errors=(generation, len(loaded_reconciler.errors)),
+                invalid=(generation,
+                         len(loaded_reconciler.invalid_references)))
+            self.current_errors = loaded_reconciler.errors
+            self.current_invalid = loaded_reconciler.invalid_references
+            self.get_next_candidates(new_pending=True)
+            if not loaded_reconciler.sources_pending:
+                self._write_phase_timing_report(loaded_reconciler)
+        except:
+            traceback.print_exc()
+            pdb.post_mortem()
+
+    def _write_phase_timing_report(self, loaded_reconciler):
+        path = self.phase_timing_report
+        if path is not None:
+            phase_timing.write_report(loaded_reconciler.phase_timer, path)
+
     def start_check_modification_observer(self, loaded_reconciler):
         if self.check_modification_observer is not None:
             self.check_modification_observer.unschedule_all()
@@ -556,6 +644,8 @@ class Application(tornado.web.Application):
             self.skip_ids)
         end_time = time.time()
         print('Got next candidates in %.4f seconds' % (end_time - start_time))
+        if loaded_reconciler.last_match_metrics is not None:
+            print('Matching metrics: %s' % loaded_reconciler.last_match_metrics)
         generation = self.next_generation()
         kwargs = dict()
         if new_pending:
@@ -636,7 +726,10 @@ class Application(tornado.web.Application):
                         candidate,
                         ignore=ignore,
                     )
-                    self._notify_modified_files(result.modified_filenames)
+                    if self.write_behind_delay is not None:
+                        self._schedule_deferred_writes()
+                    else:
+                        self._notify_modified_files(result.modified_filenames)
                     self.get_next_candidates(new_pending=True)
                     return result.new_entries
         except:
@@ -738,6 +831,111 @@ def parse_arguments(argv, **kwargs):
         help=
         'Maximum amount by which the weights of two matching entries may differ.'
     )
+    argparser.add_argument(
+        '--max_aggregate_posting_candidates',
+        type=int,
+        default=None,
+        help=
+        'Maximum number of aggregate posting candidates to consider per transaction.  If not specified, there is no limit.'
+    )
+    argparser.add_argument(
+        '--max_match_search_nodes',
+        type=int,
+        default=None,
+        help=
+        'Maximum number of match sets to explore when merging two transactions.  If specified, the most promising match sets are explored first.'
+    )
+    argparser.add_argument(
+        '--match_search_timeout',
+        type=float,
+        default=None,
+        help=
+        'Maximum number of seconds to spend searching for matches for a single pending entry.'
+    )
+    argparser.add_argument(
+        '--match_processes',
+        type=int,
+        default=None,
+        help=
+        'Number of worker processes used to search for matches.  If not specified, matches are searched for in the server process.'
+    )
+    argparser.add_argument(
+        '--match_metrics',
+        action='store_true',
+        help='Print counts and timings of the work done to search for matches.'
+    )
+    argparser.add_argument(
+        '--phase_timing_report',
+        type=str,
+        default=None,
+        help='File to which a JSON report of the wall time, CPU time and peak '
+        'memory increase of each phase of loading the journal and data '
+        'sources is written once loading completes.  Specify "-" to print the '
+        'report.  The report is also available from the "phase_timing" '
+        'endpoint of the web server.')
+    argparser.add_argument(
+        '--full_journal_reload',
+        action='store_true',
+        help='Reload the entire journal when it is modified, rather than only '
+        'the modified files.')
+    argparser.add_argument(
+        '--prepare_threads',
+        type=int,
+        help='Number of threads in which to prepare the data sources '
+        'concurrently.  By default, they are prepared one at a time.')
+    argparser.add_argument(
+        '--stream_pending',
+        action='store_true',
+        help='Show the journal and the pending entries of each data source as '
+        'soon as they are available, rather than waiting for all data sources '
+        'to be prepared.')
+    argparser.add_argument(
+        '--auto_reconcile',
+        action='store_true',
+        help='Rather than starting the web server, accept the candidates for '
+        'which the choice is clear, write the journal once, and exit.  The '
+        'remaining pending entries are left for interactive review.')
+    argparser.add_argument(
+        '--auto_reconcile_min_confidence',
+        type=float,
+        help='With --auto_reconcile, also accept candidates whose unknown '
+        'accounts were all predicted with at least this probability, between '
+        '0 and 1.  By default, only unique matches without unknown accounts '
+        'are accepted.')
+    argparser.add_argument(
+        '--auto_reconcile_fuzzy_matches',
+        action='store_true',
+        help='With --auto_reconcile, also accept unique matches whose dates or '
+        'amounts differ within --fuzzy_match_days and --fuzzy_match_amount.  '
+        'By default, only exact matches are accepted.')
+    argparser.add_argument(
+        '--write_behind_delay',
+        type=float,
+        help='Rather than rewriting the journal files after each accepted '
+        'candidate, record the changes in a log next to the journal and write '
+        'them once no candidate has been accepted for this many seconds.  '
+        'Changes still in the log when the program exits are written the next '
+        'time the journal is loaded.')
+    argparser.add_argument(
+        '--write_behind_max_delay',
+        type=float,
+        help='With --write_behind_delay, write the changes at most this many '
+        'seconds after the first unwritten change, even if candidates continue '
+        'to be accepted.')
+    argparser.add_argument(
+        '--prefetch_candidates',
+        type=int,
+        help='Number of pending entries following the current one for which to '
+        'search for matches in the background, so that their candidates are '
+        'displayed without delay.  The results are discarded if the journal or '
+        'the pending entries change in a way that may affect them.')
+    argparser.add_argument(
+        '--state_snapshot',
+        type=str,
+        help='File in which to save the loaded journal, data source and '
+        'matching state.  If the journal and data source files, and the '
+        'relevant options, are unchanged when the program is next started, '
+        'the state is loaded from this file rather than computed again.')
     argparser.add_argument(
         '--classifier_cache',
         type=str,
@@ -755,6 +953,10 @@ def main(argv, **kwargs):
         logging_args['filename'] = args.log_output
     logging.basicConfig(**logging_args)
 
+    if args.auto_reconcile:
+        auto_reconcile.run(args)
+        return
+
     init_tornado_asyncio()
 
     ioloop = tornado.ioloop.IOLoop.instance()